@@ -0,0 +1,767 @@
+'''
+Benchmarks for the hot paths of the threemf package.
+
+Every case is run in a fresh child process so that the peak RSS of one case
+does not hide the next. For each case and mesh size the wall time (best of
+--repeat runs), the peak RSS of the child process and the peak of the memory
+traced by tracemalloc during one run are recorded.
+
+Results are written as JSON, so two commits can be compared:
+
+    python benchmarks/bench.py --output base.json
+    git checkout my-branch
+    python benchmarks/bench.py --output new.json --compare base.json
+'''
+
+import argparse
+import asyncio
+import datetime
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as xml
+import zipfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import threemf
+
+CASES = {}
+
+def case(name):
+    '''
+    Registers a benchmark case. The decorated function receives the number
+    of triangles, does any setup and returns the function to be timed. If the
+    timed function returns a dict, its items are recorded as extra results.
+    '''
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+_TEMP_DIRS = []
+
+def temp_dir() -> str:
+    '''
+    Returns a temporary directory that is removed when the case is done
+    '''
+    directory = tempfile.mkdtemp(prefix='threemf-bench-')
+    _TEMP_DIRS.append(directory)
+    return directory
+
+def tiled_cubes(ntris : int) -> threemf.mesh.Mesh:
+    '''
+    Returns a mesh of about ntris triangles made of a grid of unit cubes
+    from geom.Cube, without any shared vertices between the cubes
+    '''
+    cube = threemf.mesh.Mesh.FromSTL(threemf.geom.Cube(1., 1., 1.).stl_mesh())
+    cube.weld()
+
+    ncubes = max(1, ntris // len(cube.triangle_array))
+    side = int(np.ceil(ncubes ** (1. / 3.)))
+
+    offsets = 2. * np.stack(np.unravel_index(np.arange(ncubes), (side, side, side)), axis=1)
+
+    nverts = len(cube.vertex_array)
+
+    vertices = (cube.vertex_array[np.newaxis] + offsets[:, np.newaxis]).reshape(-1, 3)
+    triangles = (cube.triangle_array[np.newaxis] + nverts * np.arange(ncubes)[:, np.newaxis, np.newaxis]).reshape(-1, 3)
+
+    return threemf.mesh.Mesh(vertices, triangles)
+
+def uv_sphere(ntris : int) -> threemf.mesh.Mesh:
+    '''
+    Returns a closed unit sphere of about ntris triangles, with as many
+    rings as segments around the poles
+    '''
+    side = max(3, int(np.sqrt(ntris / 2.)))
+
+    u = np.linspace(0., np.pi, side + 2)[1:-1, np.newaxis]
+    v = np.linspace(0., 2. * np.pi, side, endpoint=False)
+
+    vertices = np.stack((
+        np.sin(u) * np.cos(v),
+        np.sin(u) * np.sin(v),
+        np.cos(u) * np.ones_like(v)
+    ), axis=-1).reshape(-1, 3)
+    vertices = np.concatenate((vertices, [(0., 0., 1.), (0., 0., -1.)]))
+
+    top, bottom = len(vertices) - 2, len(vertices) - 1
+    idx = np.arange(side * side).reshape(side, side)
+    a, b = idx[:-1], np.roll(idx[:-1], -1, axis=1)
+    c, d = idx[1:], np.roll(idx[1:], -1, axis=1)
+
+    triangles = np.concatenate((
+        np.stack((a, c, b), axis=-1).reshape(-1, 3),
+        np.stack((b, c, d), axis=-1).reshape(-1, 3),
+        np.stack((np.full(side, top), idx[0], np.roll(idx[0], -1)), axis=-1),
+        np.stack((np.full(side, bottom), np.roll(idx[-1], -1), idx[-1]), axis=-1)
+    ))
+
+    return threemf.mesh.Mesh(vertices.astype(np.float32), triangles.astype(np.int32))
+
+def make_threemf(ntris : int, nobjects : int = 4) -> threemf.ThreeMF:
+    tmf = threemf.ThreeMF()
+
+    mdl = tmf.default_model
+
+    for i in range(nobjects):
+        obj = threemf.model.ObjectModel(i + 1)
+        obj.mesh = tiled_cubes(ntris // nobjects)
+        obj.add_meta_data_cura('infill_sparse_density', 20)
+        mdl.objects.append(obj)
+        mdl.build.add_item(obj)
+
+    return tmf
+
+def scanned_threemf(ntris : int) -> threemf.ThreeMF:
+    '''
+    Returns a model that compresses like a real one: the vertices carry
+    full float64 noise as in scanned or CAD-tessellated meshes, and a Cura
+    extension holds a settings file and a PNG thumbnail
+    '''
+    tmf = make_threemf(ntris)
+
+    rng = np.random.default_rng(0)
+    for obj in tmf.default_model.objects:
+        obj.mesh.vertex_array += rng.normal(scale=1e-3, size=obj.mesh.vertex_array.shape)
+
+    cura = threemf.extension.Cura()
+
+    settings = cura.make_asset('plate.cfg')
+    settings.content = '\n'.join('setting_{} = {}'.format(i, i % 7) for i in range(2000))
+
+    thumbnail = cura.make_asset('thumbnail.png')
+    thumbnail.content = b'\x89PNG' + rng.bytes(256 * 1024)
+
+    cura.assets.extend([settings, thumbnail])
+    tmf.extensions.append(cura)
+
+    return tmf
+
+def threemf_bytes(ntris : int, binary_mesh : bool = False) -> bytes:
+    with io.BytesIO() as f:
+        threemf.io.Writer(binary_mesh=binary_mesh).write(make_threemf(ntris), f)
+        return f.getvalue()
+
+@case('write')
+def write_case(ntris):
+    tmf = make_threemf(ntris)
+
+    def run():
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(tmf, f)
+
+    return run
+
+def _compression_case(compression):
+    def setup(ntris):
+        tmf = scanned_threemf(ntris)
+
+        def run():
+            with io.BytesIO() as f:
+                threemf.io.Writer(compression=compression).write(tmf, f)
+                return {'size_mb': f.tell() / 2 ** 20}
+
+        return run
+
+    return setup
+
+for _name, _compression in (
+        ('stored', threemf.io.Compression(core=(zipfile.ZIP_STORED, None), assets=(zipfile.ZIP_STORED, None))),
+        ('default', threemf.io.Compression()),
+        ('fast', threemf.io.Compression.FAST),
+        ('small', threemf.io.Compression.SMALL)):
+    case('write_compression_' + _name)(_compression_case(_compression))
+
+def _resave_case(lazy, edit):
+    def setup(ntris):
+        data = threemf_bytes(ntris)
+
+        def run():
+            tmf = threemf.ThreeMF()
+            threemf.io.Reader(lazy=lazy).read(tmf, io.BytesIO(data))
+
+            if edit:
+                tmf.default_model.objects[0].add_meta_data('edited', 1)
+
+            with io.BytesIO() as f:
+                threemf.io.Writer().write(tmf, f)
+
+        return run
+
+    return setup
+
+# Read a 3MF and write it back, unchanged or after a metadata edit
+case('resave')(_resave_case(False, False))
+case('resave_metadata_edit')(_resave_case(False, True))
+case('resave_lazy_metadata_edit')(_resave_case(True, True))
+
+@case('extension_round_trip')
+def extension_round_trip_case(ntris):
+    # A small model with a large G-code asset, read and written back
+    # without touching the asset
+    tmf = make_threemf(1000)
+
+    cura = threemf.extension.Cura()
+    gcode = cura.make_asset('plate.gcode')
+    gcode.content = ''.join('G1 X{:.3f} Y{:.3f} E{:.5f}\n'.format(i * .1, i * .2, i * 1e-3) for i in range(ntris))
+    cura.assets.append(gcode)
+    tmf.extensions.append(cura)
+
+    with io.BytesIO() as f:
+        threemf.io.Writer().write(tmf, f)
+        data = f.getvalue()
+
+    def run():
+        reader = threemf.io.Reader()
+        reader.register_extension(threemf.extension.Cura)
+
+        tmf = threemf.ThreeMF()
+        reader.read(tmf, io.BytesIO(data))
+
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(tmf, f)
+
+    return run
+
+@case('stream_write')
+def stream_write_case(ntris):
+    nobjects = 16
+
+    def run():
+        # Each object is generated, written and dropped in turn, so peak
+        # memory follows one object instead of the whole model
+        with io.BytesIO() as f:
+            with threemf.io.StreamWriter(f) as w:
+                for _ in range(nobjects):
+                    obj = w.object_from_mesh(tiled_cubes(ntris // nobjects))
+                    w.add_build_item(obj)
+
+    return run
+
+@case('read')
+def read_case(ntris):
+    data = threemf_bytes(ntris)
+
+    def run():
+        threemf.io.Reader().read(threemf.ThreeMF(), io.BytesIO(data))
+
+    return run
+
+@case('aio_read')
+def aio_read_case(ntris):
+    # Four files of ntris triangles read at once, while a ticker measures how
+    # late the event loop runs it
+    data = threemf_bytes(ntris)
+
+    async def read_all():
+        lags = [0.]
+
+        async def ticker(done):
+            loop = asyncio.get_running_loop()
+            while not done.is_set():
+                start = loop.time()
+                await asyncio.sleep(0.001)
+                lags.append(loop.time() - start - 0.001)
+
+        done = asyncio.Event()
+        tick = asyncio.ensure_future(ticker(done))
+
+        async with threemf.aio.AsyncReader(max_concurrency=4) as reader:
+            await asyncio.gather(*(reader.read(threemf.ThreeMF(), data) for _ in range(4)))
+
+        done.set()
+        await tick
+
+        return {'max_loop_lag_ms': 1000. * max(lags)}
+
+    def run():
+        return asyncio.run(read_all())
+
+    return run
+
+@case('read_backends')
+def read_backends_case(ntris):
+    # The model part of a 3MF file parsed with every available XML backend,
+    # each time recorded as an extra result
+    with zipfile.ZipFile(io.BytesIO(threemf_bytes(ntris))) as z:
+        part = z.read(threemf.ThreeMF._THREED_MODEL_PATH)
+
+    def run():
+        times = {}
+
+        for name in threemf.xmlparse.available_backends():
+            iterparse = threemf.xmlparse.get_backend(name).iterparse
+
+            start = time.perf_counter()
+            mdl = threemf.model.Model(threemf.ThreeMF._THREED_MODEL_PATH)
+            mdl.deserialize_events(iterparse(io.BytesIO(part), events=('start', 'end')))
+            times[name + '_s'] = time.perf_counter() - start
+
+        return times
+
+    return run
+
+@case('read_lazy')
+def read_lazy_case(ntris):
+    data = threemf_bytes(ntris)
+
+    def run():
+        threemf.io.Reader(lazy=True).read(threemf.ThreeMF(), io.BytesIO(data))
+
+    return run
+
+@case('read_cached')
+def read_cached_case(ntris):
+    data = threemf_bytes(ntris)
+    cache = threemf.cache.ParseCache(temp_dir())
+
+    # Prime the cache so the timed reads are all hits
+    threemf.io.Reader(cache=cache).read(threemf.ThreeMF(), io.BytesIO(data))
+
+    def run():
+        threemf.io.Reader(cache=cache).read(threemf.ThreeMF(), io.BytesIO(data))
+
+    return run
+
+@case('read_binary')
+def read_binary_case(ntris):
+    # Read from a file on disk, so the sidecar meshes are memory-mapped
+    path = os.path.join(temp_dir(), 'binary.3mf')
+    with open(path, 'wb') as f:
+        f.write(threemf_bytes(ntris, binary_mesh=True))
+
+    def run():
+        with open(path, 'rb') as f:
+            threemf.io.Reader().read(threemf.ThreeMF(), f)
+
+    return run
+
+@case('deserialize')
+def deserialize_case(ntris):
+    with io.BytesIO() as f:
+        make_threemf(ntris).default_model.write(f)
+        root = xml.fromstring(f.getvalue())
+
+    for el in root.iter():
+        el.tag = el.tag.partition('}')[2] or el.tag
+
+    def run():
+        threemf.model.Model('3D/3dmodel.model').deserialize(root)
+
+    return run
+
+@case('mesh_add')
+def mesh_add_case(ntris):
+    mesh1 = tiled_cubes(ntris // 2)
+    mesh2 = mesh1.transform(np.identity(4), inplace=False)
+
+    # Shift the second mesh so that its first layer of cubes touches the
+    # last layer of the first, and the vertices of those faces merge
+    x = mesh1.vertex_array[:, 0]
+    mesh2.vertex_array[:, 0] += x.max() - x.min()
+
+    merged = mesh1 + mesh2
+    assert len(merged.vertex_array) < len(mesh1.vertex_array) + len(mesh2.vertex_array)
+
+    def run():
+        mesh1 + mesh2
+
+    return run
+
+@case('from_stl')
+def from_stl_case(ntris):
+    stl_mesh = tiled_cubes(ntris).to_stl()
+
+    def run():
+        threemf.mesh.Mesh.FromSTL(stl_mesh)
+
+    return run
+
+# Number of queries of the BVH query cases
+_BVH_QUERIES = 10000
+
+@case('bvh_build')
+def bvh_build_case(ntris):
+    mesh = tiled_cubes(ntris)
+
+    def run():
+        threemf.bvh.BVH(mesh.vertex_array, mesh.triangle_array)
+
+    return run
+
+@case('bvh_rays')
+def bvh_rays_case(ntris):
+    mesh = tiled_cubes(ntris)
+    bvh = mesh.bvh
+
+    lo, hi = mesh._bounds()
+    rng = np.random.default_rng(0)
+    origins = rng.uniform(lo, hi, size=(_BVH_QUERIES, 3))
+    directions = rng.normal(size=(_BVH_QUERIES, 3))
+
+    def run():
+        bvh.intersect_rays(origins, directions)
+
+    return run
+
+@case('bvh_closest_points')
+def bvh_closest_points_case(ntris):
+    mesh = tiled_cubes(ntris)
+    bvh = mesh.bvh
+
+    lo, hi = mesh._bounds()
+    points = np.random.default_rng(0).uniform(lo - 1., hi + 1., size=(_BVH_QUERIES, 3))
+
+    def run():
+        bvh.closest_points(points)
+
+    return run
+
+@case('mesh_geometry')
+def mesh_geometry_case(ntris):
+    mesh = tiled_cubes(ntris)
+
+    def run():
+        mesh.face_normals()
+        mesh.vertex_normals()
+        mesh.area()
+        mesh.volume()
+
+    return run
+
+@case('mesh_edges')
+def mesh_edges_case(ntris):
+    mesh = tiled_cubes(ntris)
+
+    def run():
+        mesh.is_watertight()
+        mesh.is_winding_consistent()
+
+    return run
+
+@case('mesh_decimate')
+def mesh_decimate_case(ntris):
+    mesh = uv_sphere(ntris)
+
+    def run():
+        simple = mesh.decimate(len(mesh.triangle_array) // 10)
+
+        return {
+            'output_triangles': len(simple.triangle_array),
+            'max_radius_error': float(np.abs(np.linalg.norm(simple.vertex_array, axis=1) - 1.).max())
+        }
+
+    return run
+
+@case('scene_world_mesh')
+def scene_world_mesh_case(ntris):
+    # A plate of 16 build items, each an assembly of 4 instances of one part,
+    # with ntris triangles in total
+    mdl = threemf.model.Model(threemf.ThreeMF._THREED_MODEL_PATH)
+
+    part = threemf.model.ObjectModel(1)
+    part.mesh = tiled_cubes(max(12, ntris // 64))
+    mdl.objects.append(part)
+
+    assembly = threemf.model.ObjectModel(2)
+    for i in range(4):
+        T = np.identity(4)
+        T[:3, 3] = (0., 0., 100. * i)
+        assembly.add_component(part, T)
+    mdl.objects.append(assembly)
+
+    for i in range(16):
+        T = np.identity(4)
+        T[:3, 3] = (100. * i, 0., 0.)
+        mdl.build.add_item(assembly, T)
+
+    def run():
+        threemf.scene.Scene(mdl).mesh()
+
+    return run
+
+_LOOKUP_OBJECTS = 10000
+_LOOKUP_METADATA = 30
+
+@case('object_lookup')
+def object_lookup_case(ntris):
+    # A plate of 10k objects with Cura metadata, whatever the mesh size.
+    # Resolves every build item and reads every metadata entry by name.
+    mdl = threemf.model.Model(threemf.ThreeMF._THREED_MODEL_PATH)
+
+    for i in range(1, _LOOKUP_OBJECTS + 1):
+        obj = threemf.model.ObjectModel(i)
+        for j in range(_LOOKUP_METADATA):
+            obj.add_meta_data_cura('setting_{}'.format(j), str(j))
+        mdl.objects.append(obj)
+        mdl.build.add_item(obj)
+
+    names = ['cura:setting_{}'.format(j) for j in range(_LOOKUP_METADATA)]
+
+    def run():
+        for item in mdl.build.items:
+            obj = mdl.get_object(item.objectid)
+            for name in names:
+                if obj.has_meta_data(name):
+                    obj.get_meta_data(name)
+
+    return run
+
+_TRANSFORM_COMPONENTS = 50000
+
+@case('transform_round_trip')
+def transform_round_trip_case(ntris):
+    # An assembly of 50k placed components plus a build item per component,
+    # whatever the mesh size. Writes the model XML and parses it again.
+    mdl = threemf.model.Model(threemf.ThreeMF._THREED_MODEL_PATH)
+
+    part = threemf.model.ObjectModel(1)
+    part.mesh = tiled_cubes(12)
+    mdl.objects.append(part)
+
+    rng = np.random.default_rng(0)
+    transforms = np.tile(np.identity(4), (_TRANSFORM_COMPONENTS, 1, 1))
+    transforms[:, :3, 3] = rng.uniform(0., 200., size=(_TRANSFORM_COMPONENTS, 3)).round(3)
+
+    assembly = threemf.model.ObjectModel(2)
+    for T in transforms:
+        assembly.add_component(part, T)
+        mdl.build.add_item(part, T)
+    mdl.objects.append(assembly)
+
+    def run():
+        with io.BytesIO() as f:
+            mdl.write(f)
+            f.seek(0)
+            threemf.model.Model(mdl.path).deserialize_events(xml.iterparse(f, events=('start', 'end')))
+
+    return run
+
+_MEMORY_COUNT = 10000
+
+def _bytes_per_instance(create) -> float:
+    '''
+    Returns the memory traced by tracemalloc per object created by
+    create(), averaged over _MEMORY_COUNT objects
+    '''
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+
+    try:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [create(i) for i in range(_MEMORY_COUNT)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    # Do not count the list holding them
+    return (after - before - sys.getsizeof(objects)) / len(objects)
+
+@case('model_memory')
+def model_memory_case(ntris):
+    # Memory of the small model classes, whatever the mesh size
+    def run():
+        return {
+            'build_item_b': round(_bytes_per_instance(lambda i: threemf.model.BuildItem(i))),
+            'component_b': round(_bytes_per_instance(lambda i: threemf.model.Component(i, None))),
+            'metadata_b': round(_bytes_per_instance(lambda i: threemf.model.Metadata('cura:setting', i))),
+            'object_b': round(_bytes_per_instance(lambda i: threemf.model.ObjectModel(i))),
+            'vertex_b': round(_bytes_per_instance(lambda i: threemf.mesh.Vertex(i, 0., 0.))),
+        }
+
+    return run
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1. if sys.platform == 'darwin' else 1024.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+def measure(name : str, ntris : int, repeat : int = 3, trace_allocations : bool = True) -> dict:
+    '''
+    Runs a single case in the current process and returns its results
+    '''
+    try:
+        return _measure(name, ntris, repeat, trace_allocations)
+    finally:
+        while _TEMP_DIRS:
+            shutil.rmtree(_TEMP_DIRS.pop(), ignore_errors=True)
+
+def _measure(name, ntris, repeat, trace_allocations):
+    run = CASES[name](ntris)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        extra = run()
+        times.append(time.perf_counter() - start)
+
+    result = {
+        'case': name,
+        'triangles': ntris,
+        'wall_s': min(times),
+        'peak_rss_mb': _peak_rss_mb()
+    }
+
+    if isinstance(extra, dict):
+        result.update(extra)
+
+    if trace_allocations:
+        gc.collect()
+        tracemalloc.start()
+        run()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result['alloc_peak_mb'] = peak / 2 ** 20
+        result['alloc_retained_mb'] = current / 2 ** 20
+
+    return result
+
+_STANDARD_KEYS = ('case', 'triangles', 'wall_s', 'peak_rss_mb', 'alloc_peak_mb', 'alloc_retained_mb')
+
+def _measure_in_child(conn, *args):
+    try:
+        conn.send(measure(*args))
+    except BaseException as e:
+        conn.send({'case': args[0], 'triangles': args[1], 'error': repr(e)})
+    finally:
+        conn.close()
+
+def measure_isolated(*args) -> dict:
+    '''
+    Runs measure() in a child process
+    '''
+    ctx = multiprocessing.get_context('spawn')
+    recv, send = ctx.Pipe(duplex=False)
+
+    proc = ctx.Process(target=_measure_in_child, args=(send,) + args)
+    proc.start()
+    send.close()
+
+    try:
+        result = recv.recv()
+    except EOFError:
+        result = {'case': args[0], 'triangles': args[1], 'error': 'exit code {}'.format(proc.exitcode)}
+
+    proc.join()
+
+    return result
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'threemf': threemf.__version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+
+def compare(results : list, baseline : dict, threshold : float) -> bool:
+    '''
+    Prints the ratio of every result to the matching baseline result and
+    returns False if any wall time ratio exceeds threshold
+    '''
+    base = {(r['case'], r['triangles']): r for r in baseline['results'] if 'error' not in r}
+
+    ok = True
+
+    print('\n{:<24} {:>12} {:>10} {:>10}'.format('case', 'triangles', 'time', 'rss'))
+
+    for r in results:
+        b = base.get((r['case'], r['triangles']))
+        if b is None or 'error' in r:
+            continue
+
+        time_ratio = r['wall_s'] / b['wall_s'] if b['wall_s'] > 0 else float('inf')
+        rss_ratio = r['peak_rss_mb'] / b['peak_rss_mb']
+
+        flag = ''
+        if time_ratio > threshold:
+            flag = '  REGRESSION'
+            ok = False
+
+        print('{:<24} {:>12} {:>9.2f}x {:>9.2f}x{}'.format(r['case'], r['triangles'], time_ratio, rss_ratio, flag))
+
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cases', nargs='*', help='cases to run (default: all): ' + ', '.join(sorted(CASES)))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+        help='mesh sizes in triangles (default: 10k 100k 1M)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case, the best is kept')
+    parser.add_argument('--no-alloc', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+        help='wall time ratio above which a case counts as a regression (default: 1.2)')
+
+    args = parser.parse_args(argv)
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: ' + ', '.join(sorted(unknown)))
+
+    results = []
+
+    print('{:<24} {:>12} {:>10} {:>10} {:>12}'.format('case', 'triangles', 'time (s)', 'rss (MB)', 'alloc (MB)'))
+
+    for name in args.cases or sorted(CASES):
+        for ntris in args.sizes:
+            r = measure_isolated(name, ntris, args.repeat, not args.no_alloc)
+            results.append(r)
+
+            if 'error' in r:
+                print('{:<24} {:>12} failed: {}'.format(name, ntris, r['error']))
+            else:
+                extra = {k: v for k, v in r.items() if k not in _STANDARD_KEYS}
+
+                print('{:<24} {:>12} {:>10.4f} {:>10.1f} {:>12} {}'.format(
+                    name, ntris, r['wall_s'], r['peak_rss_mb'],
+                    '{:.1f}'.format(r['alloc_peak_mb']) if 'alloc_peak_mb' in r else '-',
+                    '  '.join('{}={:.4g}'.format(k, v) for k, v in sorted(extra.items()))
+                ).rstrip())
+
+    report = {'meta': metadata(), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if not compare(results, json.load(f), args.threshold):
+                return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,8 @@
 import os
 import setuptools
 
-from distutils.util import convert_path
-
 version_ns = {}
-version_path = convert_path('threemf/_version.py')
+version_path = os.path.join('threemf', '_version.py')
 with open(version_path) as version_file:
     exec(version_file.read(), version_ns)
 
@@ -21,6 +19,10 @@ setuptools.setup(
     author='Teton Simulation',
     author_email='info@tetonsim.com',
     packages=setuptools.find_packages(),
+    python_requires='>=3.8',
     install_requires=['numpy', 'numpy-stl'],
+    entry_points={
+        'console_scripts': ['threemf = threemf.cli:main']
+    },
     license='LGPLv3'
 )
@@ -0,0 +1,204 @@
+import asyncio
+import io
+import threading
+import time
+import unittest
+
+import numpy as np
+import threemf
+
+def make_3mf() -> bytes:
+    tmf = threemf.ThreeMF()
+
+    obj = tmf.default_model.object_from_stl(threemf.geom.Cube(1., 2., 3.).stl_mesh())
+    obj.mesh.weld()
+    tmf.default_model.build.add_item(obj)
+
+    with io.BytesIO() as f:
+        threemf.io.Writer().write(tmf, f)
+        return f.getvalue()
+
+class ChunkSink:
+    '''
+    An output stream with a write coroutine
+    '''
+    def __init__(self):
+        self.chunks = []
+
+    async def write(self, data):
+        await asyncio.sleep(0)
+        self.chunks.append(bytes(data))
+
+class ThreadRecordingFile:
+    '''
+    A spooled file that records the names of the threads its method named
+    recorded is called in
+    '''
+    def __init__(self, f, threads, recorded):
+        self.f = f
+        self.threads = threads
+        self.recorded = recorded
+
+    def _call(self, name, *args):
+        if name == self.recorded:
+            self.threads.add(threading.current_thread().name)
+        return getattr(self.f, name)(*args)
+
+    def write(self, data):
+        return self._call('write', data)
+
+    def read(self, *args):
+        return self._call('read', *args)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
+
+class TrackingReader(threemf.io.Reader):
+    '''
+    A reader that records how many reads run at once and whether a read was
+    stopped by cancellation
+    '''
+    def __init__(self, delay=0.05):
+        super().__init__()
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.started = threading.Event()
+        self.stopped = False
+
+    def read(self, tmf, tmffile):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.started.set()
+
+        try:
+            deadline = time.monotonic() + self.delay
+            while time.monotonic() < deadline:
+                tmffile.seek(0)
+                time.sleep(0.001)
+            super().read(tmf, tmffile)
+        except Exception:
+            self.stopped = True
+            raise
+        finally:
+            with self.lock:
+                self.running -= 1
+
+class AsyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.data = make_3mf()
+
+        self.expected = threemf.ThreeMF()
+        threemf.io.Reader().read(self.expected, io.BytesIO(self.data))
+
+    def assertSameModel(self, tmf):
+        np.testing.assert_array_equal(
+            tmf.default_model.objects[0].mesh.vertex_array,
+            self.expected.default_model.objects[0].mesh.vertex_array
+        )
+        np.testing.assert_array_equal(
+            tmf.default_model.objects[0].mesh.triangle_array,
+            self.expected.default_model.objects[0].mesh.triangle_array
+        )
+
+    async def test_read_streams(self):
+        async def chunks():
+            for i in range(0, len(self.data), 100):
+                yield self.data[i:i + 100]
+
+        stream = asyncio.StreamReader()
+        stream.feed_data(self.data)
+        stream.feed_eof()
+
+        async with threemf.aio.AsyncReader(spool_size=256) as reader:
+            for source in (self.data, stream, chunks()):
+                tmf = threemf.ThreeMF()
+                await reader.read(tmf, source)
+                self.assertSameModel(tmf)
+
+            with self.assertRaises(TypeError):
+                await reader.read(threemf.ThreeMF(), 'not bytes')
+
+        with self.assertRaises(threemf.ThreeMFException):
+            threemf.aio.AsyncReader(threemf.io.Reader(lazy=True))
+
+    async def test_round_trip(self):
+        async with threemf.aio.AsyncReader() as reader, threemf.aio.AsyncWriter() as writer:
+            tmf = threemf.ThreeMF()
+            await reader.read(tmf, self.data)
+
+            # The received data is gone, so the unchanged model is written
+            # again instead of copied from it
+            sink = ChunkSink()
+            await writer.write(tmf, sink)
+
+            written = threemf.ThreeMF()
+            await reader.read(written, b''.join(sink.chunks))
+            self.assertSameModel(written)
+
+    async def test_spool_io_off_the_loop(self):
+        receive, send = set(), set()
+
+        reader = threemf.aio.AsyncReader()
+        writer = threemf.aio.AsyncWriter()
+
+        spool = reader._spool
+        # The io.Reader reads and the io.Writer writes the spooled file in
+        # the executor, receiving writes and sending reads it
+        reader._spool = lambda: ThreadRecordingFile(spool(), receive, 'write')
+
+        async with reader, writer:
+            stream = asyncio.StreamReader()
+            stream.feed_data(self.data)
+            stream.feed_eof()
+
+            tmf = threemf.ThreeMF()
+            await reader.read(tmf, stream)
+
+            writer._spool = lambda: ThreadRecordingFile(spool(), send, 'read')
+            sink = ChunkSink()
+            await writer.write(tmf, sink)
+
+        for threads in (receive, send):
+            self.assertTrue(threads)
+            self.assertTrue(all(name.startswith(threemf.aio._IO_THREAD_NAME) for name in threads), threads)
+
+    async def test_concurrency_limit(self):
+        tracking = TrackingReader()
+
+        async with threemf.aio.AsyncReader(tracking, max_concurrency=2) as reader:
+            results = [threemf.ThreeMF() for _ in range(6)]
+            await asyncio.gather(*(reader.read(tmf, self.data) for tmf in results))
+
+        self.assertEqual(tracking.peak, 2)
+        for tmf in results:
+            self.assertSameModel(tmf)
+
+    async def test_cancel(self):
+        tracking = TrackingReader(delay=60.)
+
+        async with threemf.aio.AsyncReader(tracking, max_concurrency=1) as reader:
+            task = asyncio.ensure_future(reader.read(threemf.ThreeMF(), self.data))
+
+            await asyncio.get_running_loop().run_in_executor(None, tracking.started.wait)
+            task.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+            # The worker has stopped and freed its slot
+            self.assertTrue(tracking.stopped)
+            self.assertEqual(tracking.running, 0)
+
+            tracking.delay = 0.
+            tmf = threemf.ThreeMF()
+            await asyncio.wait_for(reader.read(tmf, self.data), 10.)
+            self.assertSameModel(tmf)
@@ -0,0 +1,28 @@
+import importlib.util
+import os
+import unittest
+
+def load_bench():
+    path = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'bench.py')
+    spec = importlib.util.spec_from_file_location('bench', path)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    return bench
+
+class BenchmarkSmokeTest(unittest.TestCase):
+    def test_cases_run(self):
+        bench = load_bench()
+
+        for name in bench.CASES:
+            result = bench.measure(name, 120, repeat=1, trace_allocations=False)
+
+            self.assertEqual(result['case'], name)
+            self.assertGreaterEqual(result['wall_s'], 0.)
+
+    def test_tiled_cubes(self):
+        bench = load_bench()
+
+        mesh = bench.tiled_cubes(1200)
+
+        self.assertEqual(mesh.triangle_array.shape, (1200, 3))
+        self.assertEqual(mesh.vertex_array.shape, (800, 3))
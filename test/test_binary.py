@@ -0,0 +1,158 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import threemf
+
+def make_tmf(length=1.):
+    tmf = threemf.ThreeMF()
+
+    mdl = tmf.default_model
+
+    cube = mdl.object_from_stl(threemf.geom.Cube(length, 2., 3.).stl_mesh())
+
+    assembly = threemf.model.ObjectModel(2)
+    assembly.add_component(cube)
+    mdl.objects.append(assembly)
+
+    mdl.build.add_item(assembly)
+
+    return tmf
+
+def write(tmf, binary_mesh=True) -> bytes:
+    with io.BytesIO() as f:
+        threemf.io.Writer(binary_mesh=binary_mesh).write(tmf, f)
+        return f.getvalue()
+
+def read(f, **kwargs):
+    tmf = threemf.ThreeMF()
+    threemf.io.Reader(**kwargs).read(tmf, f)
+    return tmf
+
+class BinaryMeshTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertMeshesEqual(self, expected, actual, check_dtype=False):
+        for e, a in zip(expected.default_model.objects, actual.default_model.objects):
+            self.assertEqual(e.id, a.id)
+            np.testing.assert_array_equal(e.mesh.vertex_array, a.mesh.vertex_array)
+            np.testing.assert_array_equal(e.mesh.triangle_array, a.mesh.triangle_array)
+            if check_dtype:
+                self.assertEqual(e.mesh.vertex_array.dtype, a.mesh.vertex_array.dtype)
+
+    def test_sidecar_written(self):
+        data = write(make_tmf())
+
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            info = z.getinfo('3D/3dmodel.model.bin')
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertIn(b'Extension="bin"', z.read('[Content_Types].xml'))
+
+            model_xml = z.read('3D/3dmodel.model')
+
+        # The model XML is unchanged, so other readers still see the meshes
+        with zipfile.ZipFile(io.BytesIO(write(make_tmf(), binary_mesh=False))) as z:
+            self.assertEqual(model_xml, z.read('3D/3dmodel.model'))
+
+    def test_round_trip_file(self):
+        expected = make_tmf()
+
+        path = os.path.join(self.directory, 'cube.3mf')
+        with open(path, 'wb') as f:
+            f.write(write(expected))
+
+        with open(path, 'rb') as f:
+            tmf = read(f)
+
+        # The sidecar keeps the float32 vertices of the STL
+        self.assertMeshesEqual(expected, tmf, check_dtype=True)
+
+        verts = tmf.default_model.objects[0].mesh.vertex_array
+        self.assertIsInstance(verts.base.base.obj, mmap.mmap)
+
+        # Mapped copy-on-write, so changes do not reach the file
+        verts[0, 0] = 100.
+        with open(path, 'rb') as f:
+            self.assertMeshesEqual(expected, read(f))
+
+    def test_round_trip_bytes(self):
+        expected = make_tmf()
+        tmf = read(io.BytesIO(write(expected)))
+
+        self.assertMeshesEqual(expected, tmf, check_dtype=True)
+        tmf.default_model.objects[0].mesh.vertex_array[0, 0] = 100.
+
+    def test_lazy(self):
+        expected = make_tmf()
+        tmf = read(io.BytesIO(write(expected)), lazy=True)
+
+        self.assertTrue(all(obj.mesh_loaded for obj in tmf.default_model.objects))
+        self.assertMeshesEqual(expected, tmf)
+
+    def test_process_pool(self):
+        expected = make_tmf()
+
+        with ProcessPoolExecutor(1) as executor:
+            tmf = read(io.BytesIO(write(expected)), executor=executor)
+
+        # The float32 vertices come from the sidecar, the XML has float64
+        self.assertMeshesEqual(expected, tmf, check_dtype=True)
+
+    def test_stale_sidecar_ignored(self):
+        expected = make_tmf(5.)
+
+        # Replace the model XML with that of a different cube, keeping the
+        # sidecar written for the original one
+        with zipfile.ZipFile(io.BytesIO(write(make_tmf(1.)))) as src:
+            with zipfile.ZipFile(io.BytesIO(write(expected, binary_mesh=False))) as other:
+                out = io.BytesIO()
+                with zipfile.ZipFile(out, 'w') as dst:
+                    for info in src.infolist():
+                        source = other if info.filename == '3D/3dmodel.model' else src
+                        dst.writestr(info, source.read(info.filename))
+
+        for lazy in (False, True):
+            self.assertMeshesEqual(expected, read(io.BytesIO(out.getvalue()), lazy=lazy))
+
+            with ProcessPoolExecutor(1) as executor:
+                self.assertMeshesEqual(expected, read(io.BytesIO(out.getvalue()), lazy=lazy, executor=executor))
+
+    def test_corrupt_sidecar_ignored(self):
+        expected = make_tmf()
+        data = bytearray(write(expected))
+
+        with zipfile.ZipFile(io.BytesIO(bytes(data))) as z:
+            info = z.getinfo('3D/3dmodel.model.bin')
+            start = threemf.binary._data_offset(z.fp, info)
+
+        # Flip a byte of the first vertex, the CRC no longer matches
+        data[start + 512] ^= 0xFF
+
+        path = os.path.join(self.directory, 'corrupt.3mf')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        with open(path, 'rb') as f:
+            self.assertMeshesEqual(expected, read(f))
+
+    def test_disabled(self):
+        data = write(make_tmf())
+
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            info = z.getinfo('3D/3dmodel.model.bin')
+            start = threemf.binary._data_offset(z.fp, info)
+
+        self.assertEqual(start % 64, 0)
+
+        expected = make_tmf()
+        self.assertMeshesEqual(expected, read(io.BytesIO(data), binary_mesh=False))
@@ -0,0 +1,156 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+
+import numpy as np
+import threemf
+
+def make_3mf(length) -> bytes:
+    tmf = threemf.ThreeMF()
+
+    mdl = tmf.default_model
+
+    cube = mdl.object_from_stl(threemf.geom.Cube(length, 2., 3.).stl_mesh())
+    cube.add_meta_data_cura('infill_pattern', 'grid')
+
+    assembly = threemf.model.ObjectModel(2)
+    assembly.add_component(cube, np.array(
+        [
+            [1., 0., 0., 10.],
+            [0., 1., 0., 20.],
+            [0., 0., 1., 30.],
+            [0., 0., 0., 1.]
+        ]
+    ))
+    mdl.objects.append(assembly)
+
+    mdl.build.add_item(assembly)
+
+    with io.BytesIO() as f:
+        threemf.io.Writer().write(tmf, f)
+        return f.getvalue()
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, data, cache):
+        tmf = threemf.ThreeMF()
+        threemf.io.Reader(cache=cache).read(tmf, io.BytesIO(data))
+        return tmf
+
+    def entries(self):
+        return [name for name in os.listdir(self.directory) if not name.startswith('.')]
+
+    def test_hit_matches_parse(self):
+        data = make_3mf(5.)
+
+        for content_hash in (False, True):
+            cache = threemf.cache.ParseCache(self.directory, content_hash=content_hash)
+            cache.clear()
+
+            parsed = self.read(data, cache)
+            cached = self.read(data, cache)
+
+            self.assertEqual(len(self.entries()), 1)
+
+            for tmf in (parsed, cached):
+                mdl = tmf.default_model
+
+                self.assertEqual([o.id for o in mdl.objects], [1, 2])
+                self.assertEqual(mdl.objects[0].get_meta_data('cura:infill_pattern').value, 'grid')
+                self.assertEqual(mdl.objects[1].components[0].transform[1, 3], 20.)
+                self.assertEqual(mdl.build.items[0].objectid, 2)
+                self.assertEqual(len(mdl.objects[1].mesh.vertices), 0)
+
+            self.assertTrue(np.array_equal(
+                cached.default_model.objects[0].mesh.vertex_array,
+                parsed.default_model.objects[0].mesh.vertex_array
+            ))
+
+            # Cached meshes are copy-on-write
+            cached.default_model.objects[0].mesh.transform(np.diag([2., 2., 2., 1.]))
+            again = self.read(data, cache)
+            self.assertTrue(np.array_equal(
+                again.default_model.objects[0].mesh.vertex_array,
+                parsed.default_model.objects[0].mesh.vertex_array
+            ))
+
+    def test_different_files(self):
+        cache = threemf.cache.ParseCache(self.directory)
+
+        tmf1 = self.read(make_3mf(5.), cache)
+        tmf2 = self.read(make_3mf(6.), cache)
+
+        self.assertEqual(len(self.entries()), 2)
+        self.assertEqual(tmf2.default_model.objects[0].mesh.vertex_array.max(), 3.)
+
+    def test_key_covers_content(self):
+        data = make_3mf(5.)
+
+        # Same zip directory, different bytes
+        with io.BytesIO(data) as f:
+            with zipfile.ZipFile(f, 'a') as z:
+                z.comment = b'changed'
+            changed = f.getvalue()
+
+        cache = threemf.cache.ParseCache(self.directory)
+        self.read(data, cache)
+        self.read(changed, cache)
+        self.assertEqual(len(self.entries()), 2)
+
+        cache.clear()
+
+        cache = threemf.cache.ParseCache(self.directory, content_hash=False)
+        self.read(data, cache)
+        self.read(changed, cache)
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_corrupt_entry(self):
+        cache = threemf.cache.ParseCache(self.directory)
+        data = make_3mf(5.)
+
+        self.read(data, cache)
+        entry = os.path.join(self.directory, self.entries()[0])
+
+        with open(os.path.join(entry, 'index.json'), 'w') as f:
+            f.write('{')
+
+        tmf = self.read(data, cache)
+
+        self.assertEqual(len(tmf.default_model.objects), 2)
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_lru_eviction(self):
+        cache = threemf.cache.ParseCache(self.directory)
+
+        files = [make_3mf(float(i + 1)) for i in range(3)]
+
+        for data in files:
+            self.read(data, cache)
+            time.sleep(0.01)
+
+        sizes = {}
+        for name in self.entries():
+            path = os.path.join(self.directory, name)
+            sizes[name] = sum(e.stat().st_size for e in os.scandir(path))
+
+        # Touch the first entry so the second is the least recently used
+        self.read(files[0], cache)
+        time.sleep(0.01)
+
+        cache.max_bytes = sum(sizes.values()) + 1
+        self.read(make_3mf(10.), cache)
+
+        self.assertEqual(len(self.entries()), 3)
+
+        keys = [cache.key(io.BytesIO(data), zipfile.ZipFile(io.BytesIO(data))) for data in files]
+        self.assertTrue(os.path.isdir(os.path.join(self.directory, keys[0])))
+        self.assertFalse(os.path.isdir(os.path.join(self.directory, keys[1])))
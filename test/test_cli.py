@@ -0,0 +1,154 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import struct
+import tempfile
+import unittest
+import unittest.mock
+
+import numpy as np
+import threemf
+import threemf.cli
+
+_stl_to_3mf = threemf.cli._stl_to_3mf
+
+def _stl_to_3mf_or_die(source, target, weld):
+    # Kills the worker process, as the system would
+    if 'dies' in os.path.basename(source):
+        os._exit(1)
+    return _stl_to_3mf(source, target, weld)
+
+class CLITest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+        self.inputs = os.path.join(self.tmp, 'in')
+        os.makedirs(os.path.join(self.inputs, 'sub'))
+
+        threemf.geom.Cube(1., 2., 3.).stl_mesh().save(os.path.join(self.inputs, 'a.stl'))
+        threemf.geom.Cube(4., 5., 6.).stl_mesh().save(os.path.join(self.inputs, 'sub', 'b.STL'))
+
+        with open(os.path.join(self.inputs, 'notes.txt'), 'w') as f:
+            f.write('not a mesh')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def run_cli(self, patterns, output_dir=None, memory_limit=None):
+        out = io.StringIO()
+        failed = threemf.cli.run(threemf.cli.find_inputs(patterns), output_dir, jobs=2, memory_limit=memory_limit, out=out)
+        return failed, out.getvalue()
+
+    def test_find_inputs(self):
+        found = threemf.cli.find_inputs([
+            self.inputs,
+            os.path.join(self.inputs, '*.stl'),
+            os.path.join(self.tmp, 'missing.stl')
+        ])
+
+        self.assertEqual(
+            found,
+            [(os.path.join(self.inputs, 'a.stl'), 'a.stl'),
+             (os.path.join(self.inputs, 'sub', 'b.STL'), os.path.join('sub', 'b.STL'))]
+        )
+
+    def test_round_trip(self):
+        converted = os.path.join(self.tmp, 'converted')
+        failed, output = self.run_cli([self.inputs], converted)
+
+        self.assertEqual(failed, 0)
+        self.assertIn('2 converted, 0 failed', output)
+
+        tmf = threemf.ThreeMF()
+        with open(os.path.join(converted, 'sub', 'b.3mf'), 'rb') as f:
+            threemf.io.Reader().read(tmf, f)
+
+        obj = tmf.default_model.objects[0]
+        self.assertEqual(len(obj.mesh.triangle_array), 12)
+        self.assertEqual(len(obj.mesh.vertex_array), 8)
+        self.assertEqual(len(tmf.default_model.build.items), 1)
+
+        # And back to STL, next to the 3MF files
+        failed, _ = self.run_cli([os.path.join(converted, '**', '*.3mf')])
+        self.assertEqual(failed, 0)
+
+        stl_mesh = threemf.mesh.Mesh.FromSTLFile(os.path.join(converted, 'sub', 'b.stl'))
+        np.testing.assert_allclose(stl_mesh.vertex_array.max(axis=0), (2., 2.5, 3.))
+        self.assertAlmostEqual(stl_mesh.volume(), 120., places=4)
+
+    def test_failures(self):
+        with open(os.path.join(self.inputs, 'broken.3mf'), 'wb') as f:
+            f.write(b'not a zip file')
+
+        failed, output = self.run_cli([self.inputs])
+
+        self.assertEqual(failed, 1)
+        self.assertIn('FAILED {}: BadZipFile'.format(os.path.join(self.inputs, 'broken.3mf')), output)
+        self.assertIn('2 converted, 1 failed', output)
+        self.assertFalse(os.path.exists(os.path.join(self.inputs, 'broken.stl')))
+        self.assertFalse(os.path.exists(os.path.join(self.inputs, 'broken.stl.part')))
+
+        # a.stl and a.3mf would overwrite each other
+        failed, output = self.run_cli([os.path.join(self.inputs, 'a.*')])
+        self.assertEqual(failed, 2)
+        self.assertIn('is an input or the output of another input', output)
+
+    def test_empty_build(self):
+        # An object that is not in the build is not printed
+        tmf = threemf.ThreeMF()
+        tmf.default_model.object_from_stl(threemf.geom.Cube(1., 2., 3.).stl_mesh())
+
+        path = os.path.join(self.inputs, 'empty.3mf')
+        with open(path, 'wb') as f:
+            threemf.io.Writer().write(tmf, f)
+
+        failed, output = self.run_cli([path])
+
+        self.assertEqual(failed, 1)
+        self.assertIn('FAILED {}: ThreeMFException: No triangles in {}'.format(path, path), output)
+        self.assertFalse(os.path.exists(os.path.join(self.inputs, 'empty.stl')))
+        self.assertFalse(os.path.exists(os.path.join(self.inputs, 'empty.stl.part')))
+
+    @unittest.skipIf(threemf.cli.resource is None, 'memory limit not supported')
+    def test_memory_error(self):
+        # The header claims 10^8 triangles, which numpy-stl allocates at once
+        path = os.path.join(self.inputs, 'huge.stl')
+        with open(path, 'wb') as f:
+            f.write(bytes(80) + struct.pack('<I', 10 ** 8 - 1) + bytes(50))
+
+        failed, output = self.run_cli([self.inputs], memory_limit=1024)
+
+        self.assertEqual(failed, 1)
+        self.assertIn('FAILED {}: MemoryError'.format(path), output)
+        self.assertIn('2 converted, 1 failed', output)
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'workers must inherit the patch')
+    def test_worker_died(self):
+        for i in range(3):
+            threemf.geom.Cube(1., 2., 3.).stl_mesh().save(os.path.join(self.inputs, 'c{}.stl'.format(i)))
+
+        # Sorted first, so the other files are still waiting when it dies
+        path = os.path.join(self.inputs, '0dies.stl')
+        threemf.geom.Cube(1., 2., 3.).stl_mesh().save(path)
+
+        with unittest.mock.patch.object(threemf.cli, '_stl_to_3mf', _stl_to_3mf_or_die):
+            failed, output = self.run_cli([self.inputs])
+
+        # Only the file that killed its worker fails
+        self.assertEqual(failed, 1)
+        self.assertIn('FAILED {}: worker process died'.format(path), output)
+        self.assertIn('5 converted, 1 failed', output)
+
+    def test_main(self):
+        out = io.StringIO()
+
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(threemf.cli.main([os.path.join(self.inputs, 'a.stl'), '-j', '1']), 0)
+
+        self.assertIn('1 converted, 0 failed', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.inputs, 'a.3mf')))
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(threemf.cli.main([os.path.join(self.tmp, 'missing')]), 2)
@@ -1,3 +1,4 @@
+import io
 import numpy as np
 import threemf
 import unittest
@@ -58,6 +59,70 @@ class MeshesOperations(unittest.TestCase):
         self.assertEqual(len(c_mesh.vertices), 22)
         self.assertEqual(len(c_mesh.triangles), 36)
 
+    def test_add_matches_pairwise_merge(self):
+        rng = np.random.default_rng(0)
+
+        a = threemf.mesh.Mesh(rng.integers(0, 4, (60, 3)).astype(float), rng.integers(0, 60, (40, 3)))
+        b = threemf.mesh.Mesh(rng.integers(0, 4, (50, 3)).astype(float), rng.integers(0, 50, (30, 3)))
+
+        # Reference: the original nested loop over both vertex lists
+        verts = [tuple(v) for v in a.vertex_array]
+        vert_map = {}
+        for i, v in enumerate(b.vertex_array):
+            v = tuple(v)
+            if v in verts:
+                vert_map[i] = verts.index(v)
+            else:
+                verts.append(v)
+                vert_map[i] = len(verts) - 1
+
+        tris = np.concatenate((a.triangle_array, [[vert_map[i] for i in t] for t in b.triangle_array]))
+
+        c_mesh = a + b
+
+        self.assertTrue(np.array_equal(c_mesh.vertex_array, verts))
+        self.assertTrue(np.array_equal(c_mesh.triangle_array, tris))
+
+    def test_weld(self):
+        box = bounding_box(threemf.mesh.Vertex(0, 0, 0), threemf.mesh.Vertex(1., 1., 1.))
+
+        expanded = box.expand_vertices()
+
+        self.assertEqual(expanded.weld(), 28)
+        self.assertEqual(len(expanded.vertices), 8)
+        self.assertEqual(len(expanded.triangles), 12)
+        self.assertTrue(np.array_equal(
+            expanded.vertex_array[expanded.triangle_array],
+            box.vertex_array[box.triangle_array]
+        ))
+
+        noisy = box.expand_vertices()
+        noisy.vertex_array = noisy.vertex_array + 1e-7 * np.arange(36).reshape(-1, 1)
+
+        self.assertEqual(noisy.weld(tolerance=1e-3), 28)
+
+        # Noise around round coordinates puts near-duplicates on both sides
+        # of cell borders
+        for eps in (1e-12, -1e-12):
+            near = box.expand_vertices()
+            near.vertex_array = near.vertex_array + eps * (np.arange(36) % 2).reshape(-1, 1)
+
+            self.assertEqual(near.weld(tolerance=1e-6), 28)
+
+        pair = threemf.mesh.Mesh(
+            np.array([[0., 0., 0.], [-1e-12, 0., 0.], [0., 2e-6, 0.], [0.5e-6, 0.5e-6, -0.5e-6]])
+        )
+        self.assertEqual(pair.weld(tolerance=1e-6), 2)
+        self.assertEqual(pair.vertex_array.tolist(), [[0., 0., 0.], [0., 2e-6, 0.]])
+
+        # Merging is transitive along chains of close vertices
+        chain = threemf.mesh.Mesh(np.array([[0., 0., 0.], [0.9, 0., 0.], [1.8, 0., 0.], [5., 0., 0.]]))
+        self.assertEqual(chain.weld(tolerance=1.), 2)
+
+        # Collapsing a whole box removes every triangle
+        self.assertEqual(box.weld(tolerance=10.), 7)
+        self.assertEqual(len(box.triangles), 0)
+
     def test_mesh_to_stl(self):
         p1min = threemf.mesh.Vertex(0, 0, 0)
         p1max = threemf.mesh.Vertex(1., 1., 1.)
@@ -66,3 +131,427 @@ class MeshesOperations(unittest.TestCase):
         stl_mesh = box1.to_stl()
 
         self.assertEqual(len(stl_mesh.vectors), 12)
+
+    def test_stl_round_trip(self):
+        stl_mesh = threemf.geom.Cube(10., 20., 30.).stl_mesh()
+
+        mesh = threemf.mesh.Mesh.FromSTL(stl_mesh)
+
+        self.assertEqual(mesh.vertex_array.shape, (36, 3))
+        self.assertEqual(mesh.vertex_array.dtype, np.float32)
+        self.assertTrue(np.array_equal(mesh.triangle_array.ravel(), np.arange(36)))
+
+        stl_mesh2 = mesh.to_stl()
+
+        self.assertTrue(np.array_equal(stl_mesh2.vectors, stl_mesh.vectors))
+        self.assertTrue(np.allclose(stl_mesh2.normals, stl_mesh.normals))
+
+class MeshArrays(unittest.TestCase):
+    def test_array_storage(self):
+        verts = np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.]], dtype=np.float32)
+        tris = np.array([[0, 1, 2]], dtype=np.int64)
+
+        mesh = threemf.mesh.Mesh(verts, tris)
+
+        self.assertEqual(mesh.vertex_array.dtype, np.float32)
+        self.assertEqual(mesh.triangle_array.dtype, np.int64)
+        self.assertTrue(np.shares_memory(mesh.vertex_array, verts))
+
+        self.assertEqual(len(mesh.vertices), 3)
+        self.assertEqual(mesh.vertices[1].x, 1.0)
+        self.assertEqual(mesh.triangles[0].v3, 2)
+
+    def test_vertex_views(self):
+        mesh = threemf.mesh.Mesh()
+
+        for i in range(100):
+            mesh.vertices.append(threemf.mesh.Vertex(i, 2 * i, 3 * i))
+
+        mesh.triangles.append(threemf.mesh.Triangle(0, 1, 2))
+
+        self.assertEqual(mesh.vertex_array.shape, (100, 3))
+        self.assertEqual(mesh.triangle_array.shape, (1, 3))
+        self.assertEqual(mesh.triangle_array.dtype, threemf.mesh.TRIANGLE_DTYPES[0])
+
+        v = mesh.vertices[10]
+        v.y = -1.0
+
+        self.assertEqual(mesh.vertex_array[10, 1], -1.0)
+        self.assertEqual([t.v2 for t in mesh.triangles], [1])
+
+    def test_slice_assignment(self):
+        Vertex = threemf.mesh.Vertex
+
+        mesh = threemf.mesh.Mesh(np.arange(12.).reshape(4, 3))
+
+        mesh.vertices[0:2] = [Vertex(-1, -2, -3), Vertex(-4, -5, -6)]
+        self.assertEqual(mesh.vertex_array[:2].tolist(), [[-1, -2, -3], [-4, -5, -6]])
+
+        mesh.vertices[::2] = mesh.vertices[1::2]
+        self.assertEqual(mesh.vertex_array[:, 0].tolist(), [-4, -4, 9, 9])
+
+        mesh.vertices[1:3] = [Vertex(7, 8, 9)]
+        self.assertEqual(mesh.vertex_array.tolist(), [[-4, -5, -6], [7, 8, 9], [9, 10, 11]])
+
+        mesh.triangles[:] = [threemf.mesh.Triangle(0, 1, 2)]
+        self.assertEqual(mesh.triangle_array.tolist(), [[0, 1, 2]])
+
+        with self.assertRaises(ValueError):
+            mesh.vertices[::2] = [Vertex(0, 0, 0)] * 3
+
+    def test_expand_vertices(self):
+        box = bounding_box(threemf.mesh.Vertex(0, 0, 0), threemf.mesh.Vertex(1., 1., 1.))
+
+        expanded = box.expand_vertices()
+
+        self.assertEqual(len(expanded.vertices), 36)
+        self.assertEqual(len(expanded.triangles), 12)
+        self.assertTrue(np.array_equal(
+            expanded.vertex_array[expanded.triangle_array],
+            box.vertex_array[box.triangle_array]
+        ))
+
+class MeshTransforms(unittest.TestCase):
+    def setUp(self):
+        self.box = bounding_box(threemf.mesh.Vertex(1, 2, 3), threemf.mesh.Vertex(3., 6., 7.))
+
+        c, s = np.cos(0.3), np.sin(0.3)
+        self.T = np.array(
+            [
+                [c, -s, 0., 10.],
+                [s, c, 0., -5.],
+                [0., 0., 2., 1.],
+                [0., 0., 0., 1.]
+            ]
+        )
+
+    def test_transform(self):
+        expected = np.array([self.T @ np.append(v, 1.0) for v in self.box.vertex_array])[:, :3]
+
+        copied = self.box.transform(self.T, inplace=False)
+
+        self.assertTrue(np.allclose(copied.vertex_array, expected))
+        self.assertFalse(np.allclose(self.box.vertex_array, expected))
+
+        self.assertIs(self.box.transform(self.T), self.box)
+        self.assertTrue(np.allclose(self.box.vertex_array, expected))
+
+        v = threemf.mesh.Vertex(1, 2, 3)
+        v.transform(self.T)
+
+        self.assertTrue(np.allclose((v.x, v.y, v.z), expected[0]))
+
+    def test_bounding_box_and_center(self):
+        pmin, pmax = self.box.bounding_box()
+
+        self.assertEqual((pmin.x, pmin.y, pmin.z), (1., 2., 3.))
+        self.assertEqual((pmax.x, pmax.y, pmax.z), (3., 6., 7.))
+
+        self.box.transform(self.box.center())
+        pmin, pmax = self.box.bounding_box()
+
+        self.assertEqual((pmin.x, pmin.y, pmin.z), (-1., -2., -2.))
+        self.assertEqual((pmax.x, pmax.y, pmax.z), (1., 2., 2.))
+
+class MeshBVH(unittest.TestCase):
+    def setUp(self):
+        self.box = bounding_box(threemf.mesh.Vertex(0., 0., 0.), threemf.mesh.Vertex(1., 2., 3.))
+
+        rng = np.random.default_rng(0)
+        centers = rng.uniform(0., 10., size=(400, 1, 3))
+        self.soup = threemf.mesh.Mesh(
+            (centers + rng.normal(scale=0.5, size=(400, 3, 3))).reshape(-1, 3),
+            np.arange(1200).reshape(-1, 3)
+        )
+
+        self.rng = rng
+
+    def brute_force(self, m):
+        # A single leaf holding every triangle, so every query tests them all
+        return threemf.bvh.BVH(m.vertex_array, m.triangle_array, leaf_size=len(m.triangle_array))
+
+    def test_rays(self):
+        tris, t = self.box.bvh.intersect_rays(
+            [(0.5, 1., -5.), (0.5, 1., 10.), (-1., 0.5, 0.5), (5., 5., 5.)],
+            [(0., 0., 1.), (0., 0., -1.), (1., 0., 0.), (1., 0., 0.)]
+        )
+
+        np.testing.assert_allclose(t[:3], [5., 7., 1.])
+        self.assertTrue((tris[:3] >= 0).all())
+        self.assertEqual(tris[3], -1)
+        self.assertEqual(t[3], np.inf)
+
+        origins = self.rng.uniform(-2., 12., size=(300, 3))
+        directions = self.rng.normal(size=(300, 3))
+
+        expected = self.brute_force(self.soup).intersect_rays(origins, directions)
+        actual = self.soup.bvh.intersect_rays(origins, directions)
+
+        self.assertGreater((expected[0] >= 0).sum(), 50)
+        np.testing.assert_array_equal(actual[0], expected[0])
+        np.testing.assert_allclose(actual[1], expected[1])
+
+        _, limited = self.soup.bvh.intersect_rays(origins, directions, max_distance=1.)
+        np.testing.assert_array_equal(limited, np.where(expected[1] <= 1., expected[1], np.inf))
+
+    def test_closest_points(self):
+        lo = np.array((0., 0., 0.))
+        hi = np.array((1., 2., 3.))
+
+        points = self.rng.uniform(-1., 4., size=(500, 3))
+        closest, distances, tris = self.box.bvh.closest_points(points)
+
+        inside = ((points > lo) & (points < hi)).all(axis=1)
+        expected = np.where(
+            inside,
+            np.minimum(points - lo, hi - points).min(axis=1),
+            np.linalg.norm(points - np.clip(points, lo, hi), axis=1)
+        )
+
+        np.testing.assert_allclose(distances, expected, atol=1e-12)
+        np.testing.assert_allclose(np.linalg.norm(closest - points, axis=1), distances, atol=1e-12)
+        np.testing.assert_allclose(closest[~inside], np.clip(points, lo, hi)[~inside], atol=1e-12)
+
+        points = self.rng.uniform(-2., 12., size=(300, 3))
+        expected = self.brute_force(self.soup).closest_points(points)
+        actual = self.soup.bvh.closest_points(points)
+
+        np.testing.assert_allclose(actual[1], expected[1])
+        np.testing.assert_allclose(actual[0], expected[0])
+
+    def test_overlapping(self):
+        # The two triangles of each of the three faces at the corner
+        self.assertEqual(len(self.box.bvh.overlapping((0.9, 1.9, 2.9), (2., 3., 4.))), 6)
+        self.assertEqual(len(self.box.bvh.overlapping((2., 2., 2.), (3., 3., 3.))), 0)
+
+        lo = self.rng.uniform(0., 10., size=(50, 3))
+        hi = lo + self.rng.uniform(0., 2., size=(50, 3))
+
+        expected = self.brute_force(self.soup).overlapping(lo, hi)
+        actual = self.soup.bvh.overlapping(lo, hi)
+
+        self.assertEqual(len(actual), 50)
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(a, e)
+
+    def test_cache(self):
+        bvh = self.box.bvh
+        self.assertIs(self.box.bvh, bvh)
+
+        T = np.identity(4)
+        T[2, 3] = 10.
+        self.box.transform(T)
+
+        self.assertIsNot(self.box.bvh, bvh)
+        _, t = self.box.bvh.intersect_rays([(0.5, 1., 0.)], [(0., 0., 1.)])
+        np.testing.assert_allclose(t, [10.])
+
+        bvh = self.box.bvh
+        self.box.vertex_array = self.box.vertex_array * 2
+        self.assertIsNot(self.box.bvh, bvh)
+
+        # Assigned through the list views
+        for rows, value in ((self.box.vertices, threemf.mesh.Vertex(0., 0., 0.)), (self.box.triangles, self.box.triangles[1])):
+            for key in (0, slice(0, 1)):
+                bvh = self.box.bvh
+                rows[key] = value if key == 0 else [value]
+                self.assertIsNot(self.box.bvh, bvh)
+
+        self.assertEqual(self.box.bvh.closest_points([(0., 0., 0.)])[2][0] >= 0, True)
+        self.assertEqual(threemf.mesh.Mesh().bvh.intersect_rays([(0., 0., 0.)], [(1., 0., 0.)])[0][0], -1)
+
+class MeshAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.box = bounding_box(threemf.mesh.Vertex(1., 2., 3.), threemf.mesh.Vertex(2., 4., 6.))
+
+    def test_geometry(self):
+        self.assertAlmostEqual(self.box.area(), 2. * (1. * 2. + 1. * 3. + 2. * 3.))
+        self.assertAlmostEqual(self.box.volume(), 6.)
+        np.testing.assert_allclose(self.box.face_areas().sum(), self.box.area())
+
+        normals = self.box.face_normals()
+        np.testing.assert_allclose(normals[:2], [(0., 0., -1.)] * 2, atol=1e-15)
+        np.testing.assert_allclose(normals[10:], [(0., 0., 1.)] * 2, atol=1e-15)
+
+        # Each corner normal points out along the diagonal of the box
+        vertex_normals = self.box.vertex_normals()
+        center = 0.5 * (self.box.vertex_array.min(axis=0) + self.box.vertex_array.max(axis=0))
+        outwards = np.sign(self.box.vertex_array - center)
+        np.testing.assert_array_equal(np.sign(vertex_normals), outwards)
+        np.testing.assert_allclose(np.linalg.norm(vertex_normals, axis=1), 1.)
+
+        degenerate = threemf.mesh.Mesh([(0., 0., 0.), (1., 0., 0.), (2., 0., 0.)], [(0, 1, 2)])
+        np.testing.assert_array_equal(degenerate.face_normals(), [(0., 0., 0.)])
+        self.assertEqual(threemf.mesh.Mesh().volume(), 0.)
+
+    def test_blocks(self):
+        m = threemf.mesh.Mesh(
+            np.random.default_rng(0).normal(size=(300, 3)).astype(np.float32),
+            np.random.default_rng(1).integers(0, 300, size=(1000, 3))
+        )
+        expected = (m.area(), m.volume(), m.face_normals())
+
+        block = threemf.mesh._ANALYSIS_BLOCK
+        threemf.mesh._ANALYSIS_BLOCK = 7
+        try:
+            self.assertAlmostEqual(m.area(), expected[0])
+            self.assertAlmostEqual(m.volume(), expected[1])
+            np.testing.assert_allclose(m.face_normals(), expected[2])
+        finally:
+            threemf.mesh._ANALYSIS_BLOCK = block
+
+    def test_edges(self):
+        self.assertTrue(self.box.is_watertight())
+        self.assertTrue(self.box.is_winding_consistent())
+        self.assertFalse(self.box.is_inverted())
+        self.assertEqual(len(self.box.open_edges()), 0)
+
+        inverted = threemf.mesh.Mesh(self.box.vertex_array, self.box.triangle_array[:, ::-1])
+        self.assertTrue(inverted.is_winding_consistent())
+        self.assertTrue(inverted.is_inverted())
+        self.assertAlmostEqual(inverted.volume(), -6.)
+
+        flipped = threemf.mesh.Mesh(self.box.vertex_array, self.box.triangle_array.copy())
+        flipped.triangle_array[0] = flipped.triangle_array[0, ::-1]
+        self.assertTrue(flipped.is_watertight())
+        self.assertFalse(flipped.is_winding_consistent())
+        self.assertEqual(len(flipped.misoriented_edges()), 3)
+
+        # Removing a triangle opens its three edges
+        opened = threemf.mesh.Mesh(self.box.vertex_array, self.box.triangle_array[1:])
+        self.assertFalse(opened.is_watertight())
+        self.assertEqual(
+            sorted(map(tuple, opened.open_edges())),
+            sorted(tuple(sorted(e)) for e in ((0, 3), (3, 1), (1, 0)))
+        )
+
+        # A third triangle on an edge of the box
+        fin = threemf.mesh.Mesh(
+            np.concatenate((self.box.vertex_array, [(0., 0., 0.)])),
+            np.concatenate((self.box.triangle_array, [(0, 1, 8)]))
+        )
+        np.testing.assert_array_equal(fin.non_manifold_edges(), [(0, 1)])
+        self.assertFalse(fin.is_watertight())
+
+        self.assertFalse(threemf.mesh.Mesh().is_watertight())
+
+def uv_sphere(rings, segments) -> threemf.mesh.Mesh:
+    '''
+    Unit sphere with rings of segments vertices between two poles
+    '''
+    u = np.linspace(0., np.pi, rings + 2)[1:-1, np.newaxis]
+    v = np.linspace(0., 2. * np.pi, segments, endpoint=False)
+
+    vertices = np.stack((
+        np.sin(u) * np.cos(v),
+        np.sin(u) * np.sin(v),
+        np.cos(u) * np.ones_like(v)
+    ), axis=-1).reshape(-1, 3)
+    vertices = np.concatenate((vertices, [(0., 0., 1.), (0., 0., -1.)]))
+
+    top, bottom = len(vertices) - 2, len(vertices) - 1
+    idx = np.arange(rings * segments).reshape(rings, segments)
+    a, b = idx[:-1], np.roll(idx[:-1], -1, axis=1)
+    c, d = idx[1:], np.roll(idx[1:], -1, axis=1)
+
+    triangles = np.concatenate((
+        np.stack((a, c, b), axis=-1).reshape(-1, 3),
+        np.stack((b, c, d), axis=-1).reshape(-1, 3),
+        np.stack((np.full(segments, top), idx[0], np.roll(idx[0], -1)), axis=-1),
+        np.stack((np.full(segments, bottom), np.roll(idx[-1], -1), idx[-1]), axis=-1)
+    ))
+
+    return threemf.mesh.Mesh(vertices.astype(np.float32), triangles.astype(np.int32))
+
+class MeshDecimation(unittest.TestCase):
+    def setUp(self):
+        self.sphere = uv_sphere(60, 80)
+
+    def assertSphere(self, m, tolerance):
+        self.assertTrue(m.is_watertight())
+        self.assertTrue(m.is_winding_consistent())
+        self.assertFalse(m.is_inverted())
+        np.testing.assert_allclose(np.linalg.norm(m.vertex_array, axis=1), 1., atol=tolerance)
+
+    def test_target(self):
+        self.assertSphere(self.sphere, 1e-6)
+
+        simple = self.sphere.decimate(1000)
+
+        self.assertEqual(len(simple.triangle_array), 1000)
+        self.assertSphere(simple, 0.02)
+        self.assertAlmostEqual(simple.volume(), self.sphere.volume(), delta=0.02)
+
+        self.assertEqual(simple.vertex_array.dtype, np.float32)
+        self.assertEqual(simple.triangle_array.dtype, np.int32)
+
+        # Every vertex is used
+        self.assertEqual(len(np.unique(simple.triangle_array)), len(simple.vertex_array))
+
+        # The mesh itself is left unchanged
+        self.assertEqual(len(self.sphere.triangle_array), 2 * 59 * 80 + 2 * 80)
+
+    def test_max_error(self):
+        coarse = self.sphere.decimate(max_error=1e-3)
+        fine = self.sphere.decimate(max_error=1e-5)
+
+        self.assertLess(len(coarse.triangle_array), len(fine.triangle_array))
+        self.assertLess(len(fine.triangle_array), len(self.sphere.triangle_array))
+        self.assertSphere(coarse, 0.01)
+
+        # A flat grid loses its inner vertices but keeps its outline
+        n = 20
+        x, y = np.meshgrid(np.linspace(0., 1., n), np.linspace(0., 2., n), indexing='ij')
+        idx = np.arange(n * n).reshape(n, n)
+        a, b, c, d = idx[:-1, :-1], idx[1:, :-1], idx[:-1, 1:], idx[1:, 1:]
+        grid = threemf.mesh.Mesh(
+            np.stack((x.ravel(), y.ravel(), np.zeros(n * n)), axis=1),
+            np.concatenate((np.stack((a, b, c), -1).reshape(-1, 3), np.stack((c, b, d), -1).reshape(-1, 3)))
+        )
+
+        flat = grid.decimate(max_error=1e-9)
+
+        self.assertLess(len(flat.triangle_array), 100)
+        self.assertAlmostEqual(flat.area(), 2.)
+        np.testing.assert_allclose(flat.vertex_array.min(axis=0), (0., 0., 0.), atol=1e-9)
+        np.testing.assert_allclose(flat.vertex_array.max(axis=0), (1., 2., 0.), atol=1e-9)
+        self.assertTrue(((flat.face_normals()[:, 2]) > 0.).all())
+
+    def test_closed_parts_kept(self):
+        cube = threemf.mesh.Mesh.FromSTL(threemf.geom.Cube(1., 1., 1.).stl_mesh())
+        cube.weld()
+
+        # A closed part goes down to a tetrahedron at most
+        for m in (cube, uv_sphere(10, 12)):
+            for target in (0, 2):
+                simple = m.decimate(target)
+
+                self.assertGreaterEqual(len(simple.triangle_array), 4)
+                self.assertGreaterEqual(len(simple.vertex_array), 4)
+                self.assertTrue(simple.is_watertight())
+                self.assertTrue(simple.is_winding_consistent())
+
+    def test_lod_chain(self):
+        chain = self.sphere.lod_chain((4000, 1000, 200))
+
+        self.assertEqual([len(m.triangle_array) for m in chain], [4000, 1000, 200])
+        for m in chain:
+            self.assertSphere(m, 0.1)
+
+        self.assertEqual(len(threemf.mesh.Mesh().decimate().triangle_array), 0)
+
+    def test_write(self):
+        tmf = threemf.ThreeMF()
+        obj = tmf.default_model.object_from_mesh(self.sphere.decimate(500))
+        tmf.default_model.build.add_item(obj)
+
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(tmf, f)
+
+            read = threemf.ThreeMF()
+            threemf.io.Reader().read(read, f)
+
+        np.testing.assert_array_equal(
+            read.default_model.objects[0].mesh.triangle_array,
+            obj.mesh.triangle_array
+        )
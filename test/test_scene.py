@@ -0,0 +1,111 @@
+import io
+import unittest
+
+import numpy as np
+import threemf
+
+def translation(x, y, z):
+    T = np.identity(4)
+    T[:3, 3] = (x, y, z)
+    return T
+
+def mirror_x():
+    T = np.identity(4)
+    T[0, 0] = -1.
+    return T
+
+class SceneTest(unittest.TestCase):
+    def setUp(self):
+        self.tmf = threemf.ThreeMF()
+        self.mdl = mdl = self.tmf.default_model
+
+        self.cube = mdl.object_from_stl(threemf.geom.Cube(1., 1., 1.).stl_mesh())
+        self.cube.mesh.weld()
+
+        # Two cubes side by side, and a pair of those stacked
+        self.pair = threemf.model.ObjectModel(2)
+        self.pair.add_component(self.cube, translation(0., 0., 0.))
+        self.pair.add_component(self.cube, translation(2., 0., 0.))
+        mdl.objects.append(self.pair)
+
+        self.stack = threemf.model.ObjectModel(3)
+        self.stack.add_component(self.pair, translation(0., 0., 0.))
+        self.stack.add_component(self.pair, translation(0., 0., 2.))
+        mdl.objects.append(self.stack)
+
+        mdl.build.add_item(self.stack, translation(10., 0., 0.))
+        mdl.build.add_item(self.cube, mirror_x())
+
+    def test_flatten(self):
+        scene = threemf.scene.Scene(self.mdl)
+
+        ids, transforms = scene.flatten(self.stack.id)
+
+        self.assertEqual(ids.tolist(), [1] * 4)
+        np.testing.assert_array_equal(
+            transforms[:, :3, 3],
+            [(0., 0., 0.), (2., 0., 0.), (0., 0., 2.), (2., 0., 2.)]
+        )
+
+        # The pair is flattened once and reused by the stack
+        self.assertIs(scene.flatten(self.pair.id), scene._flattened[self.pair.id])
+
+    def test_instances(self):
+        scene = threemf.scene.Scene(self.mdl)
+        instances = scene.instances()
+
+        self.assertEqual([inst.item for inst in instances], [0, 0, 0, 0, 1])
+        self.assertTrue(all(inst.mesh is self.cube.mesh for inst in instances))
+
+        np.testing.assert_array_equal(instances[3].transform[:3, 3], (12., 0., 2.))
+        np.testing.assert_array_equal(
+            instances[3].vertices(),
+            self.cube.mesh.vertex_array + (12., 0., 2.)
+        )
+
+        self.assertEqual(len(scene.instances(-1)), 1)
+
+    def test_world_mesh(self):
+        scene = threemf.scene.Scene(self.mdl)
+
+        world = scene.mesh()
+        nverts = len(self.cube.mesh.vertex_array)
+
+        self.assertEqual(len(world.vertex_array), 5 * nverts)
+        self.assertEqual(len(world.triangle_array), 5 * len(self.cube.mesh.triangle_array))
+        np.testing.assert_array_equal(world.vertex_array, scene.vertices())
+
+        # The mirrored cube keeps facing outwards
+        self.assertAlmostEqual(world.volume(), 5.)
+        self.assertTrue(world.is_watertight())
+
+        item = scene.mesh(0)
+        np.testing.assert_array_equal(item.vertex_array.min(axis=0), (9.5, -0.5, -0.5))
+        np.testing.assert_array_equal(item.vertex_array.max(axis=0), (12.5, 0.5, 2.5))
+
+    def test_errors(self):
+        self.cube.add_component(self.stack)
+
+        with self.assertRaises(threemf.ThreeMFException):
+            threemf.scene.Scene(self.mdl).instances()
+
+        self.cube.components = []
+        self.mdl.build.add_item(threemf.model.ObjectModel(42))
+
+        with self.assertRaises(threemf.ThreeMFException):
+            threemf.scene.Scene(self.mdl).instances()
+
+    def test_lazy_read(self):
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(self.tmf, f)
+
+            tmf = threemf.ThreeMF()
+            threemf.io.Reader(lazy=True).read(tmf, f)
+
+            scene = threemf.scene.Scene(tmf.default_model)
+            ids, _ = scene.flatten(3)
+
+            self.assertEqual(ids.tolist(), [1] * 4)
+            self.assertFalse(tmf.default_model.objects[0].mesh_loaded)
+
+            np.testing.assert_allclose(scene.vertices(), threemf.scene.Scene(self.mdl).vertices())
@@ -1,7 +1,11 @@
 import threemf
 import unittest
+import unittest.mock
 import io
+import pickle
+import zipfile
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 def write_and_read(tmf: threemf.ThreeMF) -> threemf.ThreeMF:
     writer = threemf.io.Writer()
@@ -81,6 +85,152 @@ class CubeTest(unittest.TestCase):
         self.assertEqual(mdl.get_meta_data('cura:infill_pattern').value, 'grid')
         self.assertEqual(int(mdl.get_meta_data('cura:infill_sparse_density').value), 50)
 
+class IndexTest(unittest.TestCase):
+    def test_objects(self):
+        mdl = threemf.model.Model('3D/3dmodel.model')
+
+        objs = [threemf.model.ObjectModel(i) for i in range(1, 6)]
+        mdl.objects.extend(objs[:3])
+        mdl.objects.append(objs[3])
+
+        self.assertIs(mdl.get_object(2), objs[1])
+        self.assertIs(mdl.get_object(4), objs[3])
+
+        mdl.objects.remove(objs[1])
+        self.assertRaises(KeyError, mdl.get_object, 2)
+
+        mdl.objects.insert(0, objs[4])
+        self.assertIs(mdl.get_object(5), objs[4])
+
+        del mdl.objects[0]
+        self.assertRaises(KeyError, mdl.get_object, 5)
+
+        mdl.objects[0] = objs[1]
+        self.assertIs(mdl.get_object(2), objs[1])
+        self.assertRaises(KeyError, mdl.get_object, 1)
+
+        mdl.objects = objs
+        self.assertIs(mdl.get_object(1), objs[0])
+        self.assertEqual(mdl.objects, objs)
+
+    def test_metadata(self):
+        obj = threemf.model.ObjectModel(1)
+
+        obj.add_meta_data('name', 'first')
+        obj.add_meta_data('name', 'second')
+        obj.add_meta_data_cura('infill_pattern', 'grid')
+
+        self.assertEqual(obj.get_meta_data('name').value, 'first')
+        self.assertTrue(obj.has_meta_data('cura:infill_pattern'))
+        self.assertFalse(obj.has_meta_data('infill_pattern'))
+        self.assertRaises(StopIteration, obj.get_meta_data, 'infill_pattern')
+
+        obj.metadata.pop(0)
+        self.assertEqual(obj.get_meta_data('name').value, 'second')
+
+        copy = pickle.loads(pickle.dumps(obj))
+        self.assertEqual(copy.get_meta_data('cura:infill_pattern').value, 'grid')
+        copy.add_meta_data('extra', '1')
+        self.assertTrue(copy.has_meta_data('extra'))
+
+class CompactModelTest(unittest.TestCase):
+    def test_slots(self):
+        for obj in (
+            threemf.model.BuildItem(1), threemf.model.Component(1, None),
+            threemf.model.Metadata('name', 'value'), threemf.model.ObjectModel(1),
+            threemf.mesh.Vertex(), threemf.mesh.Triangle()
+        ):
+            self.assertFalse(hasattr(obj, '__dict__'), type(obj).__name__)
+
+    def test_shared_identity(self):
+        item = threemf.model.BuildItem(1)
+        component = threemf.model.Component(1, None)
+
+        self.assertIs(item.transform, threemf.model.IDENTITY)
+        self.assertIs(component.transform, threemf.model.IDENTITY)
+
+        with self.assertRaises(ValueError):
+            item.transform[0, 3] = 1.
+
+        parse = threemf.model.Model._transform_from_string
+        self.assertIs(parse('1 0 0 0 1 0 0 0 1 0 0 0'), threemf.model.IDENTITY)
+        self.assertIs(parse(None), threemf.model.IDENTITY)
+
+        T = parse('1 0 0 0 1 0 0 0 1 5 0 0')
+        self.assertEqual(T[0, 3], 5.)
+        T[0, 3] = 6.
+
+class TransformCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+
+        transforms = np.tile(np.identity(4), (5, 1, 1))
+        transforms[:, :3] = rng.normal(size=(5, 3, 4))
+        transforms = [threemf.model.IDENTITY, np.identity(4)] + list(transforms)
+
+        strings = threemf.model._transform_strings(transforms)
+
+        self.assertEqual(strings[0], '1.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0')
+        self.assertEqual(strings[1], strings[0])
+        self.assertEqual(strings[2].split()[9:], [repr(v) for v in transforms[2][:3, 3].tolist()])
+
+        parsed = threemf.model._transforms_from_strings(strings + [None])
+
+        self.assertIs(parsed[0], threemf.model.IDENTITY)
+        self.assertIs(parsed[1], threemf.model.IDENTITY)
+        self.assertIs(parsed[-1], threemf.model.IDENTITY)
+        for T, expected in zip(parsed[2:], transforms[2:]):
+            np.testing.assert_array_equal(T, expected)
+
+        # Any whitespace separates the values
+        T, = threemf.model._transforms_from_strings(['\t1 0 0  0 1 0\n0 0 1 1 2 3 '])
+        np.testing.assert_array_equal(T[:3, 3], (1., 2., 3.))
+
+    def test_invalid(self):
+        parse = threemf.model._transforms_from_strings
+        valid = '1 0 0 0 1 0 0 0 1 5 6 7'
+
+        for invalid in ('1 0 0', '1 0 0 0 1 0 0 0 1 5 6 7 8', '1 0 0 0 1 0 0 0 1 5 6 x', '1_0 0 0 0 1 0 0 0 1 5 6 7'):
+            with self.assertRaises(ValueError):
+                parse([valid, invalid])
+
+        # 11 spaces each, but 11 and 13 values
+        with self.assertRaises(ValueError):
+            parse([' 1 0 0 0 1 0 0 0 1 5 6', '1 0 0 0 1 0 0 0 1 7 8 9\t4'])
+
+    def test_model(self):
+        tmf = threemf.ThreeMF()
+        mdl = tmf.default_model
+
+        part = mdl.object_from_stl(threemf.geom.Cube(1., 1., 1.).stl_mesh())
+
+        assembly = threemf.model.ObjectModel(2)
+        for i in range(50):
+            T = np.identity(4)
+            T[:3, 3] = (i, 0.5 * i, 0.)
+            assembly.add_component(part, T)
+        assembly.add_component(part)
+        mdl.objects.append(assembly)
+
+        mdl.build.add_item(assembly)
+        mdl.build.add_item(part, np.diag((2., 2., 2., 1.)))
+
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(tmf, f)
+
+            read = threemf.ThreeMF()
+            threemf.io.Reader().read(read, f)
+
+        components = read.default_model.get_object(2).components
+        self.assertEqual(len(components), 51)
+        for c, expected in zip(components, assembly.components):
+            np.testing.assert_array_equal(c.transform, expected.transform)
+        self.assertIs(components[-1].transform, threemf.model.IDENTITY)
+
+        items = read.default_model.build.items
+        self.assertIs(items[0].transform, threemf.model.IDENTITY)
+        np.testing.assert_array_equal(items[1].transform, np.diag((2., 2., 2., 1.)))
+
 class TestExtension(threemf.extension.Extension):
     Name = 'TestExtension'
 
@@ -190,3 +340,630 @@ class ComponentTest(unittest.TestCase):
         self.assertTrue(np.array_equal(component.transform, self.componentT))
 
 
+
+MODEL_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<model unit="millimeter" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">
+  <resources>
+    <object id="1" type="model">
+      <mesh>
+        <vertices>
+          <vertex x="0" y="0" z="0"/>
+          <vertex x="1.5" y="0" z="0"/>
+          <vertex x="0" y="2.5" z="0"/>
+          <vertex x="0" y="0" z="3.5"/>
+        </vertices>
+        <triangles>
+          <triangle v1="0" v2="2" v3="1"/>
+          <triangle v1="0" v2="1" v3="3"/>
+          <triangle v1="1" v2="2" v3="3"/>
+          <triangle v1="0" v2="3" v3="2"/>
+        </triangles>
+      </mesh>
+      <metadatagroup>
+        <metadata name="cura:infill_pattern" preserve="True" type="xs:string">grid</metadata>
+      </metadatagroup>
+    </object>
+    <object id="2" type="model">
+      <components>
+        <component objectid="1" transform="1 0 0 0 1 0 0 0 1 10 20 30"/>
+      </components>
+    </object>
+  </resources>
+  <build>
+    <item objectid="2" transform="1 0 0 0 1 0 0 0 1 5 5 0"/>
+  </build>
+</model>
+'''
+
+class StreamingReadTest(unittest.TestCase):
+    def test_events_match_tree(self):
+        tree_mdl = threemf.model.Model('3D/3dmodel.model')
+        root = threemf._iterparse(io.BytesIO(MODEL_XML))
+        for _, el in root:
+            el.tag = el.tag.partition('}')[2] or el.tag
+        tree_mdl.deserialize(root.root)
+
+        stream_mdl = threemf.model.Model('3D/3dmodel.model')
+        stream_mdl.deserialize_events(threemf._iterparse(io.BytesIO(MODEL_XML), events=('start', 'end')))
+
+        for mdl in (tree_mdl, stream_mdl):
+            self.assertEqual(len(mdl.objects), 2)
+            self.assertEqual(len(mdl.build.items), 1)
+
+            obj1, obj2 = mdl.objects
+
+            self.assertEqual(obj1.mesh.vertex_array.shape, (4, 3))
+            self.assertEqual(obj1.mesh.vertex_array[2, 1], 2.5)
+            self.assertTrue(np.array_equal(obj1.mesh.triangle_array[0], [0, 2, 1]))
+            self.assertEqual(obj1.get_meta_data('cura:infill_pattern').value, 'grid')
+
+            self.assertEqual(len(obj2.mesh.vertices), 0)
+            self.assertEqual(obj2.components[0].objectid, 1)
+            self.assertEqual(obj2.components[0].transform[2, 3], 30.)
+            self.assertEqual(mdl.build.items[0].transform[0, 3], 5.)
+
+class ChunkedWriteTest(unittest.TestCase):
+    def test_write_matches_serialize(self):
+        mdl = threemf.model.Model('3D/3dmodel.model')
+        mdl.deserialize_events(threemf._iterparse(io.BytesIO(MODEL_XML), events=('start', 'end')))
+        mdl.objects[0].mesh.vertex_array[1, 0] = 0.1 + 0.2
+
+        with io.BytesIO() as f:
+            mdl.write(f)
+            written = f.getvalue()
+
+        serialized = threemf.xml.tostring(mdl.serialize(), encoding='utf8')
+
+        def canonical(xmlbytes):
+            root = threemf.xml.fromstring(xmlbytes)
+            return [(el.tag, sorted(el.attrib.items()), (el.text or '').strip()) for el in root.iter()]
+
+        self.assertEqual(canonical(written), canonical(serialized))
+
+        mdl2 = threemf.model.Model('3D/3dmodel.model')
+        mdl2.deserialize_events(threemf._iterparse(io.BytesIO(written), events=('start', 'end')))
+
+        self.assertEqual(mdl2.objects[0].mesh.vertex_array[1, 0], 0.1 + 0.2)
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.tmf = threemf.ThreeMF()
+
+        for path in ('3D/3dmodel.model', '3D/other.model'):
+            mdl = threemf.model.Model(path)
+            for i in range(5):
+                cube = mdl.object_from_stl(threemf.geom.Cube(i + 1., 2., 3.).stl_mesh())
+                cube.add_meta_data('index', i)
+                mdl.build.add_item(cube)
+            self.tmf.models.append(mdl)
+
+    def write(self, writer):
+        with io.BytesIO() as f:
+            writer.write(self.tmf, f)
+            return f.getvalue()
+
+    def members(self, data):
+        # Compare the member contents, the zip headers hold the write time
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            return [(name, z.read(name)) for name in z.namelist()]
+
+    def test_parallel_matches_serial(self):
+        serial = self.write(threemf.io.Writer())
+
+        for executor_cls in (ThreadPoolExecutor, ProcessPoolExecutor):
+            with executor_cls(2) as executor:
+                self.assertEqual(self.members(self.write(threemf.io.Writer(executor))), self.members(serial))
+
+                tmf2 = threemf.ThreeMF()
+                threemf.io.Reader(executor).read(tmf2, io.BytesIO(serial))
+
+            self.assertEqual([m.path for m in tmf2.models], ['3D/3dmodel.model', '3D/other.model'])
+
+            for mdl in tmf2.models:
+                self.assertEqual([o.id for o in mdl.objects], [1, 2, 3, 4, 5])
+                self.assertEqual([o.get_meta_data('index').value for o in mdl.objects], ['0', '1', '2', '3', '4'])
+                self.assertEqual(mdl.objects[4].mesh.vertex_array.max(), 2.5)
+
+class LazyReadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmf = threemf.ThreeMF()
+
+        mdl = self.tmf.default_model
+        for i in range(3):
+            cube = mdl.object_from_stl(threemf.geom.Cube(i + 1., 2., 3.).stl_mesh())
+            cube.add_meta_data('index', i)
+            mdl.build.add_item(cube)
+
+        empty = threemf.model.ObjectModel(4)
+        empty.add_component(mdl.objects[0])
+        mdl.objects.append(empty)
+
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(self.tmf, f)
+            self.zip_bytes = f.getvalue()
+
+    def test_lazy_read(self):
+        read_size = threemf.model._MeshSkippingReader._READ_SIZE
+
+        # Small reads put mesh tags across chunk boundaries
+        for size in (read_size, 1000, 7):
+            threemf.model._MeshSkippingReader._READ_SIZE = size
+            try:
+                tmf2 = threemf.ThreeMF()
+                with io.BytesIO(self.zip_bytes) as f:
+                    threemf.io.Reader(lazy=True).read(tmf2, f)
+
+                    objs = tmf2.default_model.objects
+
+                    self.assertEqual(len(objs), 4)
+                    self.assertFalse(any(o.mesh_loaded for o in objs))
+                    self.assertEqual(objs[2].get_meta_data('index').value, '2')
+                    self.assertEqual(objs[3].components[0].objectid, 1)
+
+                    for obj, orig in zip(objs, self.tmf.default_model.objects):
+                        self.assertTrue(np.array_equal(obj.mesh.vertex_array, orig.mesh.vertex_array))
+                        self.assertTrue(np.array_equal(obj.mesh.triangle_array, orig.mesh.triangle_array))
+                        self.assertTrue(obj.mesh_loaded)
+            finally:
+                threemf.model._MeshSkippingReader._READ_SIZE = read_size
+
+    def test_part_inflated_once(self):
+        tmf2 = threemf.ThreeMF()
+        with io.BytesIO(self.zip_bytes) as f:
+            threemf.io.Reader(lazy=True).read(tmf2, f)
+
+            objs = tmf2.default_model.objects
+            spools = {id(o._mesh_loader.source) for o in objs}
+            self.assertEqual(len(spools), 1)
+
+            zipf = objs[0]._mesh_loader.source.zipf
+            opened = []
+            open_member = zipf.open
+            zipf.open = lambda *args, **kwargs: opened.append(args) or open_member(*args, **kwargs)
+
+            # Loading the meshes in reverse order would inflate the part again
+            # for every mesh if the member was seeked
+            for obj, orig in zip(objs[::-1], self.tmf.default_model.objects[::-1]):
+                self.assertTrue(np.array_equal(obj.mesh.vertex_array, orig.mesh.vertex_array))
+
+            self.assertEqual(len(opened), 1)
+
+    def test_prefixed_mesh(self):
+        xmlbytes = MODEL_XML.replace(b'<model ', b'<model xmlns:m="http://schemas.microsoft.com/3dmanufacturing/core/2015/02" ')
+        xmlbytes = xmlbytes.replace(b'<mesh>', b'<m:mesh>').replace(b'</mesh>', b'</m:mesh>')
+
+        reader = threemf.model._MeshSkippingReader(io.BytesIO(xmlbytes))
+        mdl = threemf.model.Model('3D/3dmodel.model')
+
+        def mesh_loader(i):
+            start, end = reader.mesh_ranges[i]
+            return threemf.model._MeshLoader(xmlbytes, mdl.path, start, end, reader.root_start, threemf._iterparse)
+
+        mdl.deserialize_events(threemf._iterparse(reader, events=('start', 'end')), mesh_loader)
+
+        self.assertEqual(len(reader.mesh_ranges), 1)
+        self.assertEqual(mdl.objects[0].get_meta_data('cura:infill_pattern').value, 'grid')
+        self.assertEqual(mdl.objects[0].mesh.vertex_array.shape, (4, 3))
+        self.assertEqual(len(mdl.objects[1].mesh.vertices), 0)
+
+    def test_markup_that_looks_like_a_mesh(self):
+        xmlbytes = MODEL_XML.replace(
+            b'<resources>', b'<resources><!-- old <mesh> removed --><?tool <mesh>?>'
+        ).replace(
+            b'<vertices>', b'<!-- </mesh> --><vertices>'
+        ).replace(
+            b'>grid<', b' title="a>b"><![CDATA[<mesh></mesh>]]><'
+        )
+
+        read_size = threemf.model._MeshSkippingReader._READ_SIZE
+
+        for size in (read_size, 7):
+            threemf.model._MeshSkippingReader._READ_SIZE = size
+            try:
+                with io.BytesIO() as f:
+                    with zipfile.ZipFile(f, 'w') as z:
+                        tmf = threemf.ThreeMF()
+                        tmf.default_model
+                        z.writestr('[Content_Types].xml', threemf.xml.tostring(tmf._content_types_xml))
+                        z.writestr('_rels/.rels', threemf.xml.tostring(tmf._relationships_xml))
+                        z.writestr('3D/3dmodel.model', xmlbytes)
+                    data = f.getvalue()
+
+                for lazy in (False, True):
+                    tmf = threemf.ThreeMF()
+                    threemf.io.Reader(lazy=lazy).read(tmf, io.BytesIO(data))
+
+                    obj1, obj2 = tmf.default_model.objects
+                    self.assertEqual(obj1.mesh.vertex_array.shape, (4, 3))
+                    self.assertEqual(obj1.get_meta_data('cura:infill_pattern').value, '<mesh></mesh>')
+                    self.assertEqual(len(obj2.mesh.vertices), 0)
+                    self.assertEqual(obj2.components[0].objectid, 1)
+            finally:
+                threemf.model._MeshSkippingReader._READ_SIZE = read_size
+
+class StreamWriterTest(unittest.TestCase):
+    def test_matches_writer(self):
+        tmf = threemf.ThreeMF()
+        mdl = tmf.default_model
+
+        transform = np.identity(4)
+        transform[:3, 3] = [10., 20., 30.]
+
+        with io.BytesIO() as f:
+            with threemf.io.StreamWriter(f) as w:
+                for i in range(3):
+                    cube = w.object_from_mesh(threemf.mesh.Mesh.FromSTL(threemf.geom.Cube(i + 1., 2., 3.).stl_mesh()))
+
+                assembly = threemf.model.ObjectModel(10)
+                assembly.add_component(cube, transform)
+                w.add_object(assembly)
+
+                w.add_build_item(assembly)
+                w.add_build_item(1, transform)
+
+            streamed = f.getvalue()
+
+        for i in range(3):
+            mdl.object_from_stl(threemf.geom.Cube(i + 1., 2., 3.).stl_mesh())
+        assembly = threemf.model.ObjectModel(10)
+        assembly.add_component(mdl.objects[2], transform)
+        mdl.objects.append(assembly)
+        mdl.build.add_item(assembly)
+        mdl.build.items.append(threemf.model.BuildItem(1, transform))
+
+        with io.BytesIO() as f:
+            threemf.io.Writer().write(tmf, f)
+            written = f.getvalue()
+
+        with zipfile.ZipFile(io.BytesIO(streamed)) as zs, zipfile.ZipFile(io.BytesIO(written)) as zw:
+            self.assertEqual(zs.namelist(), zw.namelist())
+            for name in zs.namelist():
+                self.assertEqual(zs.read(name), zw.read(name))
+
+        tmf2 = threemf.ThreeMF()
+        threemf.io.Reader().read(tmf2, io.BytesIO(streamed))
+        self.assertEqual([o.id for o in tmf2.default_model.objects], [1, 2, 3, 10])
+        np.testing.assert_array_equal(tmf2.default_model.build.items[1].transform, transform)
+
+    def test_references_checked(self):
+        with io.BytesIO() as f:
+            with threemf.io.StreamWriter(f) as w:
+                cube = w.object_from_mesh(threemf.mesh.Mesh.FromSTL(threemf.geom.Cube(1., 2., 3.).stl_mesh()))
+
+                with self.assertRaises(threemf.ThreeMFException):
+                    w.add_object(cube)
+
+                assembly = threemf.model.ObjectModel(5)
+                assembly.components.append(threemf.model.Component(6, None))
+                with self.assertRaises(threemf.ThreeMFException):
+                    w.add_object(assembly)
+
+                w.add_build_item(7)
+
+                with self.assertRaises(threemf.ThreeMFException):
+                    w.close()
+
+class CompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmf = threemf.ThreeMF()
+        self.tmf.default_model.object_from_stl(threemf.geom.Cube(1., 2., 3.).stl_mesh())
+
+        ext = threemf.extension.Extension('Metadata')
+        for name in ('settings.json', 'thumbnail.png'):
+            asset = ext.make_asset(name)
+            ext.assets.append(asset)
+        ext.assets[0].content = {'infill': 20}
+        ext.assets[1].content = b'\x89PNG' + bytes(range(256)) * 4
+        self.tmf.extensions.append(ext)
+
+    def write(self, compression):
+        with io.BytesIO() as f:
+            threemf.io.Writer(compression=compression).write(self.tmf, f)
+            return f.getvalue()
+
+    def compress_types(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            return {info.filename: info.compress_type for info in z.infolist()}
+
+    def test_presets(self):
+        default = self.compress_types(self.write(None))
+        self.assertEqual(set(default.values()), {zipfile.ZIP_DEFLATED})
+
+        small = self.compress_types(self.write(threemf.io.Compression.SMALL))
+        self.assertEqual(small['3D/3dmodel.model'], zipfile.ZIP_DEFLATED)
+        self.assertEqual(small['[Content_Types].xml'], zipfile.ZIP_DEFLATED)
+        self.assertEqual(small['Metadata/settings.json'], zipfile.ZIP_LZMA)
+        self.assertEqual(small['Metadata/thumbnail.png'], zipfile.ZIP_STORED)
+
+        fast = self.compress_types(self.write(threemf.io.Compression.FAST))
+        self.assertEqual(fast['Metadata/thumbnail.png'], zipfile.ZIP_STORED)
+
+        for compression in (threemf.io.Compression.FAST, threemf.io.Compression.SMALL):
+            tmf2 = threemf.ThreeMF()
+            reader = threemf.io.Reader()
+            ext = reader.register_extension(lambda: threemf.extension.Extension('Metadata'))
+            reader.read(tmf2, io.BytesIO(self.write(compression)))
+
+            self.assertEqual(len(tmf2.default_model.objects[0].mesh.triangles), 12)
+            self.assertEqual({a.name: a.content for a in ext.assets}['settings.json'], {'infill': 20})
+
+    def test_stored(self):
+        stored = threemf.io.Compression(
+            core=(zipfile.ZIP_STORED, None),
+            assets=(zipfile.ZIP_DEFLATED, 9),
+            rules=[('*.json', (zipfile.ZIP_BZIP2, None))]
+        )
+        types = self.compress_types(self.write(stored))
+
+        self.assertEqual(types['3D/3dmodel.model'], zipfile.ZIP_STORED)
+        self.assertEqual(types['_rels/.rels'], zipfile.ZIP_STORED)
+        self.assertEqual(types['Metadata/settings.json'], zipfile.ZIP_BZIP2)
+        self.assertEqual(types['Metadata/thumbnail.png'], zipfile.ZIP_DEFLATED)
+
+    def test_core_must_be_deflate_or_stored(self):
+        with self.assertRaises(threemf.ThreeMFException):
+            threemf.io.Compression(core=(zipfile.ZIP_LZMA, None))
+
+class ExtensionAssetTest(unittest.TestCase):
+    def setUp(self):
+        tmf = threemf.ThreeMF()
+        tmf.default_model.object_from_stl(threemf.geom.Cube(1., 2., 3.).stl_mesh())
+
+        cura = threemf.extension.Cura()
+        for name, content in (('ucura.cfg', 'infill = 20\n' * 1000), ('thumbnail.png', b'\x89PNG' + bytes(4096))):
+            asset = cura.make_asset(name)
+            asset.content = content
+            cura.assets.append(asset)
+        tmf.extensions.append(cura)
+
+        meta = threemf.extension.Extension('Metadata')
+        settings = meta.make_asset('settings.json')
+        settings.content = {'layers': list(range(1000))}
+        meta.assets.append(settings)
+        tmf.extensions.append(meta)
+
+        with io.BytesIO() as f:
+            threemf.io.Writer(compression=threemf.io.Compression.FAST).write(tmf, f)
+            self.data = f.getvalue()
+
+    def read(self, lazy):
+        reader = threemf.io.Reader(lazy=lazy)
+        reader.register_extension(threemf.extension.Cura)
+        reader.register_extension(lambda: threemf.extension.Extension('Metadata'))
+
+        tmf = threemf.ThreeMF()
+        reader.read(tmf, io.BytesIO(self.data))
+        return tmf
+
+    def compressed(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            return {info.filename: (info.compress_size, info.CRC) for info in z.infolist()}
+
+    def test_lazy_assets(self):
+        tmf = self.read(lazy=True)
+        cura, meta = tmf.extensions
+
+        self.assertEqual([a.name for a in cura.assets], ['ucura.cfg', 'thumbnail.png'])
+        self.assertFalse(any(a.loaded for a in cura.assets + meta.assets))
+
+        self.assertEqual(cura.assets[0].content, b'infill = 20\n' * 1000)
+        self.assertTrue(cura.assets[0].loaded)
+        self.assertFalse(cura.assets[1].loaded)
+        self.assertEqual(meta.assets[0].content['layers'][-1], 999)
+
+    def test_deserialize_overridden(self):
+        class Thumbnail(threemf.extension.Asset):
+            def serialize(self):
+                return self.image
+
+            def deserialize(self, data):
+                self.image = data
+
+        class Thumbnails(threemf.extension.Cura):
+            @classmethod
+            def make_asset(cls, name):
+                return Thumbnail(name)
+
+        for lazy in (False, True):
+            reader = threemf.io.Reader(lazy=lazy)
+            cura = reader.register_extension(Thumbnails)
+
+            reader.read(threemf.ThreeMF(), io.BytesIO(self.data))
+
+            self.assertEqual(cura.assets[1].image, b'\x89PNG' + bytes(4096))
+            self.assertIsNone(cura.assets[1].content)
+
+    def test_raw_copy(self):
+        for lazy in (False, True):
+            tmf = self.read(lazy)
+            cura, meta = tmf.extensions
+
+            # Changed in place, so it has to be written again
+            meta.assets[0].content['layers'] = []
+
+            with io.BytesIO() as f:
+                threemf.io.Writer().write(tmf, f)
+                data = f.getvalue()
+
+            before = self.compressed(self.data)
+            after = self.compressed(data)
+
+            # Written at level 1 and copied, not recompressed at the default level
+            self.assertEqual(after['Cura/ucura.cfg'], before['Cura/ucura.cfg'])
+
+            # Stored by the FAST preset, so it is compressed as the policy asks
+            self.assertLess(after['Cura/thumbnail.png'][0], before['Cura/thumbnail.png'][0])
+
+            self.assertNotEqual(after['Metadata/settings.json'], before['Metadata/settings.json'])
+
+            with zipfile.ZipFile(io.BytesIO(data)) as z:
+                self.assertEqual(z.testzip(), None)
+                self.assertEqual(z.read('Cura/ucura.cfg'), b'infill = 20\n' * 1000)
+                self.assertEqual(z.read('Metadata/settings.json'), b'{"layers": []}')
+
+class PassthroughWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.data = self.zip_model(MODEL_XML)
+
+    @staticmethod
+    def zip_model(model_xml):
+        tmf = threemf.ThreeMF()
+        tmf.default_model
+
+        # Written at level 1, so copies can be told apart from data deflated
+        # again at the default level
+        with io.BytesIO() as f:
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+                z.writestr('[Content_Types].xml', threemf.xml.tostring(tmf._content_types_xml))
+                z.writestr('_rels/.rels', threemf.xml.tostring(tmf._relationships_xml))
+                z.writestr('3D/3dmodel.model', model_xml)
+            return f.getvalue()
+
+    def read(self, lazy=False):
+        tmf = threemf.ThreeMF()
+        threemf.io.Reader(lazy=lazy).read(tmf, io.BytesIO(self.data))
+        return tmf
+
+    def write(self, tmf, compression=None):
+        with io.BytesIO() as f:
+            threemf.io.Writer(compression=compression).write(tmf, f)
+            data = f.getvalue()
+
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            return z.getinfo('3D/3dmodel.model'), z.read('3D/3dmodel.model')
+
+    def source_info(self):
+        with zipfile.ZipFile(io.BytesIO(self.data)) as z:
+            return z.getinfo('3D/3dmodel.model')
+
+    def test_unchanged_model_copied(self):
+        for lazy in (False, True):
+            tmf = self.read(lazy)
+            tmf.default_model.objects[0].mesh.vertex_array
+
+            info, model_xml = self.write(tmf)
+
+            self.assertEqual(model_xml, MODEL_XML)
+            self.assertEqual(info.compress_size, self.source_info().compress_size)
+
+    def test_compression_level(self):
+        small = threemf.io.Compression.SMALL
+
+        # zipfile records every level as normal, so the member deflated at
+        # level 1 is only copied at the default level
+        info, model_xml = self.write(self.read(), small)
+        self.assertNotEqual(info.compress_size, self.source_info().compress_size)
+
+        # Recorded as deflated at the maximum level
+        for compression, copied in ((small, True), (None, False)):
+            tmf = self.read()
+            tmf.default_model._source.info.flag_bits |= 0x02
+
+            info, model_xml = self.write(tmf, compression)
+            self.assertEqual(model_xml == MODEL_XML, copied)
+            self.assertEqual(info.compress_size == self.source_info().compress_size, copied)
+
+    def test_zipfile_internals_missing(self):
+        # Without the ZipFile internals the copy falls back to compressing
+        with unittest.mock.patch.object(threemf._zip, '_WRITER_INTERNALS', ('_missing', )):
+            info, model_xml = self.write(self.read())
+
+        self.assertNotEqual(model_xml, MODEL_XML)
+        self.assertNotEqual(info.compress_size, self.source_info().compress_size)
+
+    def test_unchanged_mesh_copied(self):
+        for lazy in (False, True):
+            tmf = self.read(lazy)
+            obj = tmf.default_model.objects[0]
+            obj.get_meta_data('cura:infill_pattern').value = 'gyroid'
+
+            info, model_xml = self.write(tmf)
+
+            self.assertNotEqual(info.compress_size, self.source_info().compress_size)
+            self.assertIn(b'gyroid', model_xml)
+
+            # The mesh element is copied byte for byte from the source
+            start = MODEL_XML.index(b'<mesh>')
+            end = MODEL_XML.index(b'</mesh>') + len(b'</mesh>')
+            self.assertIn(MODEL_XML[start:end], model_xml)
+
+            tmf2 = threemf.ThreeMF()
+            with io.BytesIO() as f:
+                threemf.io.Writer().write(tmf, f)
+                threemf.io.Reader().read(tmf2, io.BytesIO(f.getvalue()))
+
+            np.testing.assert_array_equal(tmf2.default_model.objects[0].mesh.vertex_array, obj.mesh.vertex_array)
+            self.assertEqual(tmf2.default_model.objects[0].get_meta_data('cura:infill_pattern').value, 'gyroid')
+
+    def test_prefix_declared_below_root(self):
+        self.data = self.zip_model(
+            MODEL_XML.replace(
+                b'<resources>', b'<resources xmlns:p="urn:p">'
+            ).replace(
+                b'<object id="1" type="model">', b'<object id="1" type="model" xmlns:q="urn:q">'
+            ).replace(
+                b'<mesh>', b'<mesh p:tag="1" q:tag="2">'
+            )
+        )
+
+        for lazy in (False, True):
+            tmf = self.read(lazy)
+            self.assertEqual(tmf.default_model.objects[0].mesh.vertex_array.shape, (4, 3))
+
+            tmf = self.read(lazy)
+            tmf.default_model.build.items[0].transform[0, 3] = 7.
+
+            _, model_xml = self.write(tmf)
+
+            # The mesh is copied with the declarations of the prefixes it uses
+            self.assertIn(b'p:tag="1" q:tag="2"', model_xml)
+
+            mesh = threemf.xml.fromstring(model_xml).find('.//{*}mesh')
+            self.assertEqual(mesh.get('{urn:p}tag'), '1')
+            self.assertEqual(mesh.get('{urn:q}tag'), '2')
+            self.assertEqual(len(mesh.findall('.//{*}vertex')), 4)
+
+    def test_property_references_not_copied(self):
+        materials = MODEL_XML.replace(
+            b'<resources>', b'<resources><basematerials id="5"><base name="Red" displaycolor="#FF0000"/></basematerials>'
+        )
+        reference = (b'<triangle v1="0" v2="2" v3="1"/>', b'<triangle v1="0" v2="2" v3="1" pid="5" p1="0"/>')
+
+        # Only objects are written to the resources, so neither the meshes
+        # of a model with materials nor meshes that refer to them are copied
+        for model_xml in (materials, MODEL_XML.replace(*reference), materials.replace(*reference)):
+            self.data = self.zip_model(model_xml)
+
+            for lazy in (False, True):
+                tmf = self.read(lazy)
+                tmf.default_model.objects[1].add_meta_data('edited', 1)
+
+                _, written = self.write(tmf)
+
+                self.assertNotIn(b'pid=', written)
+                self.assertNotIn(b'<mesh>\n', written)
+                self.assertEqual(len(threemf.xml.fromstring(written).findall('.//{*}triangle')), 4)
+
+    def test_changes_written(self):
+        tmf = self.read()
+        mdl = tmf.default_model
+        mdl.objects[0].mesh.vertex_array[1, 0] = 4.25
+
+        _, model_xml = self.write(tmf)
+        self.assertIn(b'x="4.25"', model_xml)
+        self.assertNotIn(b'<mesh>\n', model_xml)
+
+        tmf = self.read()
+        mdl = tmf.default_model
+        mdl.build.items[0].transform[0, 3] = 7.
+
+        _, model_xml = self.write(tmf)
+        self.assertIn(b'7.0', model_xml)
+        self.assertIn(b'<mesh>\n', model_xml)
+
+        tmf = self.read()
+        tmf.default_model.objects[0].mesh = threemf.mesh.Mesh.FromSTL(threemf.geom.Cube(1., 2., 3.).stl_mesh())
+
+        _, model_xml = self.write(tmf)
+        self.assertEqual(model_xml.count(b'<triangle '), 12)
@@ -0,0 +1,132 @@
+import io
+import unittest
+
+import numpy as np
+import threemf
+
+from threemf import xmlparse
+from .test_simple import MODEL_XML
+
+BILLION_LAUGHS = b'''<?xml version="1.0"?>
+<!DOCTYPE lolz [
+  <!ENTITY lol "lol">
+  <!ENTITY lol2 "&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;">
+  <!ENTITY lol3 "&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;">
+]>
+<model><metadata name="Title">&lol3;</metadata></model>
+'''
+
+EXTERNAL_ENTITY = b'''<?xml version="1.0"?>
+<!DOCTYPE model [<!ENTITY secret SYSTEM "file:///etc/passwd">]>
+<model><metadata name="Title">&secret;</metadata></model>
+'''
+
+class TrickleReader:
+    '''
+    A file-like object that returns at most size bytes per read, so elements
+    are split across parser calls
+    '''
+    def __init__(self, data, size):
+        self.f = io.BytesIO(data)
+        self.size = size
+
+    def read(self, n=-1):
+        return self.f.read(self.size if n < 0 else min(n, self.size))
+
+def read_model(backend, source):
+    mdl = threemf.model.Model('3D/3dmodel.model')
+    mdl.deserialize_events(xmlparse.get_backend(backend).iterparse(source, events=('start', 'end')))
+    return mdl
+
+def model_bytes(ntris) -> bytes:
+    mdl = threemf.model.Model('3D/3dmodel.model')
+    for i in range(2):
+        obj = mdl.object_from_stl(threemf.geom.Cube(1., 2., 3. + i).stl_mesh())
+        obj.mesh.weld()
+        mdl.build.add_item(obj)
+
+    big = threemf.mesh.Mesh(
+        np.random.default_rng(0).random((ntris, 3)),
+        np.arange(3 * ntris).reshape(-1, 3) % ntris
+    )
+    mdl.build.add_item(mdl.object_from_mesh(big))
+
+    with io.BytesIO() as f:
+        mdl.write(f)
+        return f.getvalue()
+
+class BackendTest(unittest.TestCase):
+    def assertModelsEqual(self, expected, actual):
+        self.assertEqual(len(expected.objects), len(actual.objects))
+
+        for a, b in zip(expected.objects, actual.objects):
+            self.assertEqual(a.id, b.id)
+            self.assertTrue(np.array_equal(a.mesh.vertex_array, b.mesh.vertex_array))
+            self.assertTrue(np.array_equal(a.mesh.triangle_array, b.mesh.triangle_array))
+            self.assertEqual([c.objectid for c in a.components], [c.objectid for c in b.components])
+
+        self.assertEqual(len(expected.build.items), len(actual.build.items))
+
+        for a, b in zip(expected.build.items, actual.build.items):
+            self.assertEqual(a.objectid, b.objectid)
+            self.assertTrue(np.array_equal(a.transform, b.transform))
+
+    def test_backends_read_the_same(self):
+        data = model_bytes(2000)
+        expected = read_model('stdlib', io.BytesIO(data))
+
+        self.assertEqual(len(expected.objects[2].mesh.triangle_array), 2000)
+
+        for name in xmlparse.available_backends():
+            with self.subTest(backend=name):
+                self.assertModelsEqual(expected, read_model(name, io.BytesIO(data)))
+
+                # Elements split between reads, also around the switch to
+                # reading mesh arrays directly
+                for size in (1, 7, 100, 4096):
+                    self.assertModelsEqual(expected, read_model(name, TrickleReader(data, size)))
+
+                mdl = read_model(name, io.BytesIO(MODEL_XML))
+                self.assertEqual(mdl.objects[0].mesh.vertex_array[2, 1], 2.5)
+                self.assertEqual(mdl.objects[0].get_meta_data('cura:infill_pattern').value, 'grid')
+                self.assertEqual(mdl.build.items[0].transform[0, 3], 5.)
+
+    def test_tree(self):
+        for name in xmlparse.available_backends():
+            with self.subTest(backend=name):
+                it = xmlparse.get_backend(name).iterparse(io.BytesIO(MODEL_XML))
+                tags = [el.tag.partition('}')[2] for _, el in it]
+
+                self.assertEqual(tags[0], 'vertex')
+                self.assertEqual(tags[-1], 'model')
+                self.assertEqual(it.root.get('unit'), 'millimeter')
+                self.assertEqual(len(it.root.findall('.//{*}vertex')), 4)
+                self.assertEqual(it.root.find('.//{*}metadata').text, 'grid')
+
+    def test_dtd_rejected(self):
+        for name in xmlparse.available_backends():
+            # Also encoded as UTF-16 with a byte order mark, where the bytes
+            # of <!DOCTYPE are not found as such
+            for document in (BILLION_LAUGHS, EXTERNAL_ENTITY, BILLION_LAUGHS.decode().encode('utf-16')):
+                with self.subTest(backend=name), self.assertRaises(threemf.ThreeMFException):
+                    list(xmlparse.get_backend(name).iterparse(TrickleReader(document, 5)))
+
+    def test_get_backend(self):
+        self.assertIn(type(xmlparse.get_backend()).name, xmlparse.available_backends())
+        self.assertIsInstance(xmlparse.get_backend('stdlib'), xmlparse.StdlibBackend)
+
+        with self.assertRaises(ValueError):
+            xmlparse.get_backend('sax')
+
+    def test_use_backend(self):
+        try:
+            threemf.use_backend('stdlib')
+            self.assertEqual(threemf._iterparse.__self__.name, 'stdlib')
+
+            threemf.use_safe_parser(False)
+            self.assertEqual(threemf._iterparse.__self__.name, type(xmlparse.get_backend()).name)
+        finally:
+            threemf.use_backend()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,23 @@
 import os
-import xml.etree.cElementTree as xml
-from io import StringIO
-
-_iterparse = xml.iterparse
+import xml.etree.ElementTree as xml
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+
+def use_backend(name: str = None):
+    '''
+    Selects the XML parser backend used for reading, by its name in
+    xmlparse.BACKENDS, or the fastest available one if name is None
+    '''
+    global _iterparse
+    _iterparse = xmlparse.get_backend(name).iterparse
 
 def use_safe_parser(use: bool = True):
-    from defusedxml.cElementTree import iterparse
-    global _iterparse
-    _iterparse = iterparse
+    '''
+    Reads with defusedxml if use is True, which must be installed, or with
+    the default backend otherwise. Document type declarations, and with them
+    entity expansion, are rejected by every backend either way.
+    '''
+    use_backend('defusedxml' if use else None)
 
 class ThreeMF:
     _THREED_MODEL_PATH = '3D/3dmodel.model'
@@ -38,9 +48,9 @@ class ThreeMF:
 
         root.set('xmlns', 'http://schemas.openxmlformats.org/package/2006/relationships')
 
-        for m in self.models:
+        for i, m in enumerate(self.models):
             rel = xml.Element('Relationship')
-            rel.set('Id', 'rel0')
+            rel.set('Id', 'rel{}'.format(i))
             rel.set('Target', m.path)
             rel.set('Type', 'http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel')
 
@@ -69,7 +79,7 @@ class ThreeMF:
 
         return root
 
-    def _load(self, zipf, ct_xml, rels_xml):
+    def _load(self, zipf, ct_xml, rels_xml, executor=None, lazy=False, binary_mesh=False):
         # TODO load extensions from content types XML?
 
         def strip_ns(xmlstring):
@@ -87,21 +97,113 @@ class ThreeMF:
             if rel.get('Type').endswith('3dmodel'):
                 path = rel.get('Target')
                 if path:
-                    model_paths.append(path)
+                    model_paths.append(path.lstrip('/\\'))
 
-        # for each model path create a new Model object and add it to models
         for p in model_paths:
-            p = p.lstrip('/\\')
             if p not in zipf.namelist():
                 raise Exception('Could not find referenced target in zip file: {}'.format(p))
-            xmlstring = zipf.read(p).decode('utf-8')
-            mdl_root = strip_ns(xmlstring)
-            mdl = model.Model(p)
-            mdl.deserialize(mdl_root)
-            self.models.append(mdl)
+
+        if executor is None:
+            # for each model path create a new Model object and add it to models
+            models = [_read_model(p, zipf, _iterparse, lazy, binary_mesh) for p in model_paths]
+        else:
+            if isinstance(executor, ProcessPoolExecutor):
+                # Neither the zip file nor its member streams can be sent to
+                # another process, so send the decompressed bytes instead.
+                # Parts with a sidecar are read with their meshes skipped,
+                # the meshes are then mapped from the sidecar here.
+                sidecars = [binary_mesh and binary.sidecar_path(p) in zipf.namelist() for p in model_paths]
+                futures = [
+                    executor.submit(_read_model, p, zipf.read(p), _iterparse, lazy or sidecar)
+                    for p, sidecar in zip(model_paths, sidecars)
+                ]
+            else:
+                sidecars = [False] * len(model_paths)
+                futures = [executor.submit(_read_model, p, zipf, _iterparse, lazy, binary_mesh) for p in model_paths]
+
+            # Collect the models in relationship order, regardless of which
+            # finished first
+            models = [f.result() for f in futures]
+
+            for i, (p, sidecar) in enumerate(zip(model_paths, sidecars)):
+                if sidecar and not _read_sidecar(models[i], zipf) and not lazy:
+                    # The sidecar does not match the XML, parse the meshes
+                    # after all
+                    models[i] = executor.submit(_read_model, p, zipf.read(p), _iterparse).result()
+
+        for p, mdl in zip(model_paths, models):
+            # Writers copy the parts of the model that are unchanged from here
+            mdl._source = _zip.Member(zipf, zipf.getinfo(p))
+
+        self.models.extend(models)
+
+def _read_model(path, source, iterparse, lazy=False, binary_mesh=False):
+    '''
+    Parses the model part at path of the zip file source, or from the bytes
+    of that part, with the given iterparse function. If lazy is True the
+    meshes are skipped and only loaded when an object's mesh is accessed.
+    If binary_mesh is True and the model has a binary mesh sidecar that
+    matches it, the meshes are taken from the sidecar instead.
+    '''
+    use_sidecar = (
+        binary_mesh and not isinstance(source, bytes)
+        and binary.sidecar_path(path) in source.namelist()
+    )
+
+    mdl = model.Model(path)
+
+    if isinstance(source, bytes):
+        f = BytesIO(source)
+    else:
+        # Parse straight from the (decompressing) member stream so the
+        # model XML is never held in memory as a whole
+        f = source.open(path)
+
+    with f:
+        if lazy or use_sidecar:
+            reader = model._MeshSkippingReader(f)
+
+            # The loaders of all meshes of the part share one inflated copy
+            spool = source if isinstance(source, bytes) else model._PartSpool(source, path)
+
+            def mesh_loader(i):
+                start, end = reader.mesh_ranges[i]
+                return model._MeshLoader(spool, path, start, end, reader.root_start, iterparse, reader.mesh_namespaces[i])
+
+            mdl.deserialize_events(iterparse(reader, events=('start', 'end')), mesh_loader)
+            mdl._source_layout = reader.layout()
+        else:
+            mdl.deserialize_events(iterparse(f, events=('start', 'end')))
+
+    if use_sidecar and not _read_sidecar(mdl, source) and not lazy:
+        # The sidecar does not match the XML, parse the meshes after all
+        return _read_model(path, source, iterparse)
+
+    mdl._source_state = mdl._state()
+
+    return mdl
+
+def _read_sidecar(mdl, zipf):
+    '''
+    Sets the meshes of mdl, read with its meshes skipped, from its binary
+    mesh sidecar in zipf. Returns False if the sidecar does not match.
+    '''
+    meshes = binary.read(zipf, mdl)
+
+    if meshes is None:
+        return False
+
+    for obj, m in zip(mdl.objects, meshes):
+        index = obj._source_mesh[0]
+        obj.mesh = m
+        obj._set_source_mesh(index)
+
+    return True
 
 class ThreeMFException(Exception):
     pass
 
 from ._version import __version__
-from . import extension, geom, mesh, model, io
+from . import _zip, bvh, extension, geom, mesh, model, binary, io, cache, scene, simplify, aio, xmlparse
+
+_iterparse = xmlparse.get_backend().iterparse
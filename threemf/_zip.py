@@ -0,0 +1,181 @@
+'''
+Helpers for reading and copying zip members that zipfile does not provide
+'''
+
+import bisect
+import struct
+import weakref
+import zipfile
+
+_LOCAL_HEADER_SIZE = 30
+_FLAG_ENCRYPTED = 0x01
+_FLAG_DATA_DESCRIPTOR = 0x08
+# Bits 1 and 2 of the flags of a deflated member record its level
+_FLAG_DEFLATE_OPTION = 0x06
+
+# Attributes of ZipFile that copy_member writes through. They are not part of
+# the zipfile API, so without them members are compressed again instead.
+_WRITER_INTERNALS = ('_lock', '_writing', '_seekable', '_didModify', '_writecheck', 'start_dir', 'filelist', 'NameToInfo')
+
+class Index:
+    '''
+    The members of a zip file sorted by name, for finding all members under
+    a directory without scanning the whole archive
+    '''
+
+    def __init__(self, zipf : zipfile.ZipFile):
+        infos = zipf.infolist()
+        order = sorted(range(len(infos)), key=lambda i: infos[i].filename)
+
+        self._names = [infos[i].filename for i in order]
+        self._positions = order
+        self._infos = [infos[i] for i in order]
+
+    def members(self, directory : str):
+        '''
+        Returns the members under directory in archive order, not including
+        the directory entry itself
+        '''
+        prefix = directory.rstrip('/') + '/'
+
+        lo = bisect.bisect_right(self._names, prefix)
+        # '0' is the character right after '/'
+        hi = bisect.bisect_left(self._names, prefix[:-1] + '0', lo)
+
+        found = sorted(range(lo, hi), key=lambda i: self._positions[i])
+
+        return [self._infos[i] for i in found]
+
+_indexes = weakref.WeakKeyDictionary()
+
+def index(zipf : zipfile.ZipFile) -> Index:
+    '''
+    Returns the Index of zipf, built on first use and shared by all callers
+    '''
+    idx = _indexes.get(zipf)
+
+    if idx is None:
+        idx = _indexes[zipf] = Index(zipf)
+
+    return idx
+
+class Member:
+    '''
+    A member of a zip file that is read when needed
+    '''
+
+    def __init__(self, zipf : zipfile.ZipFile, info : zipfile.ZipInfo):
+        self.zipf = zipf
+        self.info = info
+
+    def read(self) -> bytes:
+        return self.zipf.read(self.info)
+
+    @property
+    def available(self) -> bool:
+        '''
+        False once the zip file or the file it was opened from is closed
+        '''
+        fp = self.zipf.fp
+        return fp is not None and not getattr(fp, 'closed', False)
+
+def _copy_raw_data(member : Member, fp):
+    src = member.zipf
+    info = member.info
+
+    with src._lock:
+        src.fp.seek(info.header_offset)
+        header = src.fp.read(_LOCAL_HEADER_SIZE)
+
+        if header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile('Bad local file header for {}'.format(info.filename))
+
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        src.fp.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = src.fp.read(min(remaining, 1 << 20))
+            if not chunk:
+                raise zipfile.BadZipFile('Truncated data for {}'.format(info.filename))
+            fp.write(chunk)
+            remaining -= len(chunk)
+
+def _deflate_option(level) -> int:
+    '''
+    Returns the deflate option flag bits of level: normal, maximum (8 and 9),
+    fast (2) or super fast (1)
+    '''
+    if level in (8, 9):
+        return 0x02
+    if level == 2:
+        return 0x04
+    if level == 1:
+        return 0x06
+    return 0
+
+def _same_level(info : zipfile.ZipInfo, zipf) -> bool:
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        return info.flag_bits & _FLAG_DEFLATE_OPTION == _deflate_option(zipf.compresslevel)
+
+    # zipfile ignores the level of LZMA, and the level of bzip2 is not
+    # recorded in the member
+    return (info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_LZMA)
+            or zipf.compresslevel is None)
+
+def copy_member(member : Member, zipf, arcname : str) -> bool:
+    '''
+    Copies the compressed data of member into zipf as arcname, without
+    decompressing and compressing it again. The copy is only made if the
+    member is compressed with the method and level zipf would use for
+    arcname, and returns False otherwise, or if the member cannot be copied
+    raw.
+
+    The level of a deflated member is only known from its flag bits, which
+    zipfile leaves at normal for every level. Such members are copied when
+    zipf uses the default level, whatever level they were deflated at.
+
+    A wrapper that chooses the compression for each member can be passed as
+    zipf if it has a set_compression(arcname) method that configures and
+    returns the ZipFile.
+    '''
+    if member is None:
+        return False
+
+    set_compression = getattr(zipf, 'set_compression', None)
+    if set_compression is not None:
+        zipf = set_compression(arcname)
+
+    info = member.info
+
+    if (not member.available or not all(hasattr(zipf, a) for a in _WRITER_INTERNALS)
+            or zipf.fp is None or zipf._writing
+            or info.flag_bits & _FLAG_ENCRYPTED
+            or info.compress_type != zipf.compression or not _same_level(info, zipf)):
+        return False
+
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.flag_bits = info.flag_bits & ~_FLAG_DATA_DESCRIPTOR
+    zinfo.external_attr = info.external_attr
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+
+    with zipf._lock:
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+
+        if zipf._seekable:
+            zipf.fp.seek(zipf.start_dir)
+
+        zinfo.header_offset = zipf.fp.tell()
+        zipf.fp.write(zinfo.FileHeader())
+
+        _copy_raw_data(member, zipf.fp)
+
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+
+    return True
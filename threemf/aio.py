@@ -0,0 +1,279 @@
+'''
+Asynchronous reading and writing of 3MF files for asyncio services.
+
+Reading or writing a large 3MF file inflates and deflates the archive, parses
+or formats the model XML and builds the meshes, which takes seconds and would
+block the event loop. AsyncReader and AsyncWriter do all of that in worker
+threads and only move bytes on the event loop:
+
+    async with aio.AsyncReader(max_concurrency=4) as reader:
+        tmf = ThreeMF()
+        await reader.read(tmf, request.content)
+
+The input of a read is received from the async stream into a spooled
+temporary file, which stays in memory up to spool_size bytes and moves to
+disk beyond that, and is then read with an io.Reader in the executor. A write
+is done into such a file by an io.Writer in the executor and then sent to the
+async stream. At most max_concurrency reads or writes run in the executor at
+once; the others wait on the event loop. The spooled file is written and
+read in a few threads of its own, so receiving and sending neither block the
+event loop nor wait for a free worker of the executor.
+
+Cancelling a read or write raises CancelledError in the caller as usual. The
+worker thread cannot be interrupted, but it stops at its next access to the
+spooled file, which happens continuously while inflating, parsing and
+writing, and the concurrency slot is only released once it has stopped.
+'''
+
+import asyncio
+import concurrent.futures
+import inspect
+import os
+import tempfile
+import threading
+
+from . import ThreeMF, ThreeMFException, io
+
+# Size of the chunks received from and sent to async streams
+_CHUNK_SIZE = 1 << 20
+
+# Threads that move chunks between async streams and spooled files
+_IO_THREADS = 4
+_IO_THREAD_NAME = 'threemf-aio-io'
+
+class _Cancelled(Exception):
+    pass
+
+class _CancellableFile:
+    '''
+    A file whose reads and writes raise _Cancelled once cancelled is set, so
+    a reader or writer working on it in another thread stops
+    '''
+
+    # Without a name, zipfile does not reopen the file by name to memory-map
+    # binary mesh sidecars
+    name = None
+
+    def __init__(self, f, cancelled : threading.Event):
+        self._f = f
+        self._cancelled = cancelled
+
+    def _check(self):
+        if self._cancelled.is_set():
+            raise _Cancelled()
+
+    def read(self, *args):
+        self._check()
+        return self._f.read(*args)
+
+    def write(self, data):
+        self._check()
+        return self._f.write(data)
+
+    def seek(self, *args):
+        self._check()
+        return self._f.seek(*args)
+
+    def tell(self):
+        return self._f.tell()
+
+    def flush(self):
+        return self._f.flush()
+
+    def seekable(self):
+        return True
+
+    @property
+    def closed(self):
+        # Models read from the file only copy their parts from it while it
+        # is open
+        return self._f.closed
+
+async def _receive(stream, f, loop, executor):
+    '''
+    Copies the bytes of stream into the file f, writing in executor. stream
+    is bytes, an object with a read(size) coroutine such as
+    asyncio.StreamReader, or an async iterable of bytes.
+    '''
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        await loop.run_in_executor(executor, f.write, stream)
+    elif hasattr(stream, 'read'):
+        while True:
+            chunk = await stream.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            await loop.run_in_executor(executor, f.write, chunk)
+    elif hasattr(stream, '__aiter__'):
+        async for chunk in stream:
+            await loop.run_in_executor(executor, f.write, chunk)
+    else:
+        raise TypeError('Expected bytes, an async stream or an async iterable of bytes, got {}'.format(type(stream).__name__))
+
+    f.seek(0)
+
+async def _send(f, stream, loop, executor):
+    '''
+    Copies the file f to stream, reading in executor. stream is an object
+    with a write(data) method that may be a coroutine and an optional drain()
+    coroutine, such as asyncio.StreamWriter.
+    '''
+    f.seek(0)
+
+    drain = getattr(stream, 'drain', None)
+
+    while True:
+        chunk = await loop.run_in_executor(executor, f.read, _CHUNK_SIZE)
+        if not chunk:
+            break
+
+        result = stream.write(chunk)
+        if inspect.isawaitable(result):
+            await result
+
+        if drain is not None:
+            await drain()
+
+class _AsyncRunner:
+    '''
+    Runs blocking calls in an executor, at most max_concurrency at once. An
+    executor that is not given is created with max_concurrency threads and
+    shut down by close(). The spooled files are written and read in a small
+    thread pool of its own, also shut down by close().
+    '''
+
+    def __init__(self, executor=None, max_concurrency=None, spool_size=64 << 20):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1')
+
+        self._owns_executor = executor is None
+
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_concurrency)
+
+        self._executor = executor
+        self._io_executor = concurrent.futures.ThreadPoolExecutor(_IO_THREADS, _IO_THREAD_NAME)
+        self._max_concurrency = max_concurrency or getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+        self._semaphore = None
+        self._spool_size = spool_size
+
+    def _spool(self):
+        return tempfile.SpooledTemporaryFile(self._spool_size)
+
+    async def _run(self, func, *args):
+        '''
+        Calls func(cancelled, *args) in the executor and returns its result.
+        If the caller is cancelled, cancelled is set and the call is waited
+        for before CancelledError is raised.
+        '''
+        if self._semaphore is None:
+            # Created here so it belongs to the running event loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+
+        async with self._semaphore:
+            future = loop.run_in_executor(self._executor, func, cancelled, *args)
+
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                cancelled.set()
+
+                # Keep the slot until the worker has stopped
+                await asyncio.wait([future])
+                raise
+
+    def close(self):
+        '''
+        Shuts down the executor if it was created by this object
+        '''
+        self._io_executor.shutdown(wait=True)
+
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+class AsyncReader(_AsyncRunner):
+    '''
+    Reads 3MF files from async streams with an io.Reader, which must not be
+    lazy because the received data is discarded after reading.
+    '''
+
+    def __init__(self, reader : io.Reader = None, executor=None, max_concurrency=None, spool_size=64 << 20):
+        '''
+            reader: io.Reader used for reading, with its extensions, cache
+                and options. By default a new io.Reader().
+            executor: concurrent.futures.Executor the reads run in, which
+                must run them in this process, such as a thread pool. By
+                default a thread pool with max_concurrency threads that is
+                shut down by close().
+            max_concurrency: maximum number of reads running at once. By
+                default the number of workers of the executor.
+            spool_size: received files larger than this many bytes are
+                buffered on disk instead of in memory.
+        '''
+        reader = reader if reader is not None else io.Reader()
+
+        if reader._lazy:
+            raise ThreeMFException('AsyncReader needs a reader that is not lazy')
+
+        super().__init__(executor, max_concurrency, spool_size)
+        self.reader = reader
+
+    def register_extension(self, cls):
+        return self.reader.register_extension(cls)
+
+    async def read(self, tmf : ThreeMF, stream):
+        '''
+            tmf: ThreeMF object the models and extensions are added to. If
+                the read is cancelled it may be left partially read.
+            stream: bytes, an object with a read(size) coroutine such as
+                asyncio.StreamReader, or an async iterable of bytes
+        '''
+        with self._spool() as f:
+            await _receive(stream, f, asyncio.get_running_loop(), self._io_executor)
+            await self._run(self._read, tmf, f)
+
+    def _read(self, cancelled, tmf, f):
+        try:
+            self.reader.read(tmf, _CancellableFile(f, cancelled))
+        except _Cancelled:
+            pass
+
+class AsyncWriter(_AsyncRunner):
+    '''
+    Writes 3MF files to async streams with an io.Writer
+    '''
+
+    def __init__(self, writer : io.Writer = None, executor=None, max_concurrency=None, spool_size=64 << 20):
+        '''
+            writer: io.Writer used for writing, with its options. By default
+                a new io.Writer().
+            executor, max_concurrency, spool_size: as for AsyncReader
+        '''
+        super().__init__(executor, max_concurrency, spool_size)
+        self.writer = writer if writer is not None else io.Writer()
+
+    async def write(self, tmf : ThreeMF, stream):
+        '''
+            tmf: ThreeMF object, which must not be changed until the write
+                is done
+            stream: an object with a write(data) method, which may be a
+                coroutine, and an optional drain() coroutine, such as
+                asyncio.StreamWriter
+        '''
+        with self._spool() as f:
+            await self._run(self._write, tmf, f)
+            await _send(f, stream, asyncio.get_running_loop(), self._io_executor)
+
+    def _write(self, cancelled, tmf, f):
+        try:
+            self.writer.write(tmf, _CancellableFile(f, cancelled))
+        except _Cancelled:
+            pass
@@ -0,0 +1,224 @@
+'''
+An optional binary representation of the meshes of a model, stored next to
+the model XML inside the 3MF archive.
+
+The sidecar part holds the raw vertex and triangle arrays of every object of
+a model. It is stored uncompressed with its data aligned in the archive, so
+when the 3MF is a file on disk the arrays are memory-mapped straight from it.
+The model XML is still written in full, so other 3MF readers are unaffected.
+
+The sidecar records the CRC32 of the model XML it was written with, so it is
+ignored if the XML has been changed by a tool that does not know about it.
+'''
+
+import mmap
+import os
+import struct
+import zipfile
+import zlib
+
+import numpy as np
+
+from . import mesh
+
+EXTENSION = 'bin'
+CONTENT_TYPE = 'application/octet-stream'
+
+_MAGIC = b'3MFMESHB'
+_VERSION = 1
+_ALIGNMENT = 64
+
+# Extra field id used to pad the local header so the data is aligned, the
+# same one zipalign uses
+_PADDING_EXTRA_ID = 0xD935
+
+_HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('nobjects', '<u4'),
+    ('model_crc', '<u4'),
+    ('reserved', '<u4')
+])
+
+_TABLE = np.dtype([
+    ('id', '<i8'),
+    ('nvertices', '<u8'),
+    ('ntriangles', '<u8'),
+    ('vertex_offset', '<u8'),
+    ('triangle_offset', '<u8'),
+    ('vertex_type', 'S4'),
+    ('triangle_type', 'S4')
+])
+
+def sidecar_path(model_path : str) -> str:
+    return '{}.{}'.format(model_path, EXTENSION)
+
+def _aligned(n : int) -> int:
+    return -(-n // _ALIGNMENT) * _ALIGNMENT
+
+def write(zipf : zipfile.ZipFile, mdl : 'model.Model'):
+    '''
+    Writes the sidecar of mdl into zipf. The model XML must already have
+    been written, since its CRC32 is recorded in the sidecar.
+    '''
+    arrays = []
+
+    table = np.zeros(len(mdl.objects), dtype=_TABLE)
+
+    offset = _aligned(_HEADER.itemsize + _TABLE.itemsize * len(table))
+
+    for i, obj in enumerate(mdl.objects):
+        verts = np.ascontiguousarray(obj.mesh.vertex_array)
+        tris = np.ascontiguousarray(obj.mesh.triangle_array)
+
+        table[i]['id'] = obj.id
+        table[i]['nvertices'] = len(verts)
+        table[i]['ntriangles'] = len(tris)
+        table[i]['vertex_type'] = verts.dtype.newbyteorder('<').str.encode()
+        table[i]['triangle_type'] = tris.dtype.newbyteorder('<').str.encode()
+
+        table[i]['vertex_offset'] = offset
+        arrays.append((offset, verts.astype(verts.dtype.newbyteorder('<'), copy=False)))
+        offset = _aligned(offset + verts.nbytes)
+
+        table[i]['triangle_offset'] = offset
+        arrays.append((offset, tris.astype(tris.dtype.newbyteorder('<'), copy=False)))
+        offset = _aligned(offset + tris.nbytes)
+
+    header = np.zeros(1, dtype=_HEADER)
+    header['magic'] = _MAGIC
+    header['version'] = _VERSION
+    header['nobjects'] = len(table)
+    header['model_crc'] = zipf.getinfo(mdl.path).CRC
+
+    zinfo = zipfile.ZipInfo(sidecar_path(mdl.path), date_time=zipf.getinfo(mdl.path).date_time)
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.file_size = offset
+    zinfo.compress_size = 0
+    zinfo.CRC = 0
+
+    # Pad the local header with an extra field so the data starts aligned
+    zip64 = offset * 1.05 > zipfile.ZIP64_LIMIT
+    zinfo.extra = struct.pack('<HH', _PADDING_EXTRA_ID, 0)
+    header_end = zipf.fp.tell() + len(zinfo.FileHeader(zip64))
+    padding = (-header_end) % _ALIGNMENT
+    zinfo.extra = struct.pack('<HH', _PADDING_EXTRA_ID, padding) + b'\0' * padding
+
+    with zipf.open(zinfo, 'w') as f:
+        pos = 0
+
+        for block in (header.tobytes(), table.tobytes()):
+            f.write(block)
+            pos += len(block)
+
+        for array_offset, arr in arrays:
+            f.write(b'\0' * (array_offset - pos))
+            f.write(memoryview(arr.reshape(-1)).cast('B'))
+            pos = array_offset + arr.nbytes
+
+        f.write(b'\0' * (offset - pos))
+
+def _data_offset(fp, info : zipfile.ZipInfo) -> int:
+    '''
+    Returns the offset of the data of a stored member in the archive file
+    '''
+    fp.seek(info.header_offset)
+    local_header = fp.read(30)
+
+    if local_header[:4] != b'PK\x03\x04':
+        raise ValueError('Bad local file header for {}'.format(info.filename))
+
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+
+    return info.header_offset + 30 + name_length + extra_length
+
+def _map_member(zipf : zipfile.ZipFile, info : zipfile.ZipInfo):
+    '''
+    Returns a buffer with the data of a stored member, memory-mapped from the
+    archive file when it is on disk, or None if the data is corrupt
+    '''
+    path = zipf.filename
+
+    if info.compress_type == zipfile.ZIP_STORED and path and os.path.isfile(path):
+        with open(path, 'rb') as fp:
+            start = _data_offset(fp, info)
+
+            # Map from the enclosing allocation boundary, privately so that
+            # the arrays are writable without changing the file
+            map_start = start - start % mmap.ALLOCATIONGRANULARITY
+            mapped = mmap.mmap(
+                fp.fileno(), start - map_start + info.file_size,
+                access=mmap.ACCESS_COPY, offset=map_start
+            )
+
+        data = memoryview(mapped)[start - map_start:]
+
+        if zlib.crc32(data) != info.CRC:
+            return None
+
+        return data
+
+    # ZipFile.read checks the CRC. Copy into a bytearray so the arrays are
+    # writable, as with the mapped data
+    return bytearray(zipf.read(info))
+
+def read(zipf : zipfile.ZipFile, mdl : 'model.Model'):
+    '''
+    Returns the meshes of the objects of mdl from its sidecar, in the order
+    of mdl.objects. Returns None if there is no sidecar, or if it does not
+    match the model XML or the objects read from it.
+    '''
+    try:
+        info = zipf.getinfo(sidecar_path(mdl.path))
+    except KeyError:
+        return None
+
+    try:
+        data = _map_member(zipf, info)
+    except (OSError, ValueError, zipfile.BadZipFile):
+        return None
+
+    if data is None or len(data) < _HEADER.itemsize:
+        return None
+
+    header = np.frombuffer(data, dtype=_HEADER, count=1)[0]
+
+    if (header['magic'] != _MAGIC or header['version'] != _VERSION
+            or header['model_crc'] != zipf.getinfo(mdl.path).CRC):
+        return None
+
+    nobjects = int(header['nobjects'])
+
+    if len(data) < _HEADER.itemsize + nobjects * _TABLE.itemsize or nobjects != len(mdl.objects):
+        return None
+
+    table = np.frombuffer(data, dtype=_TABLE, count=nobjects, offset=_HEADER.itemsize)
+
+    meshes = []
+
+    for entry, obj in zip(table, mdl.objects):
+        if entry['id'] != obj.id:
+            return None
+
+        try:
+            vtype = np.dtype(entry['vertex_type'].decode())
+            ttype = np.dtype(entry['triangle_type'].decode())
+        except (TypeError, UnicodeDecodeError):
+            return None
+
+        if vtype not in mesh.VERTEX_DTYPES or ttype not in mesh.TRIANGLE_DTYPES:
+            return None
+
+        nverts = int(entry['nvertices'])
+        ntris = int(entry['ntriangles'])
+
+        if (int(entry['vertex_offset']) + nverts * 3 * vtype.itemsize > len(data)
+                or int(entry['triangle_offset']) + ntris * 3 * ttype.itemsize > len(data)):
+            return None
+
+        meshes.append(mesh.Mesh(
+            np.frombuffer(data, dtype=vtype, count=3 * nverts, offset=int(entry['vertex_offset'])).reshape(-1, 3),
+            np.frombuffer(data, dtype=ttype, count=3 * ntris, offset=int(entry['triangle_offset'])).reshape(-1, 3)
+        ))
+
+    return meshes
@@ -0,0 +1,484 @@
+'''
+A bounding volume hierarchy over the triangles of a mesh, for batched ray
+casting, closest point and box overlap queries.
+
+The hierarchy is a linear BVH: triangles are sorted along a Morton curve
+through their centroids and grouped into leaves of leaf_size triangles, and
+the leaves form the bottom level of a complete binary tree whose node boxes
+are the union of their children's. The tree is implicit, node i of a level
+has the children 2i and 2i + 1 in the next level, so building it is a sort and
+a few array reductions.
+
+Queries descend the tree one level at a time for a whole batch of queries,
+keeping the (query, node) pairs whose boxes pass the test of the query, and
+finish with an exact test against the triangles of the leaves reached.
+'''
+
+import numpy as np
+
+# Number of queries processed together, bounds the size of the pair arrays
+_QUERY_BATCH = 1 << 12
+
+# Length of the first window of a ray search in leaf box diagonals, and the
+# factor it grows by for the rays that have not hit anything yet
+_WINDOW_LEAVES = 4
+_WINDOW_GROWTH = 4
+
+# Number of leaves tested for every query in each round of a nearest first
+# search, before checking which queries are done
+_LEAVES_PER_ROUND = 2
+
+def _spread_bits(x):
+    '''
+    Spreads the low 21 bits of x so there are two zero bits between each
+    '''
+    x = x & 0x1fffff
+    x = (x | x << 32) & 0x1f00000000ffff
+    x = (x | x << 16) & 0x1f0000ff0000ff
+    x = (x | x << 8) & 0x100f00f00f00f00f
+    x = (x | x << 4) & 0x10c30c30c30c30c3
+    x = (x | x << 2) & 0x1249249249249249
+    return x
+
+def _morton_codes(points, lo, extent):
+    cells = np.clip((points - lo) / extent, 0., 1.) * ((1 << 21) - 1)
+    cells = cells.astype(np.uint64)
+
+    return _spread_bits(cells[:, 0]) << 2 | _spread_bits(cells[:, 1]) << 1 | _spread_bits(cells[:, 2])
+
+def _dot(a, b):
+    return np.einsum('ij,ij->i', a, b)
+
+# Reductions over the 3 columns of an (N, 3) array, much faster than numpy's
+# reductions along a short axis
+
+def _max3(a):
+    return np.maximum(np.maximum(a[:, 0], a[:, 1]), a[:, 2])
+
+def _min3(a):
+    return np.minimum(np.minimum(a[:, 0], a[:, 1]), a[:, 2])
+
+def _squared_norm(a):
+    return _dot(a, a)
+
+def _closest_on_triangles(p, a, b, c):
+    '''
+    Returns the closest points to the points p on the triangles (a, b, c),
+    all (N, 3) arrays, following Ericson, Real-Time Collision Detection 5.1.5
+    '''
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+
+    d1 = _dot(ab, ap)
+    d2 = _dot(ac, ap)
+    d3 = _dot(ab, bp)
+    d4 = _dot(ac, bp)
+    d5 = _dot(ab, cp)
+    d6 = _dot(ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = 1. / (va + vb + vc)
+        result = a + ab * (vb * denom)[:, None] + ac * (vc * denom)[:, None]
+
+        # Apply the Voronoi regions from the lowest priority to the highest,
+        # each one overrides the ones before it
+        regions = (
+            ((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+                lambda: b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None]),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0), lambda: a + ac * (d2 / (d2 - d6))[:, None]),
+            ((d6 >= 0) & (d5 <= d6), lambda: c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0), lambda: a + ab * (d1 / (d1 - d3))[:, None]),
+            ((d3 >= 0) & (d4 <= d3), lambda: b),
+            ((d1 <= 0) & (d2 <= 0), lambda: a)
+        )
+
+        for mask, point in regions:
+            if mask.any():
+                result = np.where(mask[:, None], point(), result)
+
+    # Degenerate triangles can leave no valid region
+    return np.where(np.isfinite(result), result, a)
+
+class BVH:
+    '''
+    A bounding volume hierarchy over the triangles of a mesh. Usually
+    obtained from Mesh.bvh, which caches it.
+
+    vertices: (N, 3) vertex array
+    triangles: (M, 3) triangle array
+    leaf_size: number of triangles in each leaf
+    '''
+
+    def __init__(self, vertices, triangles, leaf_size=4):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        triangles = np.asarray(triangles)
+
+        corners = vertices[triangles] # (M, 3, 3)
+        self._v0 = corners[:, 0]
+        self._v1 = corners[:, 1]
+        self._v2 = corners[:, 2]
+
+        self._tri_lo = corners.min(axis=1)
+        self._tri_hi = corners.max(axis=1)
+
+        ntris = len(triangles)
+        self.leaf_size = leaf_size
+
+        nleaves = max(1, -(-ntris // leaf_size))
+        self.depth = int(np.ceil(np.log2(nleaves))) if nleaves > 1 else 0
+        npadded = 1 << self.depth
+
+        if ntris > 0:
+            centroids = 0.5 * (self._tri_lo + self._tri_hi)
+            self._code_lo = centroids.min(axis=0)
+            self._code_extent = centroids.max(axis=0) - self._code_lo
+            self._code_extent[self._code_extent == 0] = 1.
+
+            codes = _morton_codes(centroids, self._code_lo, self._code_extent)
+            order = np.argsort(codes, kind='stable')
+        else:
+            codes = np.empty(0, dtype=np.uint64)
+            order = np.empty(0, dtype=np.intp)
+
+        # Code of the first triangle of each leaf, for finding the leaves
+        # along the curve near a point
+        self._leaf_codes = codes[order][::leaf_size]
+
+        # Triangle indices of each leaf, -1 where a leaf is not full
+        slots = np.full(npadded * leaf_size, -1, dtype=np.intp)
+        slots[:ntris] = order
+        self._leaves = slots.reshape(npadded, leaf_size)
+
+        lo = np.full((npadded * leaf_size, 3), np.inf)
+        hi = np.full((npadded * leaf_size, 3), -np.inf)
+        lo[:ntris] = self._tri_lo[order]
+        hi[:ntris] = self._tri_hi[order]
+
+        lo = lo.reshape(npadded, leaf_size, 3).min(axis=1)
+        hi = hi.reshape(npadded, leaf_size, 3).max(axis=1)
+
+        # Node boxes by level, from the root down to the leaves
+        self._lo = [lo]
+        self._hi = [hi]
+
+        while len(lo) > 1:
+            lo = np.minimum(lo[0::2], lo[1::2])
+            hi = np.maximum(hi[0::2], hi[1::2])
+            self._lo.append(lo)
+            self._hi.append(hi)
+
+        self._lo.reverse()
+        self._hi.reverse()
+
+        self._nonempty = [(l <= h).all(axis=1) for l, h in zip(self._lo, self._hi)]
+
+        # Typical size of a leaf box
+        leaf_lo = self._lo[-1][self._nonempty[-1]]
+        leaf_hi = self._hi[-1][self._nonempty[-1]]
+        self._leaf_extent = float(np.median(np.linalg.norm(leaf_hi - leaf_lo, axis=1))) if len(leaf_lo) else 0.
+
+        if self._leaf_extent <= 0:
+            self._leaf_extent = 1.
+
+    def __len__(self):
+        return len(self._v0)
+
+    @property
+    def bounds(self):
+        '''
+        The minimum and maximum corners of the box around all triangles
+        '''
+        return self._lo[0][0], self._hi[0][0]
+
+    def _descend(self, nqueries, test):
+        '''
+        Returns the (query, leaf) pairs reached by descending the tree with
+        test(queries, level, nodes), which returns a mask of the pairs to keep.
+        The pairs are sorted by query.
+        '''
+        queries = np.arange(nqueries)
+        nodes = np.zeros(nqueries, dtype=np.intp)
+
+        for level in range(self.depth + 1):
+            keep = self._nonempty[level][nodes]
+            keep[keep] = test(queries[keep], level, nodes[keep])
+
+            queries = queries[keep]
+            nodes = nodes[keep]
+
+            if level < self.depth:
+                queries = np.repeat(queries, 2)
+                nodes = (2 * nodes[:, None] + (0, 1)).ravel()
+
+        return queries, nodes
+
+    def _near_leaves(self, points, spread=1):
+        '''
+        Returns (query, leaf) pairs with the leaves around the position of
+        each point along the Morton curve, spread on either side. They are
+        usually close to the point, so their triangles give a first bound for
+        pruning a nearest search.
+        '''
+        nleaves = len(self._leaf_codes)
+
+        if nleaves == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        position = np.searchsorted(self._leaf_codes, _morton_codes(points, self._code_lo, self._code_extent), side='right') - 1
+        leaves = np.clip(position[:, None] + np.arange(-spread, spread + 1), 0, nleaves - 1)
+
+        return np.repeat(np.arange(len(points)), leaves.shape[1]), leaves.ravel()
+
+    def _leaf_triangles(self, queries, leaves):
+        '''
+        Expands (query, leaf) pairs to (query, triangle) pairs
+        '''
+        tris = self._leaves[leaves].ravel()
+        queries = np.repeat(queries, self.leaf_size)
+
+        valid = tris >= 0
+        return queries[valid], tris[valid]
+
+    def _nearest_leaves_first(self, nqueries, queries, leaves, keys, evaluate):
+        '''
+        Tests the triangles of the (query, leaf) pairs in order of keys, a
+        lower bound of the value of any triangle of the leaf for the query,
+        and stops for each query once its best value is below the key of its
+        next leaf. evaluate(queries, triangles) returns the value of each
+        (query, triangle) pair, inf where it does not count, and a per pair
+        payload array.
+
+        Returns the best value, triangle and payload of each query.
+        '''
+        order = np.lexsort((keys, queries))
+        queries, leaves, keys = queries[order], leaves[order], keys[order]
+
+        # Rank of each leaf among the leaves of its query
+        starts = np.flatnonzero(np.r_[True, queries[1:] != queries[:-1]]) if len(queries) else np.empty(0, dtype=np.intp)
+        rank = np.arange(len(queries)) - np.repeat(starts, np.diff(np.r_[starts, len(queries)]))
+
+        best = np.full(nqueries, np.inf)
+        best_tris = np.full(nqueries, -1, dtype=np.intp)
+        best_payload = None
+
+        for r in range(0, rank.max() + 1 if len(rank) else 0, _LEAVES_PER_ROUND):
+            selected = (rank >= r) & (rank < r + _LEAVES_PER_ROUND)
+            selected &= keys <= best[queries]
+
+            if not selected.any():
+                break
+
+            q, tris = self._leaf_triangles(queries[selected], leaves[selected])
+            values, payload = evaluate(q, tris)
+
+            if best_payload is None:
+                best_payload = np.full((nqueries, ) + payload.shape[1:], np.nan)
+
+            # The best new value of each query comes first when sorted
+            order = np.lexsort((values, q))
+            q, tris, values, payload = q[order], tris[order], values[order], payload[order]
+            first = np.r_[True, q[1:] != q[:-1]] if len(q) else np.empty(0, dtype=bool)
+            q, tris, values, payload = q[first], tris[first], values[first], payload[first]
+
+            better = values < best[q]
+            q = q[better]
+            best[q] = values[better]
+            best_tris[q] = tris[better]
+            best_payload[q] = payload[better]
+
+        return best, best_tris, best_payload
+
+    def intersect_rays(self, origins, directions, max_distance=np.inf):
+        '''
+        Casts rays from origins (K, 3) along directions (K, 3) and returns
+        (triangles, distances): the index of the first triangle hit by each
+        ray, or -1, and the ray parameter t of the hit, or inf. The hit point
+        is origins + t * directions, so t is a distance for unit directions.
+        Hits with t greater than max_distance are ignored.
+        '''
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+
+        triangles = np.full(len(origins), -1, dtype=np.intp)
+        distances = np.full(len(origins), np.inf)
+
+        for start in range(0, len(origins), _QUERY_BATCH):
+            stop = start + _QUERY_BATCH
+            triangles[start:stop], distances[start:stop] = self._intersect_rays(
+                origins[start:stop], directions[start:stop], max_distance
+            )
+
+        return triangles, distances
+
+    def _intersect_rays(self, origins, directions, max_distance):
+        with np.errstate(divide='ignore'):
+            inv = 1. / directions
+
+        def slabs(queries, level, nodes):
+            o = origins[queries]
+            d = inv[queries]
+
+            with np.errstate(invalid='ignore'):
+                t1 = (self._lo[level][nodes] - o) * d
+                t2 = (self._hi[level][nodes] - o) * d
+
+            # fmin/fmax skip the NaN of a ray lying in the plane of a face
+            return _max3(np.fmin(t1, t2)), _min3(np.fmax(t1, t2))
+
+        triangles = np.full(len(origins), -1, dtype=np.intp)
+        distances = np.full(len(origins), np.inf)
+
+        if len(self) == 0:
+            return triangles, distances
+
+        # Search the rays in windows of growing length, so the rays that hit
+        # something close by never visit the leaves farther along them
+        entry, exit = slabs(np.arange(len(origins)), 0, np.zeros(len(origins), dtype=np.intp))
+        active = np.flatnonzero((entry <= exit) & (exit >= 0) & np.isfinite(exit))
+
+        window_start = 0.
+        window_end = min(_WINDOW_LEAVES * self._leaf_extent, max_distance)
+
+        while len(active):
+            rays = active
+
+            def test(queries, level, nodes):
+                near, far = slabs(rays[queries], level, nodes)
+                return (near <= far) & (far >= window_start) & (near <= window_end)
+
+            queries, leaves = self._descend(len(rays), test)
+            near = np.maximum(slabs(rays[queries], self.depth, leaves)[0], window_start)
+
+            def evaluate(queries, tris):
+                queries = rays[queries]
+
+                # Möller-Trumbore on every (ray, triangle) pair
+                d = directions[queries]
+                e1 = self._v1[tris] - self._v0[tris]
+                e2 = self._v2[tris] - self._v0[tris]
+
+                p = np.cross(d, e2)
+                det = _dot(e1, p)
+
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    inv_det = 1. / det
+
+                    s = origins[queries] - self._v0[tris]
+                    u = _dot(s, p) * inv_det
+                    q = np.cross(s, e1)
+                    v = _dot(d, q) * inv_det
+                    t = _dot(e2, q) * inv_det
+
+                hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= window_start) & (t <= window_end)
+
+                return np.where(hit, t, np.inf), np.empty((len(t), 0))
+
+            dist, tris, _ = self._nearest_leaves_first(len(rays), queries, leaves, near, evaluate)
+
+            found = np.isfinite(dist)
+            triangles[rays[found]] = tris[found]
+            distances[rays[found]] = dist[found]
+
+            # Rays without a hit go on while they are still inside the tree
+            # and below max_distance
+            if window_end >= max_distance:
+                break
+
+            active = rays[~found & (exit[rays] > window_end)]
+            window_start = window_end
+            window_end = min(window_end * _WINDOW_GROWTH, max_distance)
+
+        return triangles, distances
+
+    def closest_points(self, points):
+        '''
+        Returns (closest, distances, triangles): the closest point on the mesh
+        surface to each of points (K, 3), its distance and the index of the
+        triangle it lies on. For an empty mesh the points are NaN and the
+        triangles -1.
+        '''
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+
+        closest = np.full(points.shape, np.nan)
+        distances = np.full(len(points), np.inf)
+        triangles = np.full(len(points), -1, dtype=np.intp)
+
+        for start in range(0, len(points), _QUERY_BATCH):
+            stop = start + _QUERY_BATCH
+            closest[start:stop], distances[start:stop], triangles[start:stop] = self._closest_points(points[start:stop])
+
+        return closest, distances, triangles
+
+    def _closest_points(self, points):
+        def box_distances(queries, level, nodes):
+            p = points[queries]
+            return _squared_norm(np.maximum(np.maximum(self._lo[level][nodes] - p, p - self._hi[level][nodes]), 0))
+
+        def evaluate(queries, tris):
+            p = points[queries]
+            closest = _closest_on_triangles(p, self._v0[tris], self._v1[tris], self._v2[tris])
+            return _squared_norm(closest - p), closest
+
+        # The squared distance to the triangles near each point along the
+        # curve bounds the distance to its closest triangle
+        bound = np.full(len(points), np.inf)
+        q, tris = self._leaf_triangles(*self._near_leaves(points))
+        np.minimum.at(bound, q, evaluate(q, tris)[0])
+
+        def test(queries, level, nodes):
+            return box_distances(queries, level, nodes) <= bound[queries]
+
+        queries, leaves = self._descend(len(points), test)
+        near = box_distances(queries, self.depth, leaves)
+
+        dist, triangles, closest = self._nearest_leaves_first(len(points), queries, leaves, near, evaluate)
+
+        if closest is None:
+            closest = np.full(points.shape, np.nan)
+
+        return closest, np.sqrt(dist), triangles
+
+    def overlapping(self, lo, hi):
+        '''
+        Returns the sorted indices of the triangles whose bounding boxes
+        overlap each of the boxes from lo (K, 3) to hi (K, 3), as a list of K
+        arrays. A single box given as (3,) arrays returns a single array.
+        '''
+        single = np.ndim(lo) == 1
+
+        lo = np.atleast_2d(np.asarray(lo, dtype=np.float64))
+        hi = np.atleast_2d(np.asarray(hi, dtype=np.float64))
+
+        result = []
+
+        for start in range(0, len(lo), _QUERY_BATCH):
+            result.extend(self._overlapping(lo[start:start + _QUERY_BATCH], hi[start:start + _QUERY_BATCH]))
+
+        return result[0] if single else result
+
+    def _overlapping(self, lo, hi):
+        def test(queries, level, nodes):
+            return (
+                (self._lo[level][nodes] <= hi[queries]).all(axis=1)
+                & (self._hi[level][nodes] >= lo[queries]).all(axis=1)
+            )
+
+        queries, tris = self._leaf_triangles(*self._descend(len(lo), test))
+
+        hit = (
+            (self._tri_lo[tris] <= hi[queries]).all(axis=1)
+            & (self._tri_hi[tris] >= lo[queries]).all(axis=1)
+        )
+        queries, tris = queries[hit], tris[hit]
+
+        order = np.lexsort((tris, queries))
+        queries, tris = queries[order], tris[order]
+
+        return np.split(tris, np.searchsorted(queries, np.arange(1, len(lo))))
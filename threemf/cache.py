@@ -0,0 +1,280 @@
+'''
+An optional on-disk cache of parsed 3MF models.
+
+Parsing the XML of a large model is by far the most expensive part of reading
+a 3MF file. When the same archives are read over and over, a ParseCache passed
+to io.Reader stores the parsed models in a compact binary form and later reads
+memory-map it instead of parsing the XML again.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import typing
+import zipfile
+
+import numpy as np
+
+from . import mesh, model
+from ._version import __version__
+
+class ParseCache:
+    '''
+    A size-bounded cache of parsed models, stored in a directory.
+
+    Entries are keyed by the SHA-256 of the whole archive, which needs one
+    pass over the file. With content_hash=False the key is built from the
+    name, CRC32 and size of every member instead, taken from the zip
+    directory without reading any member data. Those values are not checked
+    against the data until a member is read, so a crafted archive can claim
+    the directory of another file and be served its cached models; only use
+    content_hash=False for trusted input. The cache format version and the
+    package version are part of every key, so upgrading either invalidates
+    older entries.
+
+    Each entry holds the vertex, triangle and transform arrays of all models
+    as .npy files, and the objects, components, metadata and build items in a
+    small JSON index. Cached meshes are memory-mapped copy-on-write, so they
+    can be modified without changing the cache.
+
+    When the total size of the entries exceeds max_bytes the least recently
+    used entries are removed.
+    '''
+
+    _FORMAT_VERSION = 1
+    _INDEX = 'index.json'
+    _ARRAYS = ('vertices', 'triangles', 'transforms')
+
+    def __init__(self, directory, max_bytes=1 << 30, content_hash=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, tmffile : typing.BinaryIO, zipf : zipfile.ZipFile) -> str:
+        '''
+        Returns the cache key of the 3MF file tmffile, opened as zipf
+        '''
+        h = hashlib.sha256()
+        h.update('threemf-{}-{}'.format(__version__, ParseCache._FORMAT_VERSION).encode())
+
+        if self.content_hash:
+            f = tmffile
+            pos = f.tell()
+            f.seek(0)
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+            f.seek(pos)
+        else:
+            for info in sorted(zipf.infolist(), key=lambda i: i.filename):
+                h.update('{}\0{:08x}\0{}\0'.format(info.filename, info.CRC, info.file_size).encode())
+
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        '''
+        Returns the list of cached models for key, or None on a cache miss.
+        Entries that cannot be read are removed.
+        '''
+        entry = self._entry(key)
+
+        if not os.path.isdir(entry):
+            return None
+
+        try:
+            with open(os.path.join(entry, ParseCache._INDEX)) as f:
+                index = json.load(f)
+
+            arrays = {
+                name: np.load(os.path.join(entry, name + '.npy'), mmap_mode='c', allow_pickle=False)
+                for name in ParseCache._ARRAYS
+            }
+
+            models = _unpack(index, arrays)
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            self.invalidate(key)
+            return None
+
+        # Mark the entry as recently used for the LRU eviction
+        os.utime(entry)
+
+        return models
+
+    def store(self, key, models):
+        '''
+        Stores the models under key, then evicts entries if the cache is over
+        its size limit. Accesses the mesh of every object, so lazily read
+        meshes are loaded.
+        '''
+        entry = self._entry(key)
+
+        if os.path.isdir(entry):
+            return
+
+        index, arrays = _pack(models)
+
+        # Write to a temporary directory first and move it into place, so
+        # concurrent readers never see a partially written entry
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+
+        try:
+            for name in ParseCache._ARRAYS:
+                np.save(os.path.join(tmp, name + '.npy'), arrays[name], allow_pickle=False)
+
+            with open(os.path.join(tmp, ParseCache._INDEX), 'w') as f:
+                json.dump(index, f)
+
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process stored the same entry first, or the disk is full
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        self._evict(keep=key)
+
+    def invalidate(self, key):
+        shutil.rmtree(self._entry(key), ignore_errors=True)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _entries(self):
+        '''
+        Returns (last use, size, key) for every entry
+        '''
+        entries = []
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, name))
+            except OSError:
+                continue
+
+        return entries
+
+    def _evict(self, keep=None):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+
+            # On some platforms an entry that is still memory-mapped cannot
+            # be removed; it stays until a later eviction
+            try:
+                shutil.rmtree(self._entry(key))
+                total -= size
+            except OSError:
+                pass
+
+def _pack(models):
+    '''
+    Returns the JSON index and the concatenated arrays of the models
+    '''
+    vertices = []
+    triangles = []
+    transforms = []
+
+    nverts = 0
+    ntris = 0
+
+    def add_transform(T):
+        transforms.append(np.asarray(T, dtype=np.float64))
+        return len(transforms) - 1
+
+    index = {'models': []}
+
+    for mdl in models:
+        objects = []
+
+        for obj in mdl.objects:
+            m = obj.mesh
+
+            vertices.append(m.vertex_array)
+            triangles.append(m.triangle_array)
+
+            objects.append({
+                'id': obj.id,
+                'type': obj.type,
+                'vertices': [nverts, nverts + len(m.vertex_array)],
+                'triangles': [ntris, ntris + len(m.triangle_array)],
+                'components': [[c.objectid, add_transform(c.transform)] for c in obj.components],
+                'metadata': [[md.name, md.value, md.preserve, md.type] for md in obj.metadata]
+            })
+
+            nverts += len(m.vertex_array)
+            ntris += len(m.triangle_array)
+
+        index['models'].append({
+            'path': mdl.path,
+            'unit': mdl.unit,
+            'objects': objects,
+            'build': [[item.objectid, add_transform(item.transform)] for item in mdl.build.items]
+        })
+
+    arrays = {
+        'vertices': np.concatenate(vertices) if vertices else np.empty((0, 3), dtype=mesh.VERTEX_DTYPES[0]),
+        'triangles': np.concatenate(triangles) if triangles else np.empty((0, 3), dtype=mesh.TRIANGLE_DTYPES[0]),
+        'transforms': np.stack(transforms) if transforms else np.empty((0, 4, 4))
+    }
+
+    return index, arrays
+
+def _unpack(index, arrays):
+    '''
+    Rebuilds the models from a JSON index and arrays created by _pack
+    '''
+    vertices = arrays['vertices']
+    triangles = arrays['triangles']
+    transforms = arrays['transforms']
+
+    if vertices.ndim != 2 or triangles.ndim != 2 or transforms.ndim != 3:
+        raise ValueError('Unexpected array shapes in cache entry')
+
+    models = []
+
+    for m in index['models']:
+        mdl = model.Model(m['path'])
+        mdl.unit = m['unit']
+
+        for o in m['objects']:
+            obj = model.ObjectModel(o['id'])
+            obj.type = o['type']
+
+            vstart, vstop = o['vertices']
+            tstart, tstop = o['triangles']
+
+            if vstop > len(vertices) or tstop > len(triangles):
+                raise ValueError('Cache entry index does not match its arrays')
+
+            obj.mesh = mesh.Mesh(vertices[vstart:vstop], triangles[tstart:tstop])
+
+            for objectid, t in o['components']:
+                obj.components.append(model.Component(objectid, np.array(transforms[t])))
+
+            for name, value, preserve, type in o['metadata']:
+                obj.metadata.append(model.Metadata(name, value, preserve, type))
+
+            mdl.objects.append(obj)
+
+        for objectid, t in m['build']:
+            mdl.build.items.append(model.BuildItem(objectid, np.array(transforms[t])))
+
+        models.append(mdl)
+
+    return models
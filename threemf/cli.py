@@ -0,0 +1,319 @@
+'''
+Batch conversion between STL and 3MF files:
+
+    python -m threemf parts/ 'scans/**/*.stl' -o converted/ -j 8
+
+Every .stl input is converted to a 3MF file with one object, and every .3mf
+input to a binary STL file with the triangles of its whole build in world
+coordinates. Inputs can be files, directories, which are searched
+recursively for STL and 3MF files, or glob patterns.
+
+The files are converted in a pool of worker processes, each of which reads
+one file, writes its result straight to disk and only sends back a short
+summary, so the work scales with the number of processes. The address space
+of every worker can be limited with --memory-limit, so a file too large for
+the budget fails with a MemoryError instead of exhausting the machine.
+
+A worker that dies, as when the system kills it, breaks its pool and fails
+every file in progress in it. Those files are converted again one at a time
+to find the one that killed it, which fails, and the files not yet started
+carry on in a new pool.
+'''
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the memory limit is not supported
+    resource = None
+
+from . import ThreeMF, ThreeMFException, io, mesh, scene
+
+# Input extensions and the extension of the files they are converted to
+_CONVERSIONS = {
+    '.stl': '.3mf',
+    '.3mf': '.stl',
+}
+
+def _limit_memory(limit_mb):
+    '''
+    Initializer of the worker processes: caps their address space
+    '''
+    if limit_mb is None or resource is None:
+        return
+
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = int(limit_mb * 2 ** 20)
+
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def find_inputs(patterns) -> 'List[Tuple[str, str]]':
+    '''
+    Returns (path, relative path) for every STL and 3MF file given by
+    patterns, which are files, directories or glob patterns. The relative
+    path of a file found in a directory is relative to that directory, so
+    the directory structure can be kept in the output; otherwise it is the
+    file name. Each file is returned once, in the order found.
+    '''
+    found = []
+    seen = set()
+
+    def add(path, relative):
+        key = os.path.realpath(path)
+        if key not in seen and os.path.splitext(path)[1].lower() in _CONVERSIONS:
+            seen.add(key)
+            found.append((path, relative))
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    add(path, os.path.relpath(path, pattern))
+        elif os.path.isfile(pattern):
+            add(pattern, os.path.basename(pattern))
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path):
+                    add(path, os.path.basename(path))
+
+    return found
+
+def output_path(path, relative, output_dir=None) -> str:
+    '''
+    Returns the path of the converted file for the input at path: next to
+    it, or at relative in output_dir
+    '''
+    stem, ext = os.path.splitext(relative if output_dir is not None else path)
+    target = stem + _CONVERSIONS[ext.lower()]
+
+    if output_dir is not None:
+        target = os.path.join(output_dir, target)
+
+    return target
+
+def convert(source, target, weld=True) -> dict:
+    '''
+    Converts the STL or 3MF file source to target and returns a summary with
+    the number of triangles and the sizes of both files. The result is
+    written to a temporary file next to target that replaces it once
+    complete, so target is never left half written.
+    '''
+    start = time.perf_counter()
+
+    directory = os.path.dirname(target)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    partial = target + '.part'
+
+    try:
+        if os.path.splitext(source)[1].lower() == '.stl':
+            ntriangles = _stl_to_3mf(source, partial, weld)
+        else:
+            ntriangles = _threemf_to_stl(source, partial)
+
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return {
+        'triangles': ntriangles,
+        'bytes_in': os.path.getsize(source),
+        'bytes_out': os.path.getsize(target),
+        'seconds': time.perf_counter() - start,
+    }
+
+def _stl_to_3mf(source, target, weld):
+    m = mesh.Mesh.FromSTLFile(source)
+
+    if len(m.triangle_array) == 0:
+        raise ThreeMFException('No triangles in {}'.format(source))
+
+    if weld:
+        m.weld()
+
+    # The object is written as soon as it is added, so the archive is never
+    # built in memory
+    with open(target, 'wb') as f, io.StreamWriter(f) as w:
+        obj = w.object_from_mesh(m)
+        w.add_build_item(obj)
+
+    return len(m.triangle_array)
+
+def _threemf_to_stl(source, target):
+    import stl
+
+    tmf = ThreeMF()
+
+    with open(source, 'rb') as f:
+        io.Reader().read(tmf, f)
+
+    world = scene.Scene(tmf.default_model).mesh()
+
+    if len(world.triangle_array) == 0:
+        raise ThreeMFException('No triangles in {}'.format(source))
+
+    with open(target, 'wb') as f:
+        world.to_stl().save(target, fh=f, mode=stl.Mode.BINARY)
+
+    return len(world.triangle_array)
+
+def _format_size(nbytes):
+    return '{:.1f} MB'.format(nbytes / 2 ** 20)
+
+def run(inputs, output_dir=None, jobs=None, memory_limit=None, weld=True, out=None) -> int:
+    '''
+    Converts the (path, relative path) inputs in a pool of jobs worker
+    processes, with an address space of at most memory_limit MB each, and
+    prints a line per file and a summary to out, or stdout. Returns the
+    number of files that failed.
+    '''
+    jobs = jobs or os.cpu_count() or 1
+    out = out if out is not None else sys.stdout
+
+    failures = []
+    converted = 0
+    triangles = 0
+    bytes_in = 0
+
+    def fail(path, message):
+        failures.append((path, message))
+        print('FAILED {}: {}'.format(path, message), file=out)
+
+    def finish(path, target, future) -> bool:
+        # Reports the file of future, or returns False if its pool broke
+        nonlocal converted, triangles, bytes_in
+
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            return False
+        except Exception as e:
+            fail(path, '{}: {}'.format(type(e).__name__, e))
+            return True
+
+        converted += 1
+        triangles += result['triangles']
+        bytes_in += result['bytes_in']
+
+        print('ok     {} -> {}: {} triangles, {} in {:.2f} s ({:.0f} triangles/s)'.format(
+            path, target, result['triangles'], _format_size(result['bytes_out']), result['seconds'],
+            result['triangles'] / max(result['seconds'], 1e-9)
+        ), file=out)
+
+        return True
+
+    def convert_in_pool(pending, workers) -> list:
+        '''
+        Converts the (path, target) files taken from the deque pending, at
+        most workers at once, until it is empty or a worker dies. Returns
+        the files that were in progress when a worker died.
+        '''
+        broken = []
+
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=_limit_memory, initargs=(memory_limit, )) as executor:
+            running = {}
+
+            # Only as many files as workers are submitted, so the files not
+            # started when a worker dies are known
+            while (pending and not broken) or running:
+                while pending and not broken and len(running) < workers:
+                    path, target = pending.popleft()
+                    running[executor.submit(convert, path, target, weld)] = (path, target)
+
+                # Report the files as they finish, in whatever order that is
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    path, target = running.pop(future)
+
+                    if not finish(path, target, future):
+                        broken.append((path, target))
+
+        return broken
+
+    start = time.perf_counter()
+
+    pending = collections.deque()
+
+    # An output must not overwrite an input or the output of another input
+    taken = {os.path.realpath(path) for path, _ in inputs}
+
+    for path, relative in inputs:
+        target = output_path(path, relative, output_dir)
+
+        if os.path.realpath(target) in taken:
+            fail(path, 'output {} is an input or the output of another input'.format(target))
+            continue
+
+        taken.add(os.path.realpath(target))
+        pending.append((path, target))
+
+    while pending:
+        broken = collections.deque(convert_in_pool(pending, jobs))
+
+        # One at a time, a worker that dies only breaks the file it converts
+        while broken:
+            for path, _ in convert_in_pool(broken, 1):
+                fail(path, 'worker process died')
+
+    elapsed = time.perf_counter() - start
+
+    print('{} converted, {} failed in {:.2f} s with {} processes: {:.1f} files/s, {:.0f} triangles/s, {}/s read'.format(
+        converted, len(failures), elapsed, jobs, converted / max(elapsed, 1e-9),
+        triangles / max(elapsed, 1e-9), _format_size(bytes_in / max(elapsed, 1e-9))
+    ), file=out)
+
+    if failures:
+        print('Failures:', file=out)
+        for path, message in failures:
+            print('  {}: {}'.format(path, message), file=out)
+
+    return len(failures)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m threemf',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('inputs', nargs='+', help='STL or 3MF files, directories or glob patterns')
+    parser.add_argument('-o', '--output-dir',
+                        help='directory of the converted files, which keeps the structure of input directories '
+                             '(default: next to each input)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--memory-limit', type=float, default=None,
+                        help='address space limit of each worker process in MB')
+    parser.add_argument('--no-weld', action='store_true',
+                        help='keep the three separate vertices of every STL facet instead of merging equal vertices')
+
+    args = parser.parse_args(argv)
+
+    if args.memory_limit is not None and resource is None:
+        parser.error('--memory-limit is not supported on this platform')
+
+    inputs = find_inputs(args.inputs)
+
+    if not inputs:
+        print('No STL or 3MF files found', file=sys.stderr)
+        return 2
+
+    failed = run(inputs, args.output_dir, args.jobs, args.memory_limit, not args.no_weld)
+
+    return 1 if failed else 0
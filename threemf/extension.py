@@ -2,9 +2,60 @@ import os
 import zipfile
 import json
 
+from . import _zip
+
 class Asset:
+    # The zip member the content is read from on first access, if it has
+    # not been read yet
+    _source = None
+
+    # The zip member the asset was read from, as long as the content is
+    # known to be unchanged. Extension.write copies it without recompressing.
+    _origin = None
+
     def __init__(self, name):
         self.name = name
+        self._content = None
+
+    @property
+    def content(self):
+        self._load()
+        return self._content
+
+    def _load(self):
+        '''
+        Deserializes the content of a lazily read asset, if not done yet
+        '''
+        if self._source is not None:
+            source, self._source = self._source, None
+            self.deserialize(source.read())
+
+            # Content that can be modified in place may differ from the
+            # member from now on, only immutable content keeps its origin.
+            # Subclasses may keep what they deserialize elsewhere, which is
+            # always serialized again.
+            self._origin = source if isinstance(self._content, (bytes, str)) else None
+
+    @property
+    def _lazy(self) -> bool:
+        '''
+        True if the asset deserializes into content, so reading it can wait
+        until content is accessed
+        '''
+        return type(self).deserialize in (RawFile.deserialize, JsonFile.deserialize)
+
+    @content.setter
+    def content(self, value):
+        self._source = None
+        self._origin = None
+        self._content = value
+
+    @property
+    def loaded(self) -> bool:
+        '''
+        False while the content of a lazily read asset has not been accessed
+        '''
+        return self._source is None
 
     def serialize(self):
         raise NotImplementedError()
@@ -47,7 +98,12 @@ class Extension:
 
     def write(self, zipf : zipfile.ZipFile):
         for asset in self.assets:
-            zipf.writestr(os.path.join(self.directory, asset.name), asset.serialize())
+            path = os.path.join(self.directory, asset.name)
+
+            # Assets that are unchanged since they were read are copied
+            # without recompressing them
+            if not _zip.copy_member(asset._origin, zipf, path):
+                zipf.writestr(path, asset.serialize())
 
     def process_threemf(self, tmf):
         pass
@@ -61,16 +117,16 @@ class Extension:
     def read(self, zipf : zipfile.ZipFile):
         '''
         The default read method will read all files in the Extension's
-        directory as RawFile assets.
+        directory as assets made by make_asset. The content of each asset is
+        only read from zipf when it is first accessed, so zipf must stay open
+        until then.
         '''
         dir_with_sep = self.directory + '/'
 
-        for f in zipf.namelist():
-            if f.startswith(dir_with_sep) and len(f) > len(dir_with_sep):
-                fname = f.lstrip(dir_with_sep)
-                asset = self.make_asset(fname)
-                asset.deserialize(zipf.read(f))
-                self.assets.append(asset)
+        for info in _zip.index(zipf).members(self.directory):
+            asset = self.make_asset(info.filename[len(dir_with_sep):])
+            asset._source = asset._origin = _zip.Member(zipf, info)
+            self.assets.append(asset)
 
 class Cura(Extension):
     '''
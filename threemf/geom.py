@@ -44,7 +44,7 @@ class Cube(Geometry):
         quad_to_facets = lambda A, B, C, D: (np.array([A, B, D]), np.array([C, D, B]))
 
         facets = [
-            *quad_to_facets(p1, p2, p3, p4),
+            *quad_to_facets(p1, p4, p3, p2),
             *quad_to_facets(p1, p2, p6, p5),
             *quad_to_facets(p2, p3, p7, p6),
             *quad_to_facets(p3, p4, p8, p7),
@@ -54,9 +54,6 @@ class Cube(Geometry):
 
         data = np.zeros(len(facets), dtype=stl.Mesh.dtype)
 
-        i = 0
-        for f in facets:
-            data['vectors'][i] = f
-            i += 1
+        data['vectors'] = facets
 
         return stl.Mesh(data)
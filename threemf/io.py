@@ -1,58 +1,363 @@
+import fnmatch
 import zipfile
 import typing
-import xml.etree.cElementTree as xml
+import xml.etree.ElementTree as xml
 
-from . import ThreeMF, ThreeMFException
+from . import ThreeMF, ThreeMFException, _zip, binary, model
+
+class Compression:
+    """
+    Per part compression policy for Writer and StreamWriter.
+
+    core: (method, level) used for the model parts, content types and
+        relationships. The 3MF specification only allows ZIP_STORED and
+        ZIP_DEFLATED for these.
+    assets: (method, level) used for extension assets, which may also use
+        ZIP_BZIP2 and ZIP_LZMA.
+    rules: sequence of (pattern, (method, level)) pairs. The first pattern
+        that matches the path of an extension asset (with fnmatch) overrides
+        assets for it.
+
+    A level of None is the default level of the method. Binary mesh sidecars
+    are always stored, so they can be memory-mapped.
+    """
+
+    _CORE_METHODS = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+    def __init__(self, core=(zipfile.ZIP_DEFLATED, None), assets=(zipfile.ZIP_DEFLATED, None), rules=()):
+        if core[0] not in Compression._CORE_METHODS:
+            raise ThreeMFException('3MF core parts must be stored or deflated')
+
+        self.core = core
+        self.assets = assets
+        self.rules = tuple(rules)
+
+    def asset(self, path : str):
+        """
+        Returns the (method, level) of the extension asset at path
+        """
+        for pattern, policy in self.rules:
+            if fnmatch.fnmatch(path, pattern):
+                return policy
+
+        return self.assets
+
+def _set_compression(zipf : zipfile.ZipFile, policy):
+    # ZipFile.open and writestr with a name use these for new members
+    zipf.compression, zipf.compresslevel = policy
+
+# Assets that are already compressed gain nothing from compressing them again
+_PRECOMPRESSED = tuple(
+    (pattern, (zipfile.ZIP_STORED, None))
+    for pattern in ('*.png', '*.jpg', '*.jpeg', '*.webp', '*.gz', '*.zip', '*.3mf')
+)
+
+# Fastest deflate, for latency sensitive writes
+Compression.FAST = Compression(
+    core=(zipfile.ZIP_DEFLATED, 1),
+    assets=(zipfile.ZIP_DEFLATED, 1),
+    rules=_PRECOMPRESSED
+)
+
+# Smallest output, for archiving
+Compression.SMALL = Compression(
+    core=(zipfile.ZIP_DEFLATED, 9),
+    assets=(zipfile.ZIP_LZMA, None),
+    rules=_PRECOMPRESSED
+)
+
+class _AssetZipFile:
+    """
+    Wraps the ZipFile passed to Extension.write so that every asset is
+    compressed as the Compression policy says
+    """
+
+    def __init__(self, zipf : zipfile.ZipFile, compression : Compression):
+        self._zipf = zipf
+        self._compression = compression
+
+    def set_compression(self, arcname : str) -> zipfile.ZipFile:
+        _set_compression(self._zipf, self._compression.asset(arcname))
+        return self._zipf
+
+    def writestr(self, zinfo_or_arcname, data, *args, **kwargs):
+        if isinstance(zinfo_or_arcname, str):
+            self.set_compression(zinfo_or_arcname)
+        return self._zipf.writestr(zinfo_or_arcname, data, *args, **kwargs)
+
+    def write(self, filename, arcname=None, *args, **kwargs):
+        self.set_compression(arcname or filename)
+        return self._zipf.write(filename, arcname, *args, **kwargs)
+
+    def open(self, name, mode='r', *args, **kwargs):
+        if isinstance(name, str) and mode == 'w':
+            self.set_compression(name)
+        return self._zipf.open(name, mode, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._zipf, name)
+
+def _write_extensions(zipf : zipfile.ZipFile, extensions, compression : Compression):
+    assets = _AssetZipFile(zipf, compression)
+
+    for ext in extensions:
+        ext.write(assets)
+
+    _set_compression(zipf, compression.core)
 
 class Writer:
-    def write(self, tmf : ThreeMF, tmffile : typing.io.BinaryIO):
+    def __init__(self, executor=None, binary_mesh=False, compression=None):
+        """
+            executor: optional concurrent.futures.Executor used to format the
+                objects of each model concurrently. The objects are still
+                written to the archive in their original order. Formatting is
+                CPU bound, so a ProcessPoolExecutor is needed to see a speedup.
+            binary_mesh: if True, a binary copy of the meshes of each model is
+                stored next to it (see the binary module), which Reader loads
+                without parsing. The model XML is written as usual.
+            compression: Compression policy, such as Compression.FAST or
+                Compression.SMALL. By default every part is deflated at the
+                default level.
+        """
+        self._executor = executor
+        self._binary_mesh = binary_mesh
+        self._compression = compression if compression is not None else Compression()
+
+    def write(self, tmf : ThreeMF, tmffile : typing.BinaryIO):
         """
             tmf: ThreeMF object
             tmffile: file like object
         """
 
-        z = zipfile.ZipFile(tmffile, mode='w', compression=zipfile.ZIP_DEFLATED)
+        z = zipfile.ZipFile(tmffile, mode='w')
+        _set_compression(z, self._compression.core)
+
+        content_types = tmf._content_types_xml
 
-        z.writestr(tmf._CONTENT_TYPES_PATH, xml.tostring(tmf._content_types_xml, encoding='utf8'))
+        if self._binary_mesh:
+            default = xml.Element('Default')
+            default.set('ContentType', binary.CONTENT_TYPE)
+            default.set('Extension', binary.EXTENSION)
+            content_types.append(default)
+
+        z.writestr(tmf._CONTENT_TYPES_PATH, xml.tostring(content_types, encoding='utf8'))
         z.writestr(tmf._RELS_PATH, xml.tostring(tmf._relationships_xml, encoding='utf8'))
 
         for m in tmf.models:
-            z.writestr(m.path, xml.tostring(m.serialize(), encoding='utf8'))
+            # A model that is unchanged since it was read is copied from its
+            # source archive as is
+            copied = m._unchanged() and _zip.copy_member(m._source, z, m.path)
+
+            if not copied:
+                # Stream the model into the archive in chunks instead of
+                # building and serializing the whole element tree in memory
+                with z.open(m.path, 'w', force_zip64=m._estimated_size() > zipfile.ZIP64_LIMIT) as f:
+                    m.write(f, self._executor)
+
+            if self._binary_mesh:
+                binary.write(z, m)
 
-        for ext in tmf.extensions:
-            ext.write(z)
+        _write_extensions(z, tmf.extensions, self._compression)
 
         z.close()
 
+class StreamWriter:
+    """
+    Writes a 3MF file with a single model one object at a time, for files too
+    large to build in memory as a whole:
+
+        with io.StreamWriter(f) as w:
+            part = w.object_from_mesh(make_part())
+            w.add_build_item(part, transform)
+
+    Each object is written to the archive as soon as it is added, so its mesh
+    can be freed right away. Only the build items are kept until close().
+    """
+
+    def __init__(self, tmffile : typing.BinaryIO, unit='millimeter', force_zip64=True, compression=None):
+        """
+            tmffile: file like object
+            unit: unit of the model
+            force_zip64: the size of the model is not known in advance, so by
+                default it is written with Zip64 headers to allow models over
+                4 GiB. Set to False for readers that do not support Zip64.
+            compression: Compression policy, as for Writer
+        """
+        self.extensions = []
+        self._compression = compression if compression is not None else Compression()
+
+        self._model = model.Model(ThreeMF._THREED_MODEL_PATH)
+        self._model.unit = unit
+        self._object_ids = set()
+
+        self._tmf = ThreeMF()
+        self._tmf.models.append(self._model)
+
+        self._zipf = zipfile.ZipFile(tmffile, mode='w')
+        _set_compression(self._zipf, self._compression.core)
+
+        self._zipf.writestr(ThreeMF._CONTENT_TYPES_PATH, xml.tostring(self._tmf._content_types_xml, encoding='utf8'))
+        self._zipf.writestr(ThreeMF._RELS_PATH, xml.tostring(self._tmf._relationships_xml, encoding='utf8'))
+
+        self._f = self._zipf.open(self._model.path, 'w', force_zip64=force_zip64)
+        self._f.write(self._model._header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._f is not None:
+            # Close the archive without finishing the model
+            self._f.close()
+            self._f = None
+            self._zipf.close()
+
+    def add_object(self, obj : model.ObjectModel):
+        """
+        Writes obj to the model. The objects of its components must have been
+        added before it.
+        """
+        if self._f is None:
+            raise ThreeMFException('StreamWriter is closed')
+
+        if obj.id in self._object_ids:
+            raise ThreeMFException('Duplicate object id {}'.format(obj.id))
+
+        for c in obj.components:
+            if c.objectid not in self._object_ids:
+                raise ThreeMFException(
+                    'Component of object {} references object {} before it was added'.format(obj.id, c.objectid)
+                )
+
+        for chunk in model.Model._object_chunks(obj):
+            self._f.write(chunk)
+
+        self._object_ids.add(obj.id)
+        self._model._next_object_id = max(self._model._next_object_id, obj.id + 1)
+
+    def object_from_mesh(self, m : 'mesh.Mesh') -> model.ObjectModel:
+        """
+        Writes an object with mesh m and the next free id, and returns it
+        """
+        obj = model.ObjectModel(self._model._next_object_id)
+        obj.mesh = m
+
+        self.add_object(obj)
+
+        return obj
+
+    def add_build_item(self, obj, transform=None):
+        """
+            obj: ObjectModel or object id
+        """
+        objectid = obj if isinstance(obj, int) else obj.id
+        self._model.build.items.append(model.BuildItem(objectid, transform))
+
+    def close(self):
+        """
+        Writes the build and the extensions and closes the archive
+        """
+        if self._f is None:
+            return
+
+        try:
+            for item in self._model.build.items:
+                if item.objectid not in self._object_ids:
+                    raise ThreeMFException('Build item references unknown object {}'.format(item.objectid))
+
+            self._f.write(b'</resources>')
+            self._f.write(self._model._build_xml())
+            self._f.write(b'</model>')
+            self._f.close()
+
+            _write_extensions(self._zipf, self.extensions, self._compression)
+        finally:
+            self._f.close()
+            self._f = None
+            self._zipf.close()
+
 class Reader:
-    def __init__(self):
+    def __init__(self, executor=None, lazy=False, cache=None, binary_mesh=True):
+        """
+            executor: optional concurrent.futures.Executor used to parse the
+                model parts of a 3MF concurrently. With a ProcessPoolExecutor
+                each model part is read into memory and sent to a worker,
+                otherwise the workers parse straight from the archive.
+            lazy: if True, the mesh of each object is only parsed when it is
+                first accessed, and the content of each extension asset is
+                only read when it is first accessed. Assets of classes that
+                override deserialize are read with the file, as what they
+                deserialize may not be in their content. The build, components
+                and metadata are read as usual. The 3MF file must stay open
+                until all needed meshes and assets have been accessed. Each
+                mesh of a compressed model is found by inflating the model
+                up to it.
+            cache: optional cache.ParseCache. Models of archives found in
+                the cache are loaded from it instead of being parsed, and
+                parsed models are added to it. Extensions are always read
+                from the archive.
+            binary_mesh: if True, meshes are loaded from the binary mesh
+                sidecar of a model when there is one that matches the model
+                XML. They are memory-mapped when the 3MF is a file on disk.
+                With a ProcessPoolExecutor the workers parse the XML without
+                its meshes and the sidecar is read in this process.
+        """
         self._extensions = []
+        self._executor = executor
+        self._lazy = lazy
+        self._cache = cache
+        self._binary_mesh = binary_mesh
 
     def register_extension(self, cls):
         ext = cls()
         self._extensions.append(ext)
         return ext
 
-    def read(self, tmf : ThreeMF, tmffile : typing.io.BinaryIO):
+    def read(self, tmf : ThreeMF, tmffile : typing.BinaryIO):
         z = zipfile.ZipFile(tmffile)
 
         content_types_xml = z.read(tmf._CONTENT_TYPES_PATH).decode('utf-8')
         relationships_xml = z.read(tmf._RELS_PATH).decode('utf-8')
 
-        tmf._load(
-            z,
-            content_types_xml,
-            relationships_xml
-        )
+        cached = None
+
+        if self._cache is not None:
+            key = self._cache.key(tmffile, z)
+            cached = self._cache.load(key)
+
+        if cached is not None:
+            tmf.models.extend(cached)
+        else:
+            nmodels = len(tmf.models)
+
+            tmf._load(
+                z,
+                content_types_xml,
+                relationships_xml,
+                self._executor,
+                self._lazy,
+                self._binary_mesh
+            )
+
+            if self._cache is not None:
+                self._cache.store(key, tmf.models[nmodels:])
 
         for ext in self._extensions:
             ext.read(z)
             tmf.extensions.append(ext)
 
+            # Extensions may read assets lazily, load them while the file
+            # is open unless they are loaded when content is accessed
+            for asset in ext.assets:
+                if not self._lazy or not asset._lazy:
+                    asset._load()
+
         for ext in self._extensions:
             ext.process_threemf(tmf)
 
-    def verify(self, tmffile: typing.io.BinaryIO, max_file_size_mb: int = 100):
+    def verify(self, tmffile: typing.BinaryIO, max_file_size_mb: int = 100):
         z = zipfile.ZipFile(tmffile)
 
         max_bytes = max_file_size_mb * 1024 * 1024
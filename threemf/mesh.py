@@ -1,86 +1,572 @@
-import copy
+import hashlib
 import sys
 import numpy as np
 
+from . import bvh, simplify
+
 try:
     import stl
     NUMPY_STL = True
 except:
     NUMPY_STL = False
 
+# Data types accepted for the array storage of a Mesh. Arrays of any other
+# type are converted to the first (default) type in each tuple.
+VERTEX_DTYPES = (np.float64, np.float32)
+TRIANGLE_DTYPES = (np.int32, np.int64)
+
+# Number of triangles whose corners are gathered at once by the analysis
+# methods, which bounds their temporary memory
+_ANALYSIS_BLOCK = 1 << 20
+
+def _cross(u, v):
+    '''
+    The cross products of the rows of two (N, 3) arrays, faster than np.cross
+    '''
+    u0, u1, u2 = u.T
+    v0, v1, v2 = v.T
+
+    result = np.empty_like(u)
+    result[:, 0] = u1 * v2 - u2 * v1
+    result[:, 1] = u2 * v0 - u0 * v2
+    result[:, 2] = u0 * v1 - u1 * v0
+
+    return result
+
+def _lengths(rows):
+    return np.sqrt(np.einsum('ij,ij->i', rows, rows))
+
 class Vertex:
+    __slots__ = ('_data', )
+
     def __init__(self, x=0.0, y=0.0, z=0.0):
-        self.x = float(x)
-        self.y = float(y)
-        self.z = float(z)
+        self._data = np.array((x, y, z), dtype=np.float64)
+
+    @classmethod
+    def _view(cls, row):
+        '''
+        Returns a Vertex that reads and writes the given row of a Mesh's
+        vertex array instead of owning its own coordinates
+        '''
+        v = cls.__new__(cls)
+        v._data = row
+        return v
+
+    @property
+    def x(self):
+        return float(self._data[0])
+
+    @x.setter
+    def x(self, value):
+        self._data[0] = value
+
+    @property
+    def y(self):
+        return float(self._data[1])
+
+    @y.setter
+    def y(self, value):
+        self._data[1] = value
+
+    @property
+    def z(self):
+        return float(self._data[2])
+
+    @z.setter
+    def z(self, value):
+        self._data[2] = value
 
     def transform(self, T):
         """
-        TODO Re-examine this transformation. When combined with the
-        Mesh.center method, it was making all y and z equal to 0.
+        Applies the 4x4 affine transformation matrix T to the vertex
         """
-        X = np.multiply(T, np.matrix([[self.x], [self.y], [self.z], [1.0]]))
-        self.x = X[0,0]
-        self.y = X[1,0]
-        self.z = X[2,0]
+        T = np.asarray(T, dtype=np.float64)
+        self._data[:] = T[:3, :3] @ self._data + T[:3, 3]
 
 class Triangle:
+    __slots__ = ('_data', )
+
     def __init__(self, v1=0, v2=0, v3=0):
-        self.v1 = v1
-        self.v2 = v2
-        self.v3 = v3
+        self._data = np.array((v1, v2, v3), dtype=np.int64)
+
+    @classmethod
+    def _view(cls, row):
+        '''
+        Returns a Triangle that reads and writes the given row of a Mesh's
+        triangle array instead of owning its own vertex indices
+        '''
+        t = cls.__new__(cls)
+        t._data = row
+        return t
+
+    @property
+    def v1(self):
+        return int(self._data[0])
+
+    @v1.setter
+    def v1(self, value):
+        self._data[0] = value
+
+    @property
+    def v2(self):
+        return int(self._data[1])
+
+    @v2.setter
+    def v2(self, value):
+        self._data[1] = value
+
+    @property
+    def v3(self):
+        return int(self._data[2])
+
+    @v3.setter
+    def v3(self, value):
+        self._data[2] = value
+
+def _as_rows(values, item_cls, dtypes):
+    '''
+    Converts an (N, 3) array-like, a sequence of Vertex/Triangle objects or a
+    row list view into a contiguous (N, 3) numpy array of one of dtypes
+    '''
+    if isinstance(values, _RowList):
+        values = values.array
+    elif not isinstance(values, np.ndarray):
+        values = [v._data if isinstance(v, item_cls) else v for v in values]
+        if len(values) == 0:
+            return np.empty((0, 3), dtype=dtypes[0])
+        values = np.asarray(values, dtype=dtypes[0])
+
+    arr = np.asarray(values)
+
+    if arr.dtype not in dtypes:
+        arr = arr.astype(dtypes[0])
+
+    return np.ascontiguousarray(arr.reshape(-1, 3))
+
+def _mix64(x):
+    '''
+    The splitmix64 finalizer, used to hash arrays of uint64 values
+    '''
+    x = x ^ (x >> np.uint64(30))
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+def _first_occurrence(rows):
+    '''
+    Returns, for every row of an (N, 3) array, the index of the first row with
+    identical values. Rows are grouped by sorting a 64 bit hash of their values
+    instead of comparing all pairs of rows.
+    '''
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Adding zero turns -0.0 into 0.0 so both hash to the same position
+    rows = np.ascontiguousarray(rows + 0)
+
+    bits = rows.view('u{}'.format(rows.dtype.itemsize)).astype(np.uint64)
+    h = _mix64(_mix64(_mix64(bits[:, 0]) ^ bits[:, 1]) ^ bits[:, 2])
+
+    # A stable sort keeps equal hashes in their original order, so the first
+    # entry of every run of equal hashes is the first occurrence
+    order = np.argsort(h, kind='stable')
+    sh = h[order]
+
+    run_start = np.empty(len(sh), dtype=bool)
+    run_start[0] = True
+    np.not_equal(sh[1:], sh[:-1], out=run_start[1:])
+
+    rep_sorted = order[run_start][np.cumsum(run_start) - 1]
+
+    if not np.array_equal(rows[order], rows[rep_sorted]):
+        # Hash collision (or NaN coordinates), fall back to a full row sort
+        _, first, inverse = np.unique(rows, axis=0, return_index=True, return_inverse=True)
+        return first[inverse.reshape(-1)]
+
+    rep = np.empty_like(order)
+    rep[order] = rep_sorted
+
+    return rep
+
+# Size of the grid cells used to find close vertices, in multiples of the
+# tolerance. It must be at least 2, so the vertices close to a vertex are in its
+# own cell or in the cells on the sides it is nearest to. Larger cells put fewer
+# vertices near a side, at the cost of more vertices per cell.
+_CELL_SIZE = 8.
+
+# The non-empty subsets of the three axes, as masks
+_AXIS_SUBSETS = [np.array(mask) for mask in np.ndindex(2, 2, 2) if any(mask)]
+
+def _cell_hash(cells):
+    return _mix64(_mix64(_mix64(cells[:, 0].astype(np.uint64)) ^ cells[:, 1].astype(np.uint64)) ^ cells[:, 2].astype(np.uint64))
+
+def _close_pairs(rows, tolerance):
+    '''
+    Returns (a, b): the indices of the pairs of rows of an (N, 3) array that
+    are at most tolerance apart. A pair may be returned twice. The rows are put
+    in a grid of cells larger than twice the tolerance, so a row can only be
+    close to rows in its own cell or in the neighbouring cells across the sides
+    it is within tolerance of, and only the candidates in those cells are
+    compared.
+    '''
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    with np.errstate(invalid='ignore'):
+        # Clipping keeps the cells of huge coordinates in range. Such
+        # coordinates can only be close if they are equal, which the distance
+        # check still decides.
+        scaled = np.clip(rows / (_CELL_SIZE * tolerance), -2. ** 62, 2. ** 62)
+        cells = np.floor(scaled).astype(np.int64)
+
+    # Direction to the nearest side of the cell along each axis, and the
+    # distance to it
+    frac = scaled - cells
+    upper = frac >= 0.5
+    direction = np.where(upper, 1, -1)
+    gap = np.square(np.where(upper, 1. - frac, frac) * (_CELL_SIZE * tolerance))
+
+    # Rows are grouped by the hash of their cell. Cells whose hashes collide
+    # share a group, which only adds candidates.
+    h = _cell_hash(cells)
+    order = np.argsort(h, kind='stable')
+    sh = h[order]
+
+    group_start = np.flatnonzero(np.concatenate(([True], sh[1:] != sh[:-1])))
+    group_end = np.append(group_start[1:], len(sh))
+    group_hash = sh[group_start]
+
+    a = [np.empty(0, dtype=np.int64)]
+    b = [np.empty(0, dtype=np.int64)]
+
+    def add(first, stop, rows_from):
+        # Pairs every row of rows_from with the sorted rows first..stop
+        counts = stop - first
+        total = counts.sum()
+        if total == 0:
+            return
+
+        left = np.repeat(rows_from, counts)
+        ends = np.cumsum(counts)
+        right = order[np.repeat(first - ends + counts, counts) + np.arange(total)]
+
+        diff = rows[left] - rows[right]
+        close = np.einsum('ij,ij->i', diff, diff) <= tolerance * tolerance
+
+        a.append(left[close])
+        b.append(right[close])
+
+    # Rows in the same cell, each with the rows after it
+    own_end = np.repeat(group_end, group_end - group_start)
+    add(np.arange(1, len(order) + 1), own_end, order)
+
+    for mask in _AXIS_SUBSETS:
+        # Rows within tolerance of the neighbouring cell across the sides
+        # of the axes in mask
+        near = np.flatnonzero(gap @ mask <= tolerance * tolerance)
+        if len(near) == 0:
+            continue
+
+        nh = _cell_hash(cells[near] + direction[near] * mask)
+        g = np.minimum(np.searchsorted(group_hash, nh), len(group_hash) - 1)
+        found = group_hash[g] == nh
+
+        add(group_start[g[found]], group_end[g[found]], near[found])
+
+    return np.concatenate(a), np.concatenate(b)
+
+def _components(n, a, b):
+    '''
+    Returns, for each of n nodes, the lowest node connected to it through
+    the edges (a, b)
+    '''
+    labels = np.arange(n)
+
+    while True:
+        la = labels[a]
+        lb = labels[b]
+
+        if np.array_equal(la, lb):
+            return labels
+
+        # Hook the larger label of every edge onto the smaller one, then
+        # point every node at its root
+        low = np.minimum(la, lb)
+        np.minimum.at(labels, la, low)
+        np.minimum.at(labels, lb, low)
+
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+class _RowList:
+    '''
+    A lightweight, list-like view of the rows of one of a Mesh's arrays.
+    Items are returned as Vertex/Triangle objects that share memory with
+    the underlying array, so no per-element objects are stored.
+    '''
+
+    _item_cls = None
+    _dtypes = None
+    _attr = None
+
+    def __init__(self, mesh):
+        self._mesh = mesh
+
+    @property
+    def array(self):
+        return getattr(self._mesh, self._attr)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, i):
+        arr = self.array
+        if isinstance(i, slice):
+            return [self._item_cls._view(row) for row in arr[i]]
+        return self._item_cls._view(arr[i])
+
+    def __setitem__(self, i, value):
+        if not isinstance(i, slice):
+            self.array[i] = _as_rows([value], self._item_cls, self._dtypes)
+            self._mesh.invalidate_bvh()
+            return
+
+        arr = self.array
+        rows = _as_rows(value, self._item_cls, self._dtypes)
+        start, stop, step = i.indices(len(arr))
+
+        if len(rows) == len(range(start, stop, step)):
+            arr[i] = rows
+            self._mesh.invalidate_bvh()
+        elif step == 1:
+            # Like a list, a contiguous slice can be replaced by a different
+            # number of items
+            setattr(self._mesh, self._attr, np.concatenate((arr[:start], rows.astype(arr.dtype), arr[max(start, stop):])))
+        else:
+            raise ValueError('attempt to assign sequence of size {} to extended slice of size {}'.format(
+                len(rows), len(range(start, stop, step))
+            ))
+
+    def __iter__(self):
+        for row in self.array:
+            yield self._item_cls._view(row)
+
+    def append(self, item):
+        self.extend([item])
+
+    def extend(self, items):
+        self._mesh._append_rows(self._attr, _as_rows(items, self._item_cls, self._dtypes))
+
+class VertexList(_RowList):
+    _item_cls = Vertex
+    _dtypes = VERTEX_DTYPES
+    _attr = 'vertex_array'
+
+class TriangleList(_RowList):
+    _item_cls = Triangle
+    _dtypes = TRIANGLE_DTYPES
+    _attr = 'triangle_array'
 
 class Mesh:
-    def __init__(self):
-        self.vertices = []
-        self.triangles = []
+    '''
+    A triangle mesh stored as a contiguous (N, 3) float vertex array and an
+    (M, 3) integer triangle array of indices into the vertices. The vertices
+    and triangles attributes provide list-like views of the arrays as Vertex
+    and Triangle objects.
+    '''
+
+    def __init__(self, vertices=None, triangles=None):
+        # The arrays are over-allocated when rows are appended one at a time,
+        # so only the first _nvertices/_ntriangles rows are valid
+        self._vertex_buffer = np.empty((0, 3), dtype=VERTEX_DTYPES[0])
+        self._triangle_buffer = np.empty((0, 3), dtype=TRIANGLE_DTYPES[0])
+        self._nvertices = 0
+        self._ntriangles = 0
+        self._bvh = None
+
+        if vertices is not None:
+            self.vertex_array = vertices
+
+        if triangles is not None:
+            self.triangle_array = triangles
+
+    @property
+    def vertex_array(self) -> 'NDArray[float]':
+        return self._vertex_buffer[:self._nvertices]
+
+    @vertex_array.setter
+    def vertex_array(self, values):
+        self._vertex_buffer = _as_rows(values, Vertex, VERTEX_DTYPES)
+        self._nvertices = len(self._vertex_buffer)
+        self._bvh = None
+
+    @property
+    def triangle_array(self) -> 'NDArray[int]':
+        return self._triangle_buffer[:self._ntriangles]
+
+    @triangle_array.setter
+    def triangle_array(self, values):
+        self._triangle_buffer = _as_rows(values, Triangle, TRIANGLE_DTYPES)
+        self._ntriangles = len(self._triangle_buffer)
+        self._bvh = None
+
+    @property
+    def vertices(self) -> VertexList:
+        return VertexList(self)
+
+    @vertices.setter
+    def vertices(self, values):
+        self.vertex_array = values
+
+    @property
+    def triangles(self) -> TriangleList:
+        return TriangleList(self)
+
+    @triangles.setter
+    def triangles(self, values):
+        self.triangle_array = values
+
+    def _fingerprint(self) -> bytes:
+        '''
+        Returns a digest of the vertex and triangle arrays, to tell whether
+        the mesh changed
+        '''
+        h = hashlib.blake2b(digest_size=16)
+
+        for arr in (self.vertex_array, self.triangle_array):
+            arr = np.ascontiguousarray(arr)
+            h.update('{}{}'.format(arr.dtype.str, arr.shape).encode('ascii'))
+            h.update(arr)
+
+        return h.digest()
+
+    def _append_rows(self, attr, rows):
+        if attr == 'vertex_array':
+            buf, n = self._vertex_buffer, self._nvertices
+        else:
+            buf, n = self._triangle_buffer, self._ntriangles
+
+        required = n + len(rows)
+
+        if required > len(buf):
+            # Grow geometrically so appending rows one at a time is amortized O(1)
+            dtype = buf.dtype if n > 0 else rows.dtype
+            new_buf = np.empty((max(required, 2 * len(buf), 16), 3), dtype=dtype)
+            new_buf[:n] = buf[:n]
+            buf = new_buf
+
+        buf[n:required] = rows
+
+        if attr == 'vertex_array':
+            self._vertex_buffer, self._nvertices = buf, required
+        else:
+            self._triangle_buffer, self._ntriangles = buf, required
+
+        self._bvh = None
+
+    @property
+    def bvh(self) -> 'bvh.BVH':
+        '''
+        A bounding volume hierarchy over the triangles, built on first access
+        and kept until the mesh is changed through its methods, array setters
+        or the vertices and triangles lists. Call invalidate_bvh() after
+        changing the arrays, or Vertex and Triangle views, in place.
+        '''
+        if self._bvh is None:
+            self._bvh = bvh.BVH(self.vertex_array, self.triangle_array)
+        return self._bvh
+
+    def invalidate_bvh(self):
+        self._bvh = None
 
     def __add__(self, other):
         '''
         Assumes that the intersection of the two meshes being added consists of
         at most edges and/or vertices, but not entire triangles or volumes of space.
+
+        Vertices of other that exactly match a vertex of this mesh (or an earlier
+        vertex of other) are merged. Matches are found by sorting, so the cost
+        is O((N + M) log(N + M)) rather than O(N * M).
         '''
         if len(self.vertices) == 0:
             return other
 
-        c_mesh = copy.deepcopy(self)
+        n = len(self.vertex_array)
+        m = len(other.vertex_array)
 
-        vert_map = {}
+        rep = _first_occurrence(np.concatenate((self.vertex_array, other.vertex_array)))[n:]
 
-        for i, v in enumerate(other.vertices):
-            repeat = False
-            for j, ov in enumerate(c_mesh.vertices):
-                if (v.x == ov.x and v.y == ov.y and v.z == ov.z):
-                    vert_map[i] = j
-                    repeat = True
-                    break
+        # Vertices of other that are the first occurrence of their position are
+        # appended, in order, after the vertices of this mesh
+        is_new = rep == np.arange(n, n + m)
+        new_index = n - 1 + np.cumsum(is_new)
 
-            if not repeat:
-                c_mesh.vertices.append(v)
-                vert_map[i] = len(c_mesh.vertices) - 1
+        vert_map = np.where(rep < n, rep, new_index[np.maximum(rep - n, 0)])
 
-        for t in other.triangles:
-            v1 = vert_map[t.v1]
-            v2 = vert_map[t.v2]
-            v3 = vert_map[t.v3]
-            c_mesh.triangles.append(Triangle(v1, v2, v3))
+        return self.__class__(
+            np.concatenate((self.vertex_array, other.vertex_array[is_new])),
+            np.concatenate((
+                self.triangle_array,
+                vert_map[other.triangle_array].astype(self.triangle_array.dtype)
+            ))
+        )
 
-        return c_mesh
+    def weld(self, tolerance=0.0):
+        '''
+        Merges duplicate vertices in place and returns the number of vertices removed.
+
+        With a tolerance of 0 only vertices with identical coordinates are merged.
+        Otherwise vertices at most tolerance apart are merged, transitively, so a
+        chain of vertices each within tolerance of the next becomes one vertex.
+        Each group of merged vertices is replaced by the first of them. The cost
+        grows with the number of vertices within tolerance of each other, so the
+        tolerance should be small compared to the edges of the mesh. Triangles
+        that collapse as a result are removed.
+        '''
+        verts = self.vertex_array
 
-    @classmethod
-    def FromSTL(cls, stl_mesh):
-        mesh = cls()
+        if tolerance > 0.0:
+            # Identical vertices first, so stacks of them do not multiply the
+            # candidate pairs
+            first = _first_occurrence(verts)
+            unique = np.flatnonzero(first == np.arange(len(verts)))
+
+            a, b = _close_pairs(verts[unique], tolerance)
+            first = unique[_components(len(unique), a, b)][np.searchsorted(unique, first)]
+        else:
+            first = _first_occurrence(verts)
 
-        for p in stl_mesh.points:
-            vlen = len(mesh.vertices)
+        # Keep the first vertex of each group and renumber them in order
+        keep = first == np.arange(len(verts))
+        vert_map = (np.cumsum(keep) - 1)[first]
 
-            for i in range(3):
-                j = 3 * i
-                mesh.vertices.append(Vertex(p[j], p[j + 1], p[j + 2]))
+        tris = vert_map[self.triangle_array].astype(self.triangle_array.dtype)
+        degenerate = (tris[:, 0] == tris[:, 1]) | (tris[:, 1] == tris[:, 2]) | (tris[:, 2] == tris[:, 0])
 
-            mesh.triangles.append(Triangle(vlen, vlen + 1, vlen + 2))
+        self.vertex_array = verts[keep]
+        self.triangle_array = tris[~degenerate]
 
-        return mesh
+        return len(verts) - len(self.vertex_array)
+
+    @classmethod
+    def FromSTL(cls, stl_mesh):
+        '''
+        Creates a mesh with three unique vertices per facet of the STL mesh.
+        The facet coordinates are copied in one block and keep their float32
+        type; the copy is needed because numpy-stl interleaves them with the
+        normals and attributes of each facet.
+        '''
+        vertices = np.ascontiguousarray(stl_mesh.vectors).reshape(-1, 3)
+
+        index_type = np.int32 if len(vertices) <= np.iinfo(np.int32).max else np.int64
+        triangles = np.arange(len(vertices), dtype=index_type).reshape(-1, 3)
+
+        return cls(vertices, triangles)
 
     @classmethod
     def FromSTLFile(cls, stl_path):
@@ -93,32 +579,28 @@ class Mesh:
         if not NUMPY_STL:
             raise ImportError('numpy-stl module was not found')
 
-        data = np.zeros(len(self.triangles), dtype = stl.Mesh.dtype)
-
-        def vertex_to_array(vert: Vertex) -> 'NDArray[float]':
-            return np.array([vert.x, vert.y, vert.z])
+        data = np.zeros(len(self.triangle_array), dtype = stl.Mesh.dtype)
 
-        for i, f in enumerate(self.triangles):
-            vert1 = vertex_to_array(self.vertices[f.v1])
-            vert2 = vertex_to_array(self.vertices[f.v2])
-            vert3 = vertex_to_array(self.vertices[f.v3])
-            facet = np.array([vert1, vert2, vert3])
-            data['vectors'][i] = facet
+        data['vectors'] = self.vertex_array[self.triangle_array]
 
         return stl.Mesh(data)
 
     def bounding_box(self):
-        pmin = Vertex(sys.float_info.max, sys.float_info.max, sys.float_info.max)
-        pmax = Vertex(-sys.float_info.max, -sys.float_info.max, -sys.float_info.max)
-        for v in self.vertices:
-            pmin.x = min(pmin.x, v.x)
-            pmin.y = min(pmin.y, v.y)
-            pmin.z = min(pmin.z, v.z)
-            pmax.x = max(pmax.x, v.x)
-            pmax.y = max(pmax.y, v.y)
-            pmax.z = max(pmax.z, v.z)
-
-        return (pmin, pmax)
+        if len(self.vertex_array) == 0:
+            pmin = Vertex(sys.float_info.max, sys.float_info.max, sys.float_info.max)
+            pmax = Vertex(-sys.float_info.max, -sys.float_info.max, -sys.float_info.max)
+            return (pmin, pmax)
+
+        pmin, pmax = self._bounds()
+
+        return (Vertex(*pmin), Vertex(*pmax))
+
+    def _bounds(self):
+        '''
+        Returns the minimum and maximum corners of the bounding box as arrays
+        '''
+        verts = self.vertex_array
+        return verts.min(axis=0), verts.max(axis=0)
 
     def center(self):
         """
@@ -126,36 +608,265 @@ class Mesh:
         to (0, 0, 0).
         """
 
-        box = self.bounding_box()
-
         T = np.identity(4)
 
-        T[0,3] = -0.5 * (box[0].x + box[1].x)
-        T[1,3] = -0.5 * (box[0].y + box[1].y)
-        T[2,3] = -0.5 * (box[0].z + box[1].z)
+        if len(self.vertex_array) > 0:
+            pmin, pmax = self._bounds()
+            T[:3, 3] = -0.5 * (pmin + pmax)
 
         return T
 
-    def transform(self, T):
-        for v in self.vertices:
-            v.transform(T)
+    def transform(self, T, inplace=True) -> 'Mesh':
+        '''
+        Applies the 4x4 transformation matrix T to all vertices with a single
+        matrix product and returns the transformed mesh. If inplace is False
+        this mesh is left unchanged and a transformed copy is returned.
+        '''
+        T = np.asarray(T, dtype=np.float64)
+        verts = self.vertex_array
+
+        X = verts @ T[:3, :3].T
+        X += T[:3, 3]
+
+        if not np.array_equal(T[3], (0., 0., 0., 1.)):
+            # Projective transformation, divide by the homogeneous coordinate
+            X /= (verts @ T[3, :3] + T[3, 3])[:, np.newaxis]
+
+        if not inplace:
+            return self.__class__(X.astype(verts.dtype), self.triangle_array.copy())
+
+        if verts.flags.writeable:
+            verts[...] = X
+            self._bvh = None
+        else:
+            self.vertex_array = X.astype(verts.dtype)
+
+        return self
 
     def expand_vertices(self) -> 'Mesh':
         '''
         Returns a copy of this mesh that contains unique vertices for every triangle
         '''
-        mesh = self.__class__()
+        vertices = self.vertex_array[self.triangle_array].reshape(-1, 3)
+        triangles = np.arange(len(vertices), dtype=self.triangle_array.dtype).reshape(-1, 3)
 
-        n = 0
+        return self.__class__(vertices, triangles)
 
-        for t in self.triangles:
-            v1 = copy.copy(self.vertices[t.v1])
-            v2 = copy.copy(self.vertices[t.v2])
-            v3 = copy.copy(self.vertices[t.v3])
+    def _corner_blocks(self):
+        '''
+        Yields (start, a, b, c): the float64 corners of the triangles from
+        start on, _ANALYSIS_BLOCK triangles at a time
+        '''
+        verts = self.vertex_array
+        tris = self.triangle_array
 
-            mesh.vertices.extend([v1, v2, v3])
-            mesh.triangles.append(Triangle(n, n + 1, n + 2))
+        for start in range(0, len(tris), _ANALYSIS_BLOCK):
+            block = tris[start:start + _ANALYSIS_BLOCK]
+
+            # take is much faster than fancy indexing for gathering rows
+            yield (start, ) + tuple(
+                verts.take(block[:, i], axis=0).astype(np.float64, copy=False)
+                for i in range(3)
+            )
+
+    def _cross_products(self):
+        '''
+        Returns the (M, 3) cross products of the edges of every triangle,
+        along the normal with twice the area as length
+        '''
+        result = np.empty((len(self.triangle_array), 3))
+
+        for start, a, b, c in self._corner_blocks():
+            result[start:start + len(a)] = _cross(b - a, c - a)
+
+        return result
+
+    def face_normals(self) -> 'NDArray[float]':
+        '''
+        Returns the (M, 3) unit normals of the triangles, following the right
+        hand rule on the vertex order. Degenerate triangles get zero normals.
+        '''
+        normals = self._cross_products()
+        lengths = _lengths(normals)
+
+        np.divide(normals, lengths[:, np.newaxis], out=normals, where=lengths[:, np.newaxis] > 0)
+
+        return normals
+
+    def vertex_normals(self) -> 'NDArray[float]':
+        '''
+        Returns the (N, 3) unit normals of the vertices, the area weighted
+        average of the normals of the triangles around them. Vertices that are
+        not part of any triangle get zero normals.
+        '''
+        weighted = self._cross_products()
+        tris = self.triangle_array
+        nverts = len(self.vertex_array)
+
+        # bincount sums the normals onto the vertices of every corner, much
+        # faster than np.add.at
+        normals = np.zeros((nverts, 3))
+        for corner in range(3):
+            for axis in range(3):
+                normals[:, axis] += np.bincount(tris[:, corner], weights=weighted[:, axis], minlength=nverts)
+
+        lengths = _lengths(normals)
+        np.divide(normals, lengths[:, np.newaxis], out=normals, where=lengths[:, np.newaxis] > 0)
+
+        return normals
+
+    def face_areas(self) -> 'NDArray[float]':
+        return 0.5 * _lengths(self._cross_products())
+
+    def area(self) -> float:
+        '''
+        Returns the total surface area of the triangles
+        '''
+        total = 0.
+
+        for _, a, b, c in self._corner_blocks():
+            total += _lengths(_cross(b - a, c - a)).sum()
+
+        return 0.5 * total
+
+    def volume(self) -> float:
+        '''
+        Returns the signed volume enclosed by the triangles, positive when
+        their normals point outwards. The result is only meaningful for a
+        watertight mesh with consistent winding.
+        '''
+        if len(self.triangle_array) == 0:
+            return 0.
+
+        # Sum the signed volumes of the tetrahedra between each triangle and
+        # a point of the mesh, which is more accurate than using the origin
+        # when the mesh is far from it
+        origin = self.vertex_array[self.triangle_array[0, 0]].astype(np.float64)
+
+        total = 0.
+
+        for _, a, b, c in self._corner_blocks():
+            a -= origin
+            b -= origin
+            c -= origin
+            total += np.einsum('ij,ij->', a, _cross(b, c))
+
+        return total / 6.
+
+    def _edges(self):
+        '''
+        Returns (edges, counts, forward) for every undirected edge of the
+        triangles: its two vertex indices as an (E, 2) array, lowest first,
+        the number of triangles using it and how many of them traverse it from
+        the lowest to the highest index.
+        '''
+        tris = self.triangle_array
+        n = max(len(self.vertex_array), 1)
+
+        a = tris.ravel().astype(np.int64)
+        b = tris[:, [1, 2, 0]].ravel().astype(np.int64)
+
+        # Encode each directed edge as one integer, the undirected edge in the
+        # high bits and the direction in the lowest, so a single sort groups
+        # the uses of every edge
+        keys = np.minimum(a, b)
+        keys *= n
+        keys += np.maximum(a, b)
+        keys <<= 1
+        keys |= a < b
+        del a, b
+
+        keys.sort()
+
+        undirected = keys >> 1
+        forward = keys
+        forward &= 1
+
+        starts = np.flatnonzero(np.r_[True, undirected[1:] != undirected[:-1]]) if len(keys) else np.empty(0, dtype=np.intp)
+
+        counts = np.diff(np.r_[starts, len(keys)])
+        forward = np.add.reduceat(forward, starts) if len(keys) else np.empty(0, dtype=np.int64)
+
+        edges = np.stack(np.divmod(undirected[starts], n), axis=1)
+
+        return edges, counts, forward
+
+    def open_edges(self) -> 'NDArray[int]':
+        '''
+        Returns the (K, 2) vertex indices of the edges used by a single
+        triangle, which border holes in the surface
+        '''
+        edges, counts, _ = self._edges()
+        return edges[counts == 1]
+
+    def non_manifold_edges(self) -> 'NDArray[int]':
+        '''
+        Returns the (K, 2) vertex indices of the edges shared by more than two
+        triangles
+        '''
+        edges, counts, _ = self._edges()
+        return edges[counts > 2]
+
+    def misoriented_edges(self) -> 'NDArray[int]':
+        '''
+        Returns the (K, 2) vertex indices of the edges shared by two triangles
+        that traverse them in the same direction, where the winding of one of
+        them is inverted relative to the other
+        '''
+        edges, counts, forward = self._edges()
+        return edges[(counts == 2) & (forward != 1)]
+
+    def is_watertight(self) -> bool:
+        '''
+        True if every edge is shared by exactly two triangles, so the surface
+        is closed without holes or non-manifold edges
+        '''
+        _, counts, _ = self._edges()
+        return len(counts) > 0 and bool((counts == 2).all())
+
+    def is_winding_consistent(self) -> bool:
+        '''
+        True if every edge shared by two triangles is traversed in opposite
+        directions by them, so neighbouring triangles face the same way
+        '''
+        _, counts, forward = self._edges()
+        return bool((forward[counts == 2] == 1).all())
+
+    def is_inverted(self) -> bool:
+        '''
+        True if the triangles of a watertight, consistently wound mesh face
+        inwards, which gives the mesh a negative volume
+        '''
+        return self.volume() < 0.
+
+    def decimate(self, target=0, max_error=None) -> 'Mesh':
+        '''
+        Returns a simplified copy of this mesh with at most target triangles,
+        made by collapsing the edges with the lowest quadric errors. With
+        max_error, no edge is collapsed whose error, the root mean square
+        distance of the new vertex to the planes of the original triangles
+        around it, is larger, so fewer triangles may be removed. Boundary and
+        non-manifold edges are kept and the topology is not changed, so the
+        target may not be reached either.
+        '''
+        verts, tris = simplify.decimate(self.vertex_array, self.triangle_array, target, max_error)
+
+        return self.__class__(
+            verts.astype(self.vertex_array.dtype),
+            tris.astype(self.triangle_array.dtype)
+        )
+
+    def lod_chain(self, targets, max_error=None) -> 'List[Mesh]':
+        '''
+        Returns meshes with at most each of the decreasing triangle counts in
+        targets, each simplified from the previous one so every level only
+        costs as much as the level before it
+        '''
+        chain = []
+        current = self
 
-            n += 3
+        for target in targets:
+            current = current.decimate(target, max_error)
+            chain.append(current)
 
-        return mesh
+        return chain
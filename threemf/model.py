@@ -1,5 +1,17 @@
+import array
+import collections
+import operator
+import os
+import re
+import shutil
+import tempfile
+import threading
+import typing
+import warnings
 import numpy as np
-import xml.etree.cElementTree as xml
+import xml.etree.ElementTree as xml
+from io import BytesIO
+from xml.sax.saxutils import quoteattr
 
 try:
     import stl
@@ -7,16 +19,731 @@ try:
 except:
     NUMPY_STL = False
 
-from . import mesh
+from . import mesh, ThreeMFException
+
+
+def _strip_ns(tag):
+    prefix, has_namespace, postfix = tag.partition('}')
+    return postfix if has_namespace else prefix
+
+
+def _read_mesh(events) -> mesh.Mesh:
+    '''
+    Reads a mesh from iterparse events, starting right after the start event
+    of a mesh element and consuming the events up to its end event. Vertex
+    and triangle elements are removed as soon as they have been read, or not
+    created at all by parsers that can read them into the arrays directly.
+    '''
+    parent = None
+    verts = array.array('d')
+    tris = array.array('i')
+
+    read_mesh_into = getattr(events, 'read_mesh_into', None)
+    if read_mesh_into is not None:
+        read_mesh_into(verts, tris)
+
+    for event, el in events:
+        tag = _strip_ns(el.tag)
+
+        if event == 'start':
+            if tag in ('vertices', 'triangles'):
+                parent = el
+            continue
+
+        if tag == 'vertex':
+            verts.extend((float(el.get('x')), float(el.get('y')), float(el.get('z'))))
+            del parent[:]
+        elif tag == 'triangle':
+            tris.extend((int(el.get('v1')), int(el.get('v2')), int(el.get('v3'))))
+            del parent[:]
+        elif tag == 'mesh':
+            el.clear()
+            break
+
+    return mesh.Mesh(
+        np.frombuffer(verts, dtype=np.float64).reshape(-1, 3),
+        np.frombuffer(tris, dtype=np.intc).reshape(-1, 3)
+    )
+
+
+class _StreamReader:
+    '''
+    A read-only binary file-like object over the bytes chunks produced by
+    the _generate method of a subclass
+    '''
+
+    def __init__(self):
+        self._chunks = self._generate()
+        self._buffer = bytearray()
+
+    def _generate(self):
+        raise NotImplementedError()
+
+    def read(self, n=-1):
+        while n < 0 or len(self._buffer) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if n < 0 or n > len(self._buffer):
+            n = len(self._buffer)
+
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+
+        return data
+
+
+class _MeshSkippingReader(_StreamReader):
+    '''
+    Wraps a binary stream of model XML and replaces every mesh element with an
+    empty one, so parsing the result only touches objects, components, metadata
+    and the build. The byte range that each mesh element occupied in the
+    source stream is appended to mesh_ranges as it is found, along with its
+    qualified tag name in mesh_tags and the namespace declarations in scope
+    at it, from the start tags of its ancestors, in mesh_namespaces. Whether
+    it has property references, pid or p1 attributes, is appended to
+    mesh_properties. other_resources is set if the resources element has
+    anything but objects. The start tag of the root element is kept in
+    root_start so the meshes can later be parsed on their own.
+
+    The empty mesh elements have the index of their range in a MESH_RANGE
+    attribute. Comments, CDATA sections and processing instructions are
+    skipped, so markup inside them is never taken for a mesh.
+    '''
+
+    MESH_RANGE = 'threemf-mesh-range'
+
+    _READ_SIZE = 1 << 20
+
+    # Markup that is skipped and the end of each
+    _SKIPPED = ((b'<!--', b'-->'), (b'<![CDATA[', b']]>'), (b'<?', b'?>'))
+
+    # A start tag, whose attribute values may contain '>'
+    _START_TAG = re.compile(rb'<([^\s/>!?]+)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+
+    # What ends a mesh element or has to be skipped inside it, by mesh tag
+    _MESH_CONTENT = {}
+
+    # Attributes that refer to property resources such as materials
+    _PROPERTY_REFERENCE = re.compile(rb'p(?:id|1)\s*=')
+
+    def __init__(self, f):
+        super().__init__()
+        self._f = f
+        self.mesh_ranges = []
+        self.mesh_tags = []
+        self.mesh_namespaces = []
+        self.mesh_properties = []
+        self.other_resources = False
+        self.root_start = None
+
+    def layout(self):
+        '''
+        Returns the _source_layout of a Model read from this reader
+        '''
+        return (
+            self.root_start, self.mesh_ranges, self.mesh_tags, self.mesh_namespaces,
+            self.mesh_properties, self.other_resources
+        )
+
+    @classmethod
+    def _mesh_content(cls, qname):
+        pattern = cls._MESH_CONTENT.get(qname)
+
+        if pattern is None:
+            pattern = cls._MESH_CONTENT[qname] = re.compile(
+                rb'<!--|<!\[CDATA\[|<\?|</' + re.escape(qname) + rb'(?=[\s>])'
+            )
+
+        return pattern
+
+    def _generate(self):
+        f = self._f
+        buf = b''
+        base = 0 # offset of buf in the source stream
+        pos = 0 # offset in buf up to which the markup has been scanned
+        eof = False
+
+        # {name: value} of the namespace declarations in scope at each open
+        # element
+        scopes = [{}]
+
+        # Number of scopes at the open resources element
+        resources = None
+
+        while True:
+            lt = buf.find(b'<', pos)
+            end = -1
+
+            if lt >= 0:
+                end, tag = self._markup_end(buf, lt, eof)
+
+            if end < 0:
+                # Everything before the markup that is cut off is passed
+                # through, then more is read
+                if eof:
+                    yield buf
+                    return
+
+                cut = lt if lt >= 0 else len(buf)
+                yield buf[:cut]
+                base += cut
+                buf = buf[cut:]
+                pos = 0
+
+                chunk = f.read(self._READ_SIZE)
+                eof = not chunk
+                buf += chunk
+                continue
+
+            pos = end
+
+            if tag is None:
+                if buf.startswith(b'</', lt) and len(scopes) > 1:
+                    scopes.pop()
+
+                    if len(scopes) == resources:
+                        resources = None
+                continue
+
+            qname, attrs = tag.group(1), tag.group(2)
+
+            if self.root_start is None:
+                self.root_start = tag.group(0)
+
+            local = qname.rpartition(b':')[2]
+
+            if local != b'mesh':
+                if local == b'resources' and not attrs.endswith(b'/'):
+                    resources = len(scopes)
+                elif resources is not None and len(scopes) == resources + 1 and local != b'object':
+                    self.other_resources = True
+
+                if not attrs.endswith(b'/'):
+                    scopes.append(_declared_namespaces(attrs, scopes[-1]))
+                continue
+
+            yield buf[:lt]
+
+            start = base + lt
+            properties = False
+
+            if not attrs.endswith(b'/'):
+                # Discard the mesh content up to the end of its end tag
+                end, buf, base, properties = self._skip_mesh(qname, buf, end, base)
+
+            self.mesh_ranges.append((start, base + end))
+            self.mesh_tags.append(qname)
+            self.mesh_namespaces.append(scopes[-1])
+            self.mesh_properties.append(properties)
+
+            yield b'<%s%s %s="%d"/>' % (qname, attrs.rstrip(b'/'), self.MESH_RANGE.encode('ascii'), len(self.mesh_ranges) - 1)
+
+            base += end
+            buf = buf[end:]
+            pos = 0
+
+    def _markup_end(self, buf, lt, eof):
+        '''
+        Returns (end, start tag match or None) for the markup starting at lt of
+        buf, or end -1 if buf ends before it does
+        '''
+        head = buf[lt:lt + 9]
+
+        if not eof and len(head) < 9 and any(opening.startswith(head) for opening, _ in self._SKIPPED):
+            # Cannot tell yet what kind of markup this is
+            return -1, None
+
+        for opening, closing in self._SKIPPED:
+            if head.startswith(opening):
+                end = buf.find(closing, lt + len(opening))
+                return (end + len(closing) if end >= 0 else -1), None
+
+        if head.startswith(b'</') or head.startswith(b'<!'):
+            end = buf.find(b'>', lt)
+            return (end + 1 if end >= 0 else -1), None
+
+        tag = self._START_TAG.match(buf, lt)
+
+        if tag is None:
+            # Not well formed if all of it has been read, which the parser
+            # reports
+            return (lt + 1 if eof else -1), None
+
+        return tag.end(), tag
+
+    def _skip_mesh(self, qname, buf, pos, base):
+        '''
+        Finds the end of the mesh element with tag qname whose content starts
+        at pos of buf, reading and discarding more of the stream as needed.
+        Returns (end, buf, base, properties) with the end of the element in
+        the new buf, and whether the content has property references.
+        '''
+        content = self._mesh_content(qname)
+
+        # Long enough for the start of any markup looked for
+        tail = max(9, len(qname) + 3)
+
+        properties = False
+        scanned = pos # offset in buf up to which properties were looked for
+
+        while True:
+            m = content.search(buf, pos)
+            end = -1
+
+            if m is not None:
+                found = m.group(0)
+                closing = b'>' if found.startswith(b'</') else dict(self._SKIPPED)[found]
+                end = buf.find(closing, m.end())
+
+                if end >= 0:
+                    end += len(closing)
+
+                    if found.startswith(b'</'):
+                        properties = properties or self._PROPERTY_REFERENCE.search(buf, scanned, end) is not None
+                        return end, buf, base, properties
+
+                    pos = end
+                    continue
+
+            keep = m.start() if m is not None else max(pos, len(buf) - tail)
+
+            # Up to the end of an attribute that starts before keep
+            properties = properties or self._PROPERTY_REFERENCE.search(buf, scanned, keep + tail) is not None
+            scanned = 0
+
+            base += keep
+            buf = buf[keep:]
+            pos -= min(pos, keep)
+
+            chunk = self._f.read(self._READ_SIZE)
+            if not chunk:
+                raise ThreeMFException('Unterminated mesh element in model')
+            buf += chunk
+
+
+class _MeshFragmentReader(_StreamReader):
+    '''
+    Reads a single mesh element from a range of a model XML stream, wrapped in
+    the model's root element, with the {name: value} namespace declarations
+    that were in scope at it
+    '''
+
+    def __init__(self, f, start, end, root_start, namespaces=None):
+        super().__init__()
+        self._f = f
+        self._start = start
+        self._end = end
+        self._root_start = root_start
+        self._namespaces = namespaces
+
+    def _generate(self):
+        yield self._root_start
+
+        chunks = _read_range(self._f, self._start, self._end)
+
+        if self._namespaces:
+            chunks = _declare_namespaces(chunks, self._namespaces)
+
+        yield from chunks
+
+        yield b'</' + re.match(rb'<([^\s/>]+)', self._root_start).group(1) + b'>'
+
+
+class _PartSpool:
+    '''
+    The model part at path of the zip file zipf, shared by the loaders of its
+    meshes. Seeking in a deflated zip member inflates it again from the start,
+    so the part is inflated once, on the first load, into a temporary file
+    that stays in memory up to _SPOOL_SIZE bytes and moves to disk beyond
+    that.
+    '''
+
+    _SPOOL_SIZE = 64 << 20
+
+    def __init__(self, zipf, path):
+        self.zipf = zipf
+        self.path = path
+        self._f = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        '''
+        Returns a binary file-like object over the part with its own position,
+        which can be used at the same time as others from other threads
+        '''
+        with self._lock:
+            if self._f is None:
+                f = tempfile.SpooledTemporaryFile(self._SPOOL_SIZE)
+                with self.zipf.open(self.path) as member:
+                    shutil.copyfileobj(member, f, _MeshSkippingReader._READ_SIZE)
+                self._f = f
+
+        return _SpoolView(self._f, self._lock)
+
+class _SpoolView:
+    '''
+    A read-only binary file-like object over the file f shared under lock
+    '''
+
+    def __init__(self, f, lock):
+        self._f = f
+        self._lock = lock
+        self._pos = 0
+
+    def seek(self, pos):
+        self._pos = pos
+
+    def read(self, n=-1):
+        with self._lock:
+            self._f.seek(self._pos)
+            data = self._f.read(n)
+
+        self._pos += len(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+class _MeshLoader:
+    '''
+    Loads the mesh element at a byte range of a model part, which is read
+    either from a _PartSpool or from the bytes of the part
+    '''
+
+    def __init__(self, source, path, start, end, root_start, iterparse, namespaces=None):
+        self.source = source
+        self.path = path
+        self.start = start
+        self.end = end
+        self.root_start = root_start
+        self.iterparse = iterparse
+        self.namespaces = namespaces
+
+    def open(self):
+        if isinstance(self.source, bytes):
+            return BytesIO(self.source)
+        return self.source.open()
+
+    def __call__(self) -> mesh.Mesh:
+        with self.open() as f:
+            reader = _MeshFragmentReader(f, self.start, self.end, self.root_start, self.namespaces)
+            events = self.iterparse(reader, events=('start', 'end'))
+            for event, el in events:
+                if event == 'start' and _strip_ns(el.tag) == 'mesh':
+                    return _read_mesh(events)
+
+        raise ThreeMFException('No mesh element found in {} at {}'.format(self.path, self.start))
+
+
+_NAMESPACE_DECLARATION = re.compile(r'(xmlns(?::[^\s=]+)?)\s*=\s*["\']([^"\']*)["\']')
+
+
+def _declared_namespaces(attrs, scope):
+    '''
+    Returns the {name: value} namespace declarations in scope inside an
+    element with the start tag attributes attrs, given those in scope at it
+    '''
+    if b'xmlns' not in attrs:
+        return scope
+
+    declared = dict(scope)
+    declared.update(_NAMESPACE_DECLARATION.findall(attrs.decode('utf-8')))
+    return declared
+
+
+def _declare_namespaces(chunks, namespaces):
+    '''
+    Yields the bytes chunks of an element with the {name: value} namespace
+    declarations added to its start tag, except those it makes itself
+    '''
+    head = b''
+    tag = None
+
+    for chunk in chunks:
+        head += chunk
+        tag = _MeshSkippingReader._START_TAG.match(head)
+        if tag is not None:
+            break
+
+    if tag is None:
+        raise ThreeMFException('Model ended inside the start tag of a mesh element')
+
+    own = dict(_NAMESPACE_DECLARATION.findall(tag.group(2).decode('utf-8')))
+
+    declarations = []
+    for name, value in namespaces.items():
+        if name not in own:
+            # Values are copied as they were written, so put them in quotes
+            # they do not contain
+            quote = '"' if '"' not in value else "'"
+            declarations.append(' {}={}{}{}'.format(name, quote, value, quote))
+
+    yield head[:tag.end(1)] + ''.join(declarations).encode('utf-8') + head[tag.end(1):]
+    yield from chunks
+
+
+def _read_range(f, start, end):
+    '''
+    Yields the bytes from start to end of the seekable binary file f
+    '''
+    f.seek(start)
+
+    remaining = end - start
+    while remaining > 0:
+        chunk = f.read(min(remaining, _MeshSkippingReader._READ_SIZE))
+        if not chunk:
+            raise ThreeMFException('Model ended before the end of a mesh element')
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _ordered_map(executor, fn, items, window=None):
+    '''
+    Like executor.map, but keeps at most window tasks in flight so finished
+    results do not pile up in memory faster than they are consumed
+    '''
+    if window is None:
+        window = 2 * (os.cpu_count() or 1)
+
+    pending = collections.deque()
+
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _object_bytes(obj):
+    return b''.join(Model._object_chunks(obj))
+
+
+class _IndexedList(list):
+    '''
+    A list that also indexes its items by key(item), so finding the first
+    item with a given key does not scan the list. Adding items updates the
+    index; removing, replacing or reordering them drops it, and it is
+    rebuilt on the next lookup. The key of an item must not change while it
+    is in the list.
+    '''
+
+    def __init__(self, key, items=()):
+        super().__init__(items)
+        self._key = key
+        self._index = None
+
+    def __reduce__(self):
+        return (self.__class__, (self._key, list(self)))
+
+    def _lookup(self):
+        if self._index is None:
+            index = {}
+            for item in self:
+                index.setdefault(self._key(item), item)
+            self._index = index
+
+        return self._index
+
+    def get(self, key, default=None):
+        '''
+        Returns the first item with the given key, or default
+        '''
+        return self._lookup().get(key, default)
+
+    def _added(self, items):
+        if self._index is not None:
+            for item in items:
+                self._index.setdefault(self._key(item), item)
+
+    def _changed(self):
+        self._index = None
+
+    def append(self, item):
+        super().append(item)
+        self._added((item, ))
+
+    def extend(self, items):
+        items = list(items)
+        super().extend(items)
+        self._added(items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def insert(self, i, item):
+        super().insert(i, item)
+        # The item may come before another one with the same key
+        self._changed()
+
+    def pop(self, *args):
+        self._changed()
+        return super().pop(*args)
+
+    def remove(self, item):
+        super().remove(item)
+        self._changed()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def __setitem__(self, i, value):
+        super().__setitem__(i, value)
+        self._changed()
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
+
+
+# The transform of build items and components created without one. It is
+# shared by all of them, so it is read-only: assign a new matrix to change the
+# transform of one of them.
+IDENTITY = np.identity(4)
+IDENTITY.flags.writeable = False
+
+_IDENTITY_VALUES = [1., 0., 0., 0., 1., 0., 0., 0., 1., 0., 0., 0.]
+
+# Transform attributes of the identity as written by this package and in the
+# shortest form, which are recognized without parsing them
+_IDENTITY_STRING = ' '.join(map(repr, _IDENTITY_VALUES))
+_IDENTITY_STRINGS = frozenset((_IDENTITY_STRING, '1 0 0 0 1 0 0 0 1 0 0 0'))
+# A transform attribute with its 12 values separated by single spaces
+_TWELVE_VALUES = re.compile(r'(?:\S+ ){11}\S+')
+
+# Format of the 12 values of a transform attribute, which are the first three
+# columns of the transposed matrix (3MF uses row vectors)
+# https://github.com/3MFConsortium/spec_core/blob/master/3MF%20Core%20Specification.md#33-3d-matrices
+_TRANSFORM_FORMAT = ' '.join(['%r'] * 12)
+
+
+def _transforms_from_strings(strings) -> list:
+    '''
+    Parses a sequence of transform attributes, which may be None, in one
+    pass. Returns IDENTITY for every missing or identity transform, and a 4x4
+    matrix for every other one; those matrices are views into a single
+    (K, 4, 4) array.
+    '''
+    result = [IDENTITY] * len(strings)
+
+    indices = [i for i, t in enumerate(strings) if t is not None and t not in _IDENTITY_STRINGS]
+    if not indices:
+        return result
+
+    text = [strings[i] for i in indices]
+
+    # Every attribute must have 12 values, or values would shift into the
+    # next matrix. Attributes with single spaces are matched, others split.
+    counted = all(_TWELVE_VALUES.fullmatch(t) is not None or len(t.split()) == 12 for t in text)
+
+    values = _parse_values(' '.join(text))
+
+    if not counted or values is None or len(values) != 12 * len(text):
+        # Raise for the first invalid attribute
+        for t in text:
+            _transform_values(t)
+
+            # float() accepts some values numpy does not, like 1_0
+            parsed = _parse_values(t)
+            if parsed is None or len(parsed) != 12:
+                raise ValueError('Invalid transform values: {}'.format(t))
+
+        raise ValueError('Invalid transform values')
+
+    values = values.reshape(-1, 12)
+
+    transforms = np.zeros((len(text), 4, 4))
+    transforms[:, :3] = values.reshape(-1, 4, 3).transpose(0, 2, 1)
+    transforms[:, 3, 3] = 1.
+
+    identity = (values == _IDENTITY_VALUES).all(axis=1).tolist()
+
+    for i, T, is_identity in zip(indices, transforms, identity):
+        if not is_identity:
+            result[i] = T
+
+    return result
+
+
+def _parse_values(text):
+    '''
+    Returns the whitespace separated numbers of text as an array, or None if
+    numpy cannot parse them. Older numpy versions stop at a value they cannot
+    parse instead, which leaves fewer values.
+    '''
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            return np.fromstring(text, sep=' ')
+    except ValueError:
+        return None
+
+
+def _transform_values(transform) -> typing.List[float]:
+    '''
+    Returns the 12 values of a transform attribute, or raises ValueError
+    '''
+    values = [float(a) for a in transform.split()]
+
+    if len(values) != 12:
+        raise ValueError('Transform needs 12 values, got {}: {}'.format(len(values), transform))
+
+    return values
+
+
+def _transform_strings(transforms) -> typing.List[str]:
+    '''
+    Formats a sequence of 4x4 transforms as transform attributes in one pass.
+    IDENTITY is not formatted at all.
+    '''
+    result = [_IDENTITY_STRING] * len(transforms)
+
+    indices = [i for i, T in enumerate(transforms) if T is not IDENTITY]
+    if not indices:
+        return result
+
+    values = np.array([transforms[i] for i in indices], dtype=np.float64)[:, :3].transpose(0, 2, 1)
+
+    text = ((_TRANSFORM_FORMAT + '\n') * len(indices)) % tuple(values.ravel().tolist())
+
+    for i, t in zip(indices, text.split('\n')):
+        result[i] = t
+
+    return result
 
 
 class BuildItem:
+    __slots__ = ('objectid', 'transform')
+
     def __init__(self, objectid, transform=None):
         self.objectid = objectid
-        self.transform = transform if transform is not None else np.identity(4)
+        self.transform = transform if transform is not None else IDENTITY
 
 
 class Build:
+    __slots__ = ('items', )
+
     def __init__(self):
         self.items = []
 
@@ -27,12 +754,16 @@ class Build:
 
 
 class Component:
+    __slots__ = ('objectid', 'transform')
+
     def __init__(self, objectid, transform):
         self.objectid = objectid
-        self.transform = transform if transform is not None else np.identity(4)
+        self.transform = transform if transform is not None else IDENTITY
 
 
 class Metadata:
+    __slots__ = ('name', 'preserve', 'type', '__value')
+
     def __init__(self, name, value, preserve=True, type='xs:string'):
         self.name = name
         self.preserve = preserve
@@ -55,18 +786,80 @@ class Metadata:
 
 
 class Object:
+    __slots__ = ('id', 'type')
+
     def __init__(self, id, type):
         self.id = id
         self.type = type
 
 
 class ObjectModel(Object):
+    __slots__ = ('_mesh', '_mesh_loader', 'components', '_metadata', '_source_mesh')
+
     def __init__(self, id):
         super().__init__(id, 'model')
 
-        self.mesh = mesh.Mesh()
+        self._mesh = mesh.Mesh()
+        self._mesh_loader = None
         self.components = [] # List[Component]
-        self.metadata = [] # List[Metadata]
+        self.metadata = [] # List[Metadata], indexed by name
+
+        # (index of the mesh element in the source model XML or None, digest
+        # of the mesh as read or None if it is not loaded yet), while the
+        # mesh is the one read from the source
+        self._source_mesh = None
+
+    @property
+    def metadata(self) -> 'List[Metadata]':
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value):
+        self._metadata = _IndexedList(operator.attrgetter('name'), value)
+
+    @property
+    def mesh(self) -> mesh.Mesh:
+        if self._mesh_loader is not None:
+            self._mesh = self._mesh_loader()
+            self._mesh_loader = None
+
+            if self._source_mesh is not None:
+                self._source_mesh = (self._source_mesh[0], self._mesh._fingerprint())
+        return self._mesh
+
+    @mesh.setter
+    def mesh(self, value):
+        self._mesh = value
+        self._mesh_loader = None
+        self._source_mesh = None
+
+    @property
+    def mesh_loaded(self) -> bool:
+        '''
+        False while the mesh of a lazily read object has not been accessed yet
+        '''
+        return self._mesh_loader is None
+
+    def _set_mesh_loader(self, loader):
+        self._mesh = None
+        self._mesh_loader = loader
+
+    def _set_source_mesh(self, index):
+        '''
+        Records the current mesh as the one read from the mesh element at
+        index of the source model XML
+        '''
+        self._source_mesh = (index, self._mesh._fingerprint() if self.mesh_loaded else None)
+
+    def _mesh_unchanged(self) -> bool:
+        '''
+        True if the mesh is still the one read from the source model XML
+        '''
+        if self._source_mesh is None:
+            return False
+        if not self.mesh_loaded:
+            return True
+        return self._mesh._fingerprint() == self._source_mesh[1]
 
     def add_component(self, obj: Object, transform=None):
         self.components.append(
@@ -82,21 +875,54 @@ class ObjectModel(Object):
         self.metadata.append(Metadata(name, value))
 
     def has_meta_data(self, name):
-        return name in [md.name for md in self.metadata]
+        return self.metadata.get(name) is not None
 
     def get_meta_data(self, name):
-        return next(md for md in self.metadata if md.name == name)
+        md = self.metadata.get(name)
+
+        if md is None:
+            # As raised by the linear search this lookup replaced
+            raise StopIteration(name)
+
+        return md
 
 
 class Model:
     def __init__(self, path):
         self.path = path
-        self.objects = []
+        self.objects = [] # List[ObjectModel], indexed by id
         self.build = Build()
         self.unit = 'millimeter'
 
         self._next_object_id = 1
 
+        # The zip member the model was read from, _state() at that time, and
+        # the _MeshSkippingReader.layout() of the source model XML once known.
+        # Used to copy unchanged parts when writing it back.
+        self._source = None
+        self._source_state = None
+        self._source_layout = None
+
+    @property
+    def objects(self) -> 'List[ObjectModel]':
+        return self._objects
+
+    @objects.setter
+    def objects(self, value):
+        self._objects = _IndexedList(operator.attrgetter('id'), value)
+
+    def get_object(self, id) -> ObjectModel:
+        '''
+        Returns the object with the given id. Raises KeyError if there is
+        none.
+        '''
+        obj = self.objects.get(id)
+
+        if obj is None:
+            raise KeyError(id)
+
+        return obj
+
     def object_from_stl_file(self, stl_path):
         mdl = ObjectModel(self._next_object_id)
         mdl.mesh = mesh.Mesh.FromSTLFile(stl_path)
@@ -117,13 +943,31 @@ class Model:
 
         return mdl
 
+    def object_from_mesh(self, object_mesh : mesh.Mesh):
+        mdl = ObjectModel(self._next_object_id)
+        mdl.mesh = object_mesh
+
+        self._next_object_id += 1
+
+        self.objects.append(mdl)
+
+        return mdl
+
+    _NAMESPACES = (
+        ('xmlns', 'http://schemas.microsoft.com/3dmanufacturing/core/2015/02'),
+        ('xmlns:cura', 'http://software.ultimaker.com/xml/cura/3mf/2015/10'),
+        ('xml:lang', 'en-US')
+    )
+
+    # Number of vertex/triangle rows formatted per chunk by write()
+    _WRITE_CHUNK_ROWS = 1 << 16
+
     def serialize(self):
         root = xml.Element('model')
 
         root.set('unit', self.unit)
-        root.set('xmlns', 'http://schemas.microsoft.com/3dmanufacturing/core/2015/02')
-        root.set('xmlns:cura', 'http://software.ultimaker.com/xml/cura/3mf/2015/10')
-        root.set('xml:lang', 'en-US')
+        for name, value in Model._NAMESPACES:
+            root.set(name, value)
 
         resources = xml.Element('resources')
 
@@ -138,6 +982,239 @@ class Model:
 
         return root
 
+    def write(self, f : typing.BinaryIO, executor=None):
+        '''
+        Writes the model XML to the binary file-like object f. The vertex and
+        triangle arrays are formatted in bulk and written in chunks instead of
+        building an element per vertex and triangle, so memory use stays small
+        and write time grows linearly with the mesh size.
+
+        If a concurrent.futures.Executor is given, the objects are formatted
+        concurrently by it and written in their original order.
+
+        Meshes that are unchanged since the model was read from a 3MF are
+        copied from the source model XML instead of being formatted again.
+        '''
+        copied = self._copied_meshes()
+
+        f.write(self._header(self._source_namespaces() if copied else ()))
+
+        dirty = [obj for i, obj in enumerate(self.objects) if i not in copied]
+
+        if executor is None:
+            formatted = (Model._object_chunks(obj) for obj in dirty)
+        else:
+            formatted = ((obj_bytes, ) for obj_bytes in _ordered_map(executor, _object_bytes, dirty))
+
+        with (self._source.zipf.open(self._source.info) if copied else BytesIO()) as src:
+            for i, obj in enumerate(self.objects):
+                if i in copied:
+                    start, end, namespaces = copied[i]
+                    mesh_xml = _read_range(src, start, end)
+
+                    if namespaces:
+                        mesh_xml = _declare_namespaces(mesh_xml, namespaces)
+
+                    chunks = Model._object_chunks(obj, mesh_xml)
+                else:
+                    chunks = next(formatted)
+
+                for chunk in chunks:
+                    f.write(chunk)
+
+        f.write(b'</resources>')
+        f.write(self._build_xml())
+        f.write(b'</model>')
+
+    def _header(self, namespaces=()) -> bytes:
+        attrs = [('unit', self.unit)] + list(Model._NAMESPACES) + list(namespaces)
+
+        return '<?xml version="1.0" encoding="UTF-8"?>\n<model {}><resources>'.format(
+            ' '.join('{}={}'.format(name, quoteattr(value)) for name, value in attrs)
+        ).encode('utf-8')
+
+    @staticmethod
+    def _object_chunks(model : ObjectModel, mesh_xml=None):
+        '''
+        Yields the XML of an object as a sequence of bytes chunks. If given,
+        the bytes chunks of mesh_xml are used as the mesh element.
+        '''
+        if not isinstance(model, ObjectModel):
+            raise Exception('Unsupported object type: {}'.format(model.type))
+
+        yield '<object id={} type={}>'.format(
+            quoteattr(str(model.id)), quoteattr(model.type)
+        ).encode('utf-8')
+
+        if mesh_xml is not None:
+            yield from mesh_xml
+        else:
+            yield b'<mesh><vertices>'
+
+            yield from Model._format_rows('<vertex x="%r" y="%r" z="%r"/>', model.mesh.vertex_array)
+
+            yield b'</vertices><triangles>'
+
+            yield from Model._format_rows('<triangle v1="%d" v2="%d" v3="%d"/>', model.mesh.triangle_array)
+
+            yield b'</triangles></mesh>'
+
+        if model.components:
+            yield b'<components>'
+            yield Model._placements_xml('component', model.components)
+            yield b'</components>'
+
+        metadatagroup = Model._metadatagroup(model)
+        if metadatagroup is not None:
+            yield xml.tostring(metadatagroup, encoding='utf-8')
+
+        yield b'</object>'
+
+    @staticmethod
+    def _placements_xml(tag, placements) -> bytes:
+        '''
+        Returns the XML of a sequence of components or build items as
+        elements with the given tag, with their transforms formatted in one
+        pass and without building an element for each
+        '''
+        transforms = _transform_strings([p.transform for p in placements])
+
+        return ''.join([
+            '<{} objectid={} transform="{}" />'.format(tag, quoteattr(str(p.objectid)), transform)
+            for p, transform in zip(placements, transforms)
+        ]).encode('utf-8')
+
+    def _build_xml(self) -> bytes:
+        return b'<build>' + Model._placements_xml('item', self.build.items) + b'</build>'
+
+    @staticmethod
+    def _format_rows(row_format, arr):
+        # A single %-format over a whole chunk of rows is far faster than
+        # formatting every number or row individually
+        for i in range(0, len(arr), Model._WRITE_CHUNK_ROWS):
+            block = arr[i:i + Model._WRITE_CHUNK_ROWS]
+            yield ((row_format * len(block)) % tuple(block.ravel().tolist())).encode('ascii')
+
+    def _estimated_size(self) -> int:
+        '''
+        Returns a rough upper bound of the size of the written model XML
+        '''
+        size = 0
+
+        for obj in self.objects:
+            if not obj.mesh_loaded and self._source_layout is not None:
+                # Do not load a lazily read mesh just for an estimate
+                start, end = self._source_layout[1][obj._source_mesh[0]]
+                size += end - start + 1024
+            else:
+                size += 100 * len(obj.mesh.vertex_array) + 60 * len(obj.mesh.triangle_array) + 1024
+
+        return size
+
+    def _state(self):
+        '''
+        Returns everything written to the model XML except the mesh contents,
+        to tell whether the model changed since it was read
+        '''
+        return (
+            self.unit,
+            tuple(
+                (
+                    obj.id, obj.type,
+                    obj._source_mesh[0] if obj._source_mesh is not None else None,
+                    tuple((c.objectid, np.asarray(c.transform, dtype=np.float64).tobytes()) for c in obj.components),
+                    tuple((md.name, md.value, str(md.preserve), md.type) for md in obj.metadata)
+                )
+                for obj in self.objects
+            ),
+            tuple(
+                (item.objectid, np.asarray(item.transform, dtype=np.float64).tobytes())
+                for item in self.build.items
+            )
+        )
+
+    def _unchanged(self) -> bool:
+        '''
+        True if the model is still as it was read from its source, so the
+        source model XML can be copied as is
+        '''
+        return (
+            self._source is not None
+            and self._state() == self._source_state
+            and all(obj._mesh_unchanged() for obj in self.objects)
+        )
+
+    def _scan_source(self):
+        with self._source.zipf.open(self._source.info) as f:
+            reader = _MeshSkippingReader(f)
+            while reader.read(_MeshSkippingReader._READ_SIZE):
+                pass
+
+        self._source_layout = reader.layout()
+
+    def _source_namespaces(self):
+        '''
+        Returns the prefixed namespace declarations of the source model XML,
+        which copied meshes may use
+        '''
+        root_start = self._source_layout[0].decode('utf-8')
+        declared = dict(Model._NAMESPACES)
+
+        return [
+            (name, value) for name, value in _NAMESPACE_DECLARATION.findall(root_start)
+            if name.startswith('xmlns:') and name not in declared
+        ]
+
+    def _copied_meshes(self):
+        '''
+        Returns {object index: (start, end, namespaces)} with the byte range in
+        the source model XML of every unchanged mesh that write() copies from
+        there, and the {name: value} namespace declarations that were in scope
+        at it in the source but are not in the written header, which have to
+        be added to its start tag.
+
+        Only objects are written to the resources, so no mesh is copied if the
+        source resources had anything else, such as materials, and meshes with
+        property references are formatted again without them.
+        '''
+        if self._source is None or not self._source.available:
+            return {}
+
+        unchanged = [
+            i for i, obj in enumerate(self.objects)
+            if obj._source_mesh is not None and obj._source_mesh[0] is not None and obj._mesh_unchanged()
+        ]
+
+        if not unchanged:
+            return {}
+
+        if self._source_layout is None:
+            self._scan_source()
+
+        _, ranges, tags, scopes, properties, other_resources = self._source_layout
+
+        if other_resources:
+            return {}
+
+        header = dict(Model._NAMESPACES)
+        header.update(self._source_namespaces())
+
+        copied = {}
+
+        for i in unchanged:
+            index = self.objects[i]._source_mesh[0]
+            scope = scopes[index]
+
+            # Copied meshes must be in the core namespace of the written
+            # model, otherwise they are formatted again
+            if tags[index] != b'mesh' or scope.get('xmlns') != header['xmlns'] or properties[index]:
+                continue
+
+            start, end = ranges[index]
+            copied[i] = (start, end, {name: value for name, value in scope.items() if header.get(name) != value})
+
+        return copied
+
     def _model(self, model: ObjectModel):
         obj = xml.Element('object')
         obj.set('id', str(model.id))
@@ -168,144 +1245,237 @@ class Model:
 
         obj.append(mesh)
 
-        if len(model.components) > 0:
-            components = xml.Element('components')
-            for c in model.components:
-                cm = xml.Element('component')
-                cm.set('objectid', str(c.objectid))
-                cm.set('transform', Model._transform_string(c.transform))
+        for el in (Model._components(model), Model._metadatagroup(model)):
+            if el is not None:
+                obj.append(el)
+
+        return obj
+
+    @staticmethod
+    def _components(model: ObjectModel):
+        if len(model.components) == 0:
+            return None
 
-                components.append(cm)
+        components = xml.Element('components')
+        transforms = _transform_strings([c.transform for c in model.components])
 
-            obj.append(components)
+        for c, transform in zip(model.components, transforms):
+            cm = xml.Element('component')
+            cm.set('objectid', str(c.objectid))
+            cm.set('transform', transform)
 
-        if len(model.metadata) > 0:
-            metadatagroup = xml.Element('metadatagroup')
-            for md in model.metadata:
-                xm = xml.Element('metadata')
-                xm.set('name', md.name)
-                xm.set('preserve', str(md.preserve))
-                xm.set('type', md.type)
-                xm.text = str(md.value)
+            components.append(cm)
 
-                metadatagroup.append(xm)
+        return components
 
-            obj.append(metadatagroup)
+    @staticmethod
+    def _metadatagroup(model: ObjectModel):
+        if len(model.metadata) == 0:
+            return None
 
-        return obj
+        metadatagroup = xml.Element('metadatagroup')
+        for md in model.metadata:
+            xm = xml.Element('metadata')
+            xm.set('name', md.name)
+            xm.set('preserve', str(md.preserve))
+            xm.set('type', md.type)
+            xm.text = str(md.value)
+
+            metadatagroup.append(xm)
+
+        return metadatagroup
 
     def _build(self):
         b = xml.Element('build')
 
-        for item in self.build.items:
-            b.append(self._build_item(item))
+        transforms = _transform_strings([item.transform for item in self.build.items])
 
-        return b
+        for item, transform in zip(self.build.items, transforms):
+            xi = xml.Element('item')
+            xi.set('objectid', str(item.objectid))
+            xi.set('transform', transform)
 
-    def _build_item(self, item):
-        xi = xml.Element('item')
-        xi.set('objectid', str(item.objectid))
-        xi.set('transform', Model._transform_string(item.transform))
+            b.append(xi)
 
-        return xi
+        return b
 
     @staticmethod
     def _transform_string(transform):
-        # Transpose the transformation matrix (3MF uses row-major)
-        # https://github.com/3MFConsortium/spec_core/blob/master/3MF%20Core%20Specification.md#33-3d-matrices
-        flatt = transform.transpose().tolist()
+        return _transform_strings([transform])[0]
+
+    @staticmethod
+    def _transform_from_string(transform):
+        # The transform attribute is optional
+        return _transforms_from_strings([transform])[0]
 
-        # flatt contains a list of rows - loop through the rows and then
-        # the first 3 columns and put into a flattened list
-        comp_strings = [str(c) for row in flatt for c in row[0:3]]
+    def _set_unit(self, unit):
+        self.unit = unit
 
-        # Create the attribute string as a space separated list of the matrix values
-        return ' '.join(comp_strings)
+        if self.unit not in ('millimeter', ):
+            raise Exception('Unsupported unit type in {}: {}'.format(self.path, self.unit))
 
     @staticmethod
-    def _transform_from_string(transform):
-        flatt = [float(a) for a in transform.split()]
+    def _object_from_xml(xobj : xml.Element, transforms=None) -> ObjectModel:
+        '''
+        Creates an ObjectModel with the components and metadata of the
+        given object element. The mesh is left for the caller to fill.
+
+        If transforms is a list, the transforms of the components are not
+        parsed. Instead (component, transform attribute) pairs are appended
+        to it for _set_transforms.
+        '''
+        objtype = xobj.get('type')
+        if not objtype or objtype != 'model':
+            print('Ignoring unknown object type: {}'.format(objtype))
+
+        objid = int(xobj.get('id'))
+
+        obj = ObjectModel(objid)
+
+        for xcs in xobj.findall('components'):
+            for xc in xcs.findall('component'):
+                c = Component(int(xc.get('objectid')), None)
+                obj.components.append(c)
+
+                if transforms is None:
+                    c.transform = Model._transform_from_string(xc.get('transform'))
+                else:
+                    transforms.append((c, xc.get('transform')))
+
+        for xmg in xobj.findall('metadatagroup'):
+            for xmd in xmg.findall('metadata'):
+                obj.metadata.append(
+                    Metadata(
+                        xmd.get('name'),
+                        xmd.text,
+                        xmd.get('preserve', True),
+                        xmd.get('type', 'xs:string')
+                    )
+                )
 
-        flattA = np.array(flatt)
+        return obj
 
-        return np.append(
-            np.reshape(flattA, (4, 3)),
-            np.array([[0., 0., 0., 1.]]).transpose(),
-            axis=1
-        ).transpose()
+    def _build_from_xml(self, xbuild : xml.Element, transforms=None):
+        '''
+        Adds the items of the build element. As for _object_from_xml, their
+        transforms are either parsed or appended to transforms.
+        '''
+        for xbi in xbuild.findall('item'):
+            item = BuildItem(int(xbi.get('objectid')))
+            self.build.items.append(item)
 
-    def deserialize(self, xmlroot : xml.Element):
-        self.unit = xmlroot.get('unit')
+            if transforms is None:
+                item.transform = Model._transform_from_string(xbi.get('transform'))
+            else:
+                transforms.append((item, xbi.get('transform')))
 
-        if self.unit not in ('millimeter', ):
-            raise Exception('Unsupported unit type in {}: {}'.format(self.path, self.unit))
+    @staticmethod
+    def _set_transforms(transforms):
+        '''
+        Parses the transform attributes of the (component or build item,
+        attribute) pairs in one pass and sets them
+        '''
+        parsed = _transforms_from_strings([t for _, t in transforms])
 
-        xres = xmlroot.find('resources')
+        for (owner, _), T in zip(transforms, parsed):
+            owner.transform = T
 
-        for xobj in xres.findall('object'):
-            objtype = xobj.get('type')
-            if not objtype or objtype != 'model':
-                print('Ignoring unknown object type: {}'.format(objtype))
+    def deserialize(self, xmlroot : xml.Element):
+        self._set_unit(xmlroot.get('unit'))
 
-            objid = int(xobj.get('id'))
+        xres = xmlroot.find('resources')
+
+        transforms = []
 
-            obj = ObjectModel(objid)
+        for xobj in xres.findall('object'):
+            obj = Model._object_from_xml(xobj, transforms)
 
             xmesh = xobj.find('mesh')
 
-            if xmesh:
+            if xmesh is not None:
                 xverts = xmesh.find('vertices')
                 xtris = xmesh.find('triangles')
 
-                for xv in xverts.findall('vertex'):
-                    obj.mesh.vertices.append(
-                        mesh.Vertex(
-                            float(xv.get('x')),
-                            float(xv.get('y')),
-                            float(xv.get('z'))
-                        )
-                    )
-
-                for xt in xtris.findall('triangle'):
-                    obj.mesh.triangles.append(
-                        mesh.Triangle(
-                            int(xt.get('v1')),
-                            int(xt.get('v2')),
-                            int(xt.get('v3'))
-                        )
-                    )
-
-            for xcs in xobj.findall('components'):
-                for xc in xcs.findall('component'):
-                    obj.components.append(
-                        Component(
-                            int(xc.get('objectid')),
-                            Model._transform_from_string(xc.get('transform'))
-                        )
-                    )
-
-            for xmg in xobj.findall('metadatagroup'):
-                for xmd in xmg.findall('metadata'):
-                    obj.metadata.append(
-                        Metadata(
-                            xmd.get('name'),
-                            xmd.text,
-                            xmd.get('preserve', True),
-                            xmd.get('type', 'xs:string')
-                        )
-                    )
+                obj.mesh = mesh.Mesh(
+                    np.array(
+                        [(xv.get('x'), xv.get('y'), xv.get('z')) for xv in xverts.findall('vertex')],
+                        dtype=np.float64
+                    ),
+                    np.array(
+                        [(xt.get('v1'), xt.get('v2'), xt.get('v3')) for xt in xtris.findall('triangle')],
+                        dtype=np.int64
+                    ).astype(mesh.TRIANGLE_DTYPES[0])
+                )
 
             self.objects.append(obj)
 
         xbuild = xmlroot.find('build')
 
-        for xbi in xbuild.findall('item'):
-            objectid = int(xbi.get('objectid'))
-            transform = xbi.get('transform')
-
-            self.build.items.append(
-                BuildItem(
-                    objectid,
-                    Model._transform_from_string(transform)
-                )
-            )
+        self._build_from_xml(xbuild, transforms)
+
+        Model._set_transforms(transforms)
+
+    def deserialize_events(self, events, mesh_loader=None):
+        '''
+        Deserializes the model from the (event, element) pairs of an iterparse
+        over the model XML with events=('start', 'end'). Vertices and triangles
+        are collected straight into typed arrays and elements are cleared as soon
+        as they are handled, so the full element tree is never held in memory.
+
+        If mesh_loader is given, the empty mesh elements left by a
+        _MeshSkippingReader are not parsed. Instead it is called with the index
+        of the mesh range in their MESH_RANGE attribute and must return a
+        function that loads that mesh when the object's mesh is first accessed.
+        Mesh elements without that attribute are parsed as usual.
+        '''
+        obj_mesh = None
+        obj_mesh_loader = None
+        obj_mesh_index = None
+        resources = None
+        mesh_index = 0
+
+        # The transforms of all components and build items are parsed at
+        # the end in one pass
+        transforms = []
+
+        for event, el in events:
+            tag = _strip_ns(el.tag)
+
+            if event == 'start':
+                if tag == 'mesh':
+                    skipped = el.get(_MeshSkippingReader.MESH_RANGE) if mesh_loader is not None else None
+
+                    if skipped is not None:
+                        obj_mesh_index = int(skipped)
+                        obj_mesh_loader = mesh_loader(obj_mesh_index)
+                    else:
+                        obj_mesh = _read_mesh(events)
+                        obj_mesh_index = mesh_index if mesh_loader is None else None
+                    mesh_index += 1
+                elif tag == 'resources':
+                    resources = el
+                elif tag == 'model':
+                    self._set_unit(el.get('unit'))
+                continue
+
+            el.tag = tag  # strip all namespaces
+
+            if tag == 'mesh':
+                el.clear()
+            elif tag == 'object':
+                obj = Model._object_from_xml(el, transforms)
+                if obj_mesh is not None:
+                    obj.mesh = obj_mesh
+                elif obj_mesh_loader is not None:
+                    obj._set_mesh_loader(obj_mesh_loader)
+                obj._set_source_mesh(obj_mesh_index)
+                obj_mesh = None
+                obj_mesh_loader = None
+                obj_mesh_index = None
+                self.objects.append(obj)
+                del resources[:]
+            elif tag == 'build':
+                self._build_from_xml(el, transforms)
+                el.clear()
+
+        Model._set_transforms(transforms)
@@ -0,0 +1,207 @@
+'''
+Resolves the build of a model into world-space geometry.
+
+A build item places an object on the plate, and an object can be made of
+components that place other objects inside it, to any depth. A Scene walks
+this graph once per object and records every object with a mesh reachable
+from it together with its transform, so an object used by many components or
+build items is flattened only once and every use is an instance of the same
+mesh with a different transform. Vertices are only transformed when world
+coordinates are asked for, with one matrix product per instance.
+'''
+
+import numpy as np
+
+from . import mesh, ThreeMFException
+
+class Instance:
+    '''
+    A mesh placed in the world: item is the index of the build item it
+    belongs to, objectid the object the mesh is from, and transform the 4x4
+    matrix from the object's coordinates to world coordinates. The mesh is
+    shared with the object, not copied.
+    '''
+
+    __slots__ = ('item', 'objectid', 'mesh', 'transform')
+
+    def __init__(self, item, objectid, mesh, transform):
+        self.item = item
+        self.objectid = objectid
+        self.mesh = mesh
+        self.transform = transform
+
+    def vertices(self) -> 'NDArray[float]':
+        '''
+        Returns the world coordinates of the vertices of the mesh
+        '''
+        return _transformed(self.mesh.vertex_array, self.transform)
+
+class Scene:
+    '''
+    The build items of mdl resolved into mesh instances.
+
+    The objects reachable from each object are flattened on first use and
+    cached, so a Scene is a snapshot: create a new one after changing the
+    objects, components or build of the model.
+    '''
+
+    def __init__(self, mdl : 'model.Model'):
+        self.model = mdl
+
+        # objectid -> (ids of the objects with a mesh reachable from it,
+        # (K, 4, 4) transforms of their meshes into its coordinates)
+        self._flattened = {}
+
+    def _object(self, objectid):
+        try:
+            return self.model.get_object(objectid)
+        except KeyError:
+            raise ThreeMFException('Reference to unknown object {}'.format(objectid)) from None
+
+    @staticmethod
+    def _has_mesh(obj) -> bool:
+        # An object whose mesh has not been read yet has a mesh element, so
+        # do not load it just to check, unless it also has components, which
+        # are written with an empty mesh element
+        if not obj.mesh_loaded and not obj.components:
+            return True
+        return len(obj.mesh.triangle_array) > 0
+
+    def flatten(self, objectid):
+        '''
+        Returns (ids, transforms): the ids of the objects with a mesh that
+        make up the object objectid, including itself if it has a mesh, and
+        the (K, 4, 4) transforms of their meshes into its coordinates.
+
+        Raises ThreeMFException if a component references an unknown object
+        or if the components form a cycle.
+        '''
+        if objectid in self._flattened:
+            return self._flattened[objectid]
+
+        # Depth first, without recursion so deep component chains do not hit
+        # the recursion limit. An object is flattened once all its components
+        # are; objects on the stack are the ones being flattened.
+        stack = [objectid]
+        visiting = set()
+
+        while stack:
+            current = stack[-1]
+
+            if current in self._flattened:
+                stack.pop()
+                continue
+
+            obj = self._object(current)
+
+            pending = [c.objectid for c in obj.components if c.objectid not in self._flattened]
+
+            if pending and current not in visiting:
+                visiting.add(current)
+
+                for child in pending:
+                    if child in visiting:
+                        raise ThreeMFException('Components of object {} form a cycle'.format(child))
+                    stack.append(child)
+
+                continue
+
+            visiting.discard(current)
+            stack.pop()
+
+            self._flattened[current] = self._compose(obj)
+
+        return self._flattened[objectid]
+
+    def _compose(self, obj):
+        ids = []
+        transforms = []
+
+        if Scene._has_mesh(obj):
+            ids.append(np.array([obj.id]))
+            transforms.append(np.identity(4)[np.newaxis])
+
+        for c in obj.components:
+            child_ids, child_transforms = self._flattened[c.objectid]
+
+            ids.append(child_ids)
+            transforms.append(np.asarray(c.transform, dtype=np.float64) @ child_transforms)
+
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, 4, 4))
+
+        return np.concatenate(ids), np.concatenate(transforms)
+
+    def instances(self, item=None) -> 'List[Instance]':
+        '''
+        Returns the mesh instances of all build items in build order, or of
+        the build item at index item
+        '''
+        items = self.model.build.items
+
+        if item is None:
+            indices = range(len(items))
+        else:
+            indices = [range(len(items))[item]]
+
+        result = []
+
+        for i in indices:
+            ids, transforms = self.flatten(items[i].objectid)
+            world = np.asarray(items[i].transform, dtype=np.float64) @ transforms
+
+            for objectid, T in zip(ids.tolist(), world):
+                result.append(Instance(i, objectid, self.model.get_object(objectid).mesh, T))
+
+        return result
+
+    def vertices(self, item=None) -> 'NDArray[float]':
+        '''
+        Returns the world coordinates of the vertices of all instances of
+        the build, or of the build item at index item, as one (N, 3) array in
+        the order of instances()
+        '''
+        return self._merge(self.instances(item))[0]
+
+    def mesh(self, item=None) -> mesh.Mesh:
+        '''
+        Returns one mesh in world coordinates made of all instances of the
+        build, or of the build item at index item. The triangles of mirrored
+        instances are reversed so they keep facing outwards.
+        '''
+        return mesh.Mesh(*self._merge(self.instances(item), triangles=True))
+
+    @staticmethod
+    def _merge(instances, triangles=False):
+        nverts = np.cumsum([0] + [len(inst.mesh.vertex_array) for inst in instances])
+        vertices = np.empty((nverts[-1], 3))
+
+        for inst, start, stop in zip(instances, nverts[:-1], nverts[1:]):
+            _transformed(inst.mesh.vertex_array, inst.transform, out=vertices[start:stop])
+
+        if not triangles:
+            return vertices, None
+
+        ntris = sum(len(inst.mesh.triangle_array) for inst in instances)
+        index_type = np.int32 if nverts[-1] <= np.iinfo(np.int32).max else np.int64
+        tris = np.empty((ntris, 3), dtype=index_type)
+
+        row = 0
+        for inst, start in zip(instances, nverts[:-1]):
+            t = inst.mesh.triangle_array
+
+            if np.linalg.det(inst.transform[:3, :3]) < 0:
+                t = t[:, ::-1]
+
+            np.add(t, start, out=tris[row:row + len(t)], casting='unsafe')
+            row += len(t)
+
+        return vertices, tris
+
+def _transformed(vertices, T, out=None):
+    '''
+    Applies the affine 4x4 transform T to the (N, 3) vertices
+    '''
+    out = np.matmul(vertices, T[:3, :3].T, out=out)
+    out += T[:3, 3]
+    return out
@@ -0,0 +1,451 @@
+'''
+Mesh simplification by quadric error edge collapse.
+
+Every vertex carries the quadric of the planes of the triangles around it,
+weighted by their areas, following Garland and Heckbert, Surface
+Simplification Using Quadric Error Metrics. Collapsing an edge moves its two
+vertices to the point that minimizes the sum of their quadrics, and the error
+of that point is the root mean square distance to the planes.
+
+Instead of collapsing one edge at a time from a priority queue, edges are
+collapsed in rounds. Each round computes the error of every edge, picks the
+edges with the lowest errors that do not share a vertex, drops those that
+would fold the surface over or change its topology, and collapses the rest
+at once, so the work is done with array operations on the whole mesh.
+'''
+
+import numpy as np
+
+# Weight of the quadrics that keep boundary edges in place, relative to the
+# quadrics of the triangles
+_BOUNDARY_WEIGHT = 10.
+
+# Fraction of the edges with the lowest errors that are candidates in each
+# round, so that low error edges everywhere are collapsed before others
+_ROUND_QUANTILE = 0.5
+
+# Number of times the edges whose error is the lowest around both their
+# vertices are picked in each round
+_MATCHING_PASSES = 3
+
+# Ratio of errors below which edges are equally good candidates for a round
+_ERROR_RESOLUTION = 2.
+
+# Collapses that turn the normal of a triangle by more than about 80 degrees
+# are rejected
+_MIN_NORMAL_COS = 0.2
+
+# Row and column of each of the 10 unique coefficients of a symmetric 4x4
+# quadric, as stored in the (10, N) quadric arrays
+_ROWS, _COLS = np.triu_indices(4)
+
+# Points, normals and quadrics are stored as (3, N) and (10, N) arrays, so
+# every coordinate and coefficient is contiguous
+
+def _cross(u, v):
+    return np.stack((u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0]))
+
+def _dot(u, v):
+    return np.einsum('ij,ij->j', u, v)
+
+def _plane_quadrics(normals, points, weights):
+    '''
+    Returns the (10, K) quadrics of the planes through the (3, K) points
+    with the given normals, scaled by weights. Planes with zero normals get
+    zero quadrics.
+    '''
+    lengths = np.sqrt(_dot(normals, normals))
+    valid = lengths > 0
+
+    planes = np.zeros((4, normals.shape[1]))
+    planes[:3, valid] = normals[:, valid] / lengths[valid]
+    planes[3] = -_dot(planes[:3], points)
+
+    return planes[_ROWS] * planes[_COLS] * weights
+
+def _accumulate(indices, values, n):
+    '''
+    Sums the columns of values (K, M) onto the columns of a (K, n) array
+    given by indices
+    '''
+    return np.stack([np.bincount(indices, weights=row, minlength=n) for row in values])
+
+def _edges(T, n, faces=False):
+    '''
+    Returns (a, b, count) for the undirected edges of the triangles T over n
+    vertices: their vertices with a < b and the number of triangles using
+    each. With faces=True, one of those triangles is returned as well.
+    '''
+    first = T.ravel()
+    second = T[:, [1, 2, 0]].ravel()
+
+    keys = np.minimum(first, second) * n + np.maximum(first, second)
+
+    if faces:
+        order = np.argsort(keys)
+        keys = keys[order]
+    else:
+        keys.sort()
+
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    counts = np.diff(np.r_[starts, len(keys)])
+    a, b = np.divmod(keys[starts], n)
+
+    if faces:
+        return a, b, counts, order[starts] // 3
+
+    return a, b, counts
+
+def _quadrics(P, T):
+    '''
+    Returns the (10, N) quadrics and (N, ) weights of the vertices P (3, N)
+    '''
+    n = P.shape[1]
+
+    v0, v1, v2 = P[:, T[:, 0]], P[:, T[:, 1]], P[:, T[:, 2]]
+    normals = _cross(v1 - v0, v2 - v0)
+    areas = 0.5 * np.sqrt(_dot(normals, normals))
+
+    face_quadrics = _plane_quadrics(normals, v0, areas)
+    del v0, v1, v2
+
+    corners = T.ravel()
+    Q = _accumulate(corners, np.repeat(face_quadrics, 3, axis=1), n)
+    W = np.bincount(corners, weights=np.repeat(areas, 3), minlength=n)
+
+    # Boundary edges get the quadric of the plane through them that is
+    # perpendicular to their triangle, so they keep their place
+    a, b, counts, faces = _edges(T, n, faces=True)
+    boundary = counts == 1
+
+    if boundary.any():
+        a, b, faces = a[boundary], b[boundary], faces[boundary]
+
+        direction = P[:, b] - P[:, a]
+        weights = _BOUNDARY_WEIGHT * _dot(direction, direction)
+
+        edge_quadrics = _plane_quadrics(_cross(direction, normals[:, faces]), P[:, a], weights)
+
+        ends = np.concatenate((a, b))
+        Q += _accumulate(ends, np.concatenate((edge_quadrics, edge_quadrics), axis=1), n)
+        W += np.bincount(ends, weights=np.concatenate((weights, weights)), minlength=n)
+
+    return Q, W
+
+def _quadric_cost(q, x):
+    '''
+    Returns x^T A x + 2 b.x + c for the (10, K) quadrics q and (3, K) points x
+    '''
+    x0, x1, x2 = x
+    return (
+        x0 * (q[0] * x0 + 2. * (q[1] * x1 + q[2] * x2 + q[3]))
+        + x1 * (q[4] * x1 + 2. * (q[5] * x2 + q[6]))
+        + x2 * (q[7] * x2 + 2. * q[8])
+        + q[9]
+    )
+
+def _optimal_points(Q, P, a, b):
+    '''
+    Returns the (3, K) points minimizing the quadrics of the edges (a, b) of
+    the vertices P (3, N) and their costs. Where the quadric has no unique minimum close to the edge,
+    the best of the two vertices and the midpoint is used.
+    '''
+    q = Q[:, a] + Q[:, b]
+
+    a00, a01, a02, b0, a11, a12, b1, a22, b2 = q[:9]
+
+    # Solve A x = -b with the adjugate of A
+    c00 = a11 * a22 - a12 * a12
+    c01 = a02 * a12 - a01 * a22
+    c02 = a01 * a12 - a02 * a11
+    c11 = a00 * a22 - a02 * a02
+    c12 = a01 * a02 - a00 * a12
+    c22 = a00 * a11 - a01 * a01
+    det = a00 * c00 + a01 * c01 + a02 * c02
+
+    pa = P[:, a]
+    pb = P[:, b]
+    mid = 0.5 * (pa + pb)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = np.stack((
+            c00 * b0 + c01 * b1 + c02 * b2,
+            c01 * b0 + c11 * b1 + c12 * b2,
+            c02 * b0 + c12 * b1 + c22 * b2
+        ))
+        x /= -det
+
+    # A is positive semi-definite, so a solution is the minimum. It is only
+    # used if A is well conditioned and it is not far from the edge.
+    edge = pb - pa
+    offset = x - mid
+    solved = (
+        (np.abs(det) > 1e-12 * (a00 + a11 + a22) ** 3)
+        & (_dot(offset, offset) <= _dot(edge, edge))
+    )
+
+    cost = np.full(len(a), np.inf)
+    cost[solved] = _quadric_cost(q[:, solved], x[:, solved])
+
+    unsolved = np.flatnonzero(~solved)
+    q = q[:, unsolved]
+
+    for candidate in (pa, pb, mid):
+        candidate = candidate[:, unsolved]
+        c = _quadric_cost(q, candidate)
+        better = c < cost[unsolved]
+        x[:, unsolved[better]] = candidate[:, better]
+        cost[unsolved[better]] = c[better]
+
+    return x, np.maximum(cost, 0.)
+
+def _matching(a, b, errors, n):
+    '''
+    Returns the indices of a set of edges (a, b) without common vertices,
+    preferring low errors: edges whose error is the lowest of all edges
+    around both of their vertices are picked, their neighbours are dropped
+    and the remaining edges are considered again.
+    '''
+    # Errors are compared within a factor of _ERROR_RESOLUTION and ties are
+    # broken by a hash of the edge, so that smoothly varying errors still
+    # have many local minima
+    with np.errstate(divide='ignore'):
+        levels = np.floor(np.log(errors) / np.log(_ERROR_RESOLUTION))
+    tiebreak = (a * 0x9E3779B1 + b * 0x85EBCA77) & 0xFFFFFFFF
+
+    rank = np.empty(len(a), dtype=np.int64)
+    rank[np.lexsort((tiebreak, levels))] = np.arange(len(a))
+
+    alive = np.ones(len(a), dtype=bool)
+    used = np.zeros(n, dtype=bool)
+    picked = []
+
+    for _ in range(_MATCHING_PASSES):
+        idx = np.flatnonzero(alive)
+        if len(idx) == 0:
+            break
+
+        lowest = np.full(n, len(a), dtype=np.int64)
+        np.minimum.at(lowest, a[idx], rank[idx])
+        np.minimum.at(lowest, b[idx], rank[idx])
+
+        won = idx[(lowest[a[idx]] == rank[idx]) & (lowest[b[idx]] == rank[idx])]
+        picked.append(won)
+
+        used[a[won]] = True
+        used[b[won]] = True
+        alive &= ~(used[a] | used[b])
+
+    return np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+
+def _segments(starts, lengths):
+    '''
+    Returns the concatenated ranges [start, start + length) and the index of
+    the range each element comes from
+    '''
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owners
+
+def _keeps_topology(all_a, all_b, a, b, counts, boundary, n):
+    '''
+    Returns a mask of the edges (a, b), used by counts triangles, whose
+    collapse keeps the surface a manifold: the two vertices must have no
+    other common neighbour than the vertices opposite the edge, an interior
+    edge must not join two boundary vertices, and the vertices opposite an
+    interior edge must not form a triangle with each of its vertices. Those
+    two triangles would become the same, as when a closed part is down to a
+    tetrahedron.
+    '''
+    # Neighbours of every vertex from the full edge list
+    src = np.concatenate((all_a, all_b))
+    dst = np.concatenate((all_b, all_a))
+    order = np.argsort(src, kind='stable')
+    dst = dst[order]
+    offsets = np.searchsorted(src[order], np.arange(n + 1))
+
+    ends = np.concatenate((a, b))
+    flat, owners = _segments(offsets[ends], offsets[ends + 1] - offsets[ends])
+    owners %= len(a)
+
+    # A neighbour of both vertices appears twice for the edge
+    keys = owners * n + dst[flat]
+    keys.sort()
+    shared = keys[1:][keys[1:] == keys[:-1]]
+    common = np.bincount(shared // n, minlength=len(a))
+
+    keeps = (common == counts) & ~((counts == 2) & boundary[a] & boundary[b])
+
+    # The common neighbours of an edge are consecutive in shared, for the
+    # interior edges left they are the two opposite vertices
+    interior = np.flatnonzero(keeps & (counts == 2))
+    first = np.searchsorted(shared // n, interior)
+    c, d = shared[first] % n, shared[first + 1] % n
+
+    # Both triangles exist when c and d are neighbours and c has no other
+    # neighbour than them and the vertices of the edge
+    three = offsets[c + 1] - offsets[c] == 3
+    interior, c, d = interior[three], c[three], d[three]
+
+    # The edges from _edges are sorted by a * n + b
+    edge_keys = all_a * n + all_b
+    opposite = np.minimum(c, d) * n + np.maximum(c, d)
+    found = np.minimum(np.searchsorted(edge_keys, opposite), len(edge_keys) - 1)
+    keeps[interior[edge_keys[found] == opposite]] = False
+
+    return keeps
+
+def _reject_flips(P, T, a, b, x, picked):
+    '''
+    Drops from picked the collapses that turn a remaining triangle over,
+    until all the rest can be made together
+    '''
+    n = P.shape[1]
+
+    moved = np.zeros(n, dtype=bool)
+    moved[a[picked]] = True
+    moved[b[picked]] = True
+
+    # Only the triangles around the picked edges can change
+    around = T[moved[T].any(axis=1)]
+
+    mapping = np.arange(n)
+    positions = P.copy()
+
+    while len(picked):
+        ka, kb = a[picked], b[picked]
+
+        mapping[kb] = ka
+        after = mapping[around]
+        mapping[kb] = kb
+
+        remains = (after[:, 0] != after[:, 1]) & (after[:, 1] != after[:, 2]) & (after[:, 2] != after[:, 0])
+
+        positions[:, ka] = x[:, picked]
+
+        before_normals = _normals(P, around[remains])
+        after_normals = _normals(positions, after[remains])
+
+        positions[:, ka] = P[:, ka]
+
+        dots = _dot(before_normals, after_normals)
+        scale = np.sqrt(_dot(before_normals, before_normals) * _dot(after_normals, after_normals))
+        flipped = dots <= _MIN_NORMAL_COS * scale
+
+        if not flipped.any():
+            break
+
+        bad = np.zeros(n, dtype=bool)
+        bad[around[remains][flipped].ravel()] = True
+        picked = picked[~(bad[ka] | bad[kb])]
+
+    return picked
+
+def _normals(P, T):
+    v0 = P[:, T[:, 0]]
+    return _cross(P[:, T[:, 1]] - v0, P[:, T[:, 2]] - v0)
+
+def decimate(vertices, triangles, target=0, max_error=None):
+    '''
+    Collapses edges of the mesh given by vertices (N, 3) and triangles (M, 3)
+    until it has at most target triangles, or no edge can be collapsed with
+    an error of at most max_error, and returns the new (vertices, triangles).
+    Unused vertices are removed.
+    '''
+    P = np.array(np.asarray(vertices).T, dtype=np.float64, order='C')
+    T = np.asarray(triangles, dtype=np.int64)
+
+    n = P.shape[1]
+
+    Q, W = _quadrics(P, T)
+
+    # Edges of the previous round and their optimal points and costs, which
+    # stay valid for the edges away from the last collapses
+    keys = np.empty(0, dtype=np.int64)
+    x = np.empty((3, 0))
+    cost = np.empty(0)
+    moved = np.ones(n, dtype=bool)
+
+    while len(T) > target:
+        all_a, all_b, counts = _edges(T, n)
+
+        # Non-manifold edges are left alone
+        manifold = counts <= 2
+        a, b, counts = all_a[manifold], all_b[manifold], counts[manifold]
+
+        stale = moved[a] | moved[b]
+        kept = np.searchsorted(keys, a[~stale] * n + b[~stale])
+
+        new_x = np.empty((3, len(a)))
+        new_cost = np.empty(len(a))
+        new_x[:, ~stale] = x[:, kept]
+        new_cost[~stale] = cost[kept]
+        new_x[:, stale], new_cost[stale] = _optimal_points(Q, P, a[stale], b[stale])
+
+        keys, x, cost = a * n + b, new_x, new_cost
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            errors = np.sqrt(cost / (W[a] + W[b]))
+
+        candidates = np.isfinite(errors)
+        if max_error is not None:
+            candidates &= errors <= max_error
+
+        if not candidates.any():
+            break
+
+        boundary = np.zeros(n, dtype=bool)
+        boundary[a[counts == 1]] = True
+        boundary[b[counts == 1]] = True
+
+        # Each collapse removes the triangles of its edge
+        needed = -(-(len(T) - target) // 2)
+
+        # Try the lowest errors first and fall back to all candidates if
+        # none of those can be collapsed
+        for quantile in (_ROUND_QUANTILE, 1.):
+            pool = np.flatnonzero(candidates & (errors <= np.quantile(errors[candidates], quantile)))
+
+            matched = pool[_matching(a[pool], b[pool], errors[pool], n)]
+            if len(matched) > needed:
+                matched = matched[np.argsort(errors[matched], kind='stable')[:needed]]
+
+            picked = matched[_keeps_topology(all_a, all_b, a[matched], b[matched], counts[matched], boundary, n)]
+            picked = _reject_flips(P, T, a, b, x, picked)
+
+            # Edges that cannot be collapsed are not tried again until a
+            # vertex around them moves
+            blocked = np.setdiff1d(matched, picked, assume_unique=True)
+            cost[blocked] = np.inf
+            candidates[blocked] = False
+
+            if len(picked) or not candidates.any():
+                break
+
+        if len(picked) == 0:
+            moved[:] = False
+            continue
+
+        ka, kb = a[picked], b[picked]
+
+        P[:, ka] = x[:, picked]
+        Q[:, ka] += Q[:, kb]
+        W[ka] += W[kb]
+
+        mapping = np.arange(n)
+        mapping[kb] = ka
+        T = mapping[T]
+        T = T[(T[:, 0] != T[:, 1]) & (T[:, 1] != T[:, 2]) & (T[:, 2] != T[:, 0])]
+
+        # The costs of the edges around the collapsed ones change, and so do
+        # the topology and flip checks of the edges around those
+        moved[:] = False
+        moved[ka] = True
+        moved[T[moved[T].any(axis=1)].ravel()] = True
+
+    used = np.zeros(n, dtype=bool)
+    used[T.ravel()] = True
+
+    renumber = np.cumsum(used) - 1
+
+    return P[:, used].T, renumber[T]
@@ -0,0 +1,316 @@
+'''
+Interchangeable XML parsers for reading model parts.
+
+Every backend provides iterparse(source, events) with the interface of
+xml.etree.ElementTree.iterparse: it yields (event, element) pairs for the
+start and end events asked for, the elements have the ElementTree API, and
+the iterator has the root element in its root attribute once exhausted.
+
+    expat   xml.parsers.expat driven directly. When a mesh is read from its
+            events, the vertices and triangles are parsed straight into
+            arrays from the parser callbacks, without an element for each.
+    lxml    lxml.etree.iterparse, if lxml is installed.
+    stdlib  xml.etree.ElementTree.iterparse.
+    defusedxml
+            defusedxml.ElementTree.iterparse, if defusedxml is installed,
+            for use_safe_parser(). It is never picked automatically.
+
+3MF model parts have no use for document type declarations, so every
+backend rejects them, and with them all entity declarations and external
+entities, with a ThreeMFException. This rules out entity expansion attacks
+in every backend, whatever the protections of the parser underneath.
+
+get_backend() returns the first available of expat, lxml and stdlib, or the
+backend with the given name.
+'''
+
+import collections
+import xml.etree.ElementTree as ElementTree
+from xml.parsers import expat
+
+from . import ThreeMFException
+
+# Size of the chunks read from the source by the expat backend
+_READ_SIZE = 1 << 16
+
+_DTD_FORBIDDEN = 'Document type declarations are not allowed in 3MF XML'
+
+def _forbid_dtd(*args):
+    raise ThreeMFException(_DTD_FORBIDDEN)
+
+class _NoDoctype:
+    '''
+    A binary file-like object that reads from f and raises ThreeMFException
+    on a document type declaration. What is read is also parsed with expat up
+    to the root element, so the declaration is found in any encoding.
+    '''
+
+    def __init__(self, f):
+        self._f = f
+
+        self._prolog = expat.ParserCreate()
+        self._prolog.StartDoctypeDeclHandler = _forbid_dtd
+        self._prolog.StartElementHandler = self._root
+
+    def _root(self, *args):
+        # No declaration can come after the root element
+        self._prolog.StartElementHandler = None
+        self._prolog = None
+
+    def read(self, n=-1):
+        data = self._f.read(n)
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        prolog = self._prolog
+        if prolog is not None:
+            try:
+                prolog.Parse(data, not data)
+            except expat.ExpatError as e:
+                # Errors after the root element are left to the parser
+                if self._prolog is not None:
+                    raise ElementTree.ParseError(str(e)) from None
+
+        return data
+
+class StdlibBackend:
+    name = 'stdlib'
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def iterparse(self, source, events=('end', )):
+        return ElementTree.iterparse(_NoDoctype(source), events=events)
+
+class LxmlBackend:
+    name = 'lxml'
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import lxml.etree
+        except ImportError:
+            return False
+        return True
+
+    def iterparse(self, source, events=('end', )):
+        import lxml.etree
+
+        return lxml.etree.iterparse(
+            _NoDoctype(source), events=events,
+            resolve_entities=False, load_dtd=False, no_network=True, huge_tree=False
+        )
+
+class DefusedBackend:
+    name = 'defusedxml'
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import defusedxml.ElementTree
+        except ImportError:
+            return False
+        return True
+
+    def iterparse(self, source, events=('end', )):
+        from defusedxml.ElementTree import iterparse
+
+        return iterparse(_NoDoctype(source), events=events, forbid_dtd=True)
+
+class ExpatBackend:
+    name = 'expat'
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    def iterparse(self, source, events=('end', )):
+        return _ExpatEvents(source, events)
+
+class _ExpatEvents:
+    '''
+    The iterator of ExpatBackend.iterparse. It builds ElementTree elements
+    like ElementTree.iterparse, but after read_mesh_into() it fills arrays
+    with the vertices and triangles of the open mesh element instead.
+    '''
+
+    def __init__(self, source, events):
+        self._source = source
+        self._start_events = 'start' in events
+        self._end_events = 'end' in events
+
+        self._names = {}
+        self._stack = []
+        self._events = collections.deque()
+        self._text = []
+        self._last = None
+        self._started = None
+        self._eof = False
+
+        self.root = None
+
+        self._parser = parser = expat.ParserCreate(namespace_separator='}')
+        parser.buffer_text = True
+        parser.StartDoctypeDeclHandler = _forbid_dtd
+        parser.EntityDeclHandler = _forbid_dtd
+        parser.ExternalEntityRefHandler = _forbid_dtd
+        self._element_handlers()
+
+    def _element_handlers(self):
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._text.append
+
+    def _name(self, name):
+        # Expat gives namespaced names as uri}local, ElementTree as {uri}local
+        qualified = self._names.get(name)
+        if qualified is None:
+            qualified = self._names[name] = '{' + name if '}' in name else name
+        return qualified
+
+    def _flush_text(self):
+        if self._text:
+            text = ''.join(self._text)
+            self._text.clear()
+
+            if self._last is not None:
+                self._last.tail = text
+            elif self._stack:
+                self._stack[-1].text = text
+
+    def _start(self, name, attrs):
+        self._flush_text()
+
+        el = ElementTree.Element(self._name(name), {self._name(k): v for k, v in attrs.items()})
+
+        if self._stack:
+            self._stack[-1].append(el)
+        else:
+            self.root = el
+
+        self._stack.append(el)
+        self._last = None
+
+        if self._start_events:
+            self._events.append(('start', el))
+
+    def _end(self, name):
+        self._flush_text()
+
+        el = self._stack.pop()
+        self._last = el
+
+        if self._end_events:
+            self._events.append(('end', el))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self._events:
+            if self._eof:
+                raise StopIteration
+
+            data = self._source.read(_READ_SIZE)
+
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+
+            self._eof = not data
+
+            try:
+                self._parser.Parse(data, self._eof)
+            except expat.ExpatError as e:
+                raise ElementTree.ParseError(str(e)) from None
+
+        event = self._events.popleft()
+
+        if event[0] == 'start':
+            self._started = event[1]
+
+        return event
+
+    def read_mesh_into(self, vertices, triangles):
+        '''
+        Called after the start event of a mesh element. Once the events that
+        were already parsed are consumed, the coordinates of the vertices and
+        the indices of the triangles of the mesh are appended to the arrays
+        vertices and triangles as they are parsed, and no elements or events
+        are produced inside the mesh, up to the end event of the mesh.
+        '''
+        if self._started is None or self._started not in self._stack:
+            # The mesh was already parsed to its end
+            return
+
+        # Elements opened inside the mesh before the switch are still on the
+        # stack and closed from it, the ones opened after it are only counted
+        base = self._stack.index(self._started)
+        depth = 0
+
+        def read(local, attrs):
+            if local == 'vertex':
+                vertices.extend((float(attrs['x']), float(attrs['y']), float(attrs['z'])))
+            elif local == 'triangle':
+                triangles.extend((int(attrs['v1']), int(attrs['v2']), int(attrs['v3'])))
+
+        def start(name, attrs):
+            nonlocal depth
+            depth += 1
+            read(name.rpartition('}')[2], attrs)
+
+        def end(name):
+            nonlocal depth
+
+            if depth > 0:
+                depth -= 1
+                return
+
+            local = name.rpartition('}')[2]
+            if local in ('vertex', 'triangle'):
+                # Read now rather than from its end event, which would come
+                # after the vertices or triangles that follow it
+                read(local, self._stack.pop().attrib)
+                return
+
+            self._end(name)
+
+            if len(self._stack) == base:
+                self._element_handlers()
+
+        self._flush_text()
+        self._parser.StartElementHandler = start
+        self._parser.EndElementHandler = end
+        self._parser.CharacterDataHandler = None
+
+BACKENDS = collections.OrderedDict(
+    (cls.name, cls) for cls in (ExpatBackend, LxmlBackend, StdlibBackend, DefusedBackend)
+)
+
+# Backends in order of preference when none is named. Expat comes first
+# because it reads meshes without creating elements.
+_PREFERENCE = ('expat', 'lxml', 'stdlib')
+
+def available_backends():
+    '''
+    Returns the names of the backends that can be used
+    '''
+    return [name for name, cls in BACKENDS.items() if cls.available()]
+
+def get_backend(name=None):
+    '''
+    Returns an instance of the backend with the given name, or of the
+    preferred available backend. Raises ImportError if the backend needs a
+    module that is not installed.
+    '''
+    if name is None:
+        name = next(n for n in _PREFERENCE if BACKENDS[n].available())
+
+    if name not in BACKENDS:
+        raise ValueError('Unknown XML backend {}, expected one of {}'.format(name, ', '.join(BACKENDS)))
+
+    if not BACKENDS[name].available():
+        raise ImportError('XML backend {} needs a module that is not installed'.format(name))
+
+    return BACKENDS[name]()